@@ -6,14 +6,24 @@
 # これをベースに★を記した部分だけ追加した
 
 import argparse
+import codecs
+import collections
+import concurrent.futures
 import sys
 import glob
 import os
-from typing import List
+import shutil
+import sqlite3
+import tempfile
+import time
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional
 
 # UTF-8のBOM (バイトオーダーマーク): 0xEF, 0xBB, 0xBF
 UTF8_BOM = b'\xef\xbb\xbf'
 
+# ★ファイルを読み込む単位 (大きなファイルでもメモリ使用量が一定になるように)
+CHUNK_SIZE = 1024 * 1024
+
 # ★この関数を追加
 def cp932_length(s):
     # Shift_JISに変換したときのバイト数を返す
@@ -21,84 +31,324 @@ def cp932_length(s):
     return len(s.encode('cp932'))
 
 
-# ★引数に max_arg_length を追加
-def check_and_process_file(filepath: str, action: str, max_arg_length: int):
+# ★この関数を追加
+def find_invalid_utf8(f: BinaryIO) -> Optional[int]:
     """
-    ファイルをチェックし、指定されたアクション（BOM除去/付加）を実行します。
+    ファイルを先頭から少しずつ読み、UTF-8として不正な最初のバイトの位置を返します。
+    UTF-8として妥当な場合は None を返します。
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    offset = 0  # 次に読むチャンクのファイル内の位置
+    while True:
+        chunk = f.read(CHUNK_SIZE)
+        # 前のチャンクの末尾で途中になっている文字は、デコーダー内に残っている
+        pending = len(decoder.getstate()[0])
+        try:
+            decoder.decode(chunk, final=not chunk)
+        except UnicodeDecodeError as e:
+            return offset - pending + e.start
+        if not chunk:
+            return None
+        offset += len(chunk)
+
+
+# ★この関数を追加
+def copy_file_body(src: BinaryIO, dst_fd: int, offset: int):
+    """
+    src の offset 以降をファイル記述子 dst_fd の現在位置に書き出します。
+    可能なら os.copy_file_range / os.sendfile を使い、データを Python に読み込まずにコピーします。
+    """
+    src_fd = src.fileno()
+    remaining = os.fstat(src_fd).st_size - offset
+
+    # Linux: カーネル内でコピー (ファイルシステムによってはデータの複製自体を省略できる)
+    for copy in (getattr(os, 'copy_file_range', None), getattr(os, 'sendfile', None)):
+        if copy is None or remaining <= 0:
+            continue
+        try:
+            while remaining > 0:
+                if copy is os.sendfile:
+                    copied = os.sendfile(dst_fd, src_fd, offset, min(remaining, 1 << 30))
+                else:
+                    copied = os.copy_file_range(src_fd, dst_fd, min(remaining, 1 << 30), offset)
+                if copied == 0:
+                    # 途中で 0 を返すファイルシステム (FUSE など) がある: 続きを次の方法でコピーする
+                    break
+                offset += copied
+                remaining -= copied
+        except OSError:
+            # このファイルシステムでは使えない: 続きを次の方法でコピーする
+            continue
+    if remaining <= 0:
+        return
+
+    # それ以外: チャンクごとに最後まで読み書きする
+    src.seek(offset)
+    while chunk := src.read(CHUNK_SIZE):
+        view = memoryview(chunk)
+        while view:
+            view = view[os.write(dst_fd, view):]
+
+
+# ★この関数を追加
+def rewrite_file(filepath: str, head: bytes, offset: int):
+    """
+    head の後に元のファイルの offset 以降を続けた内容で、ファイルを置き換えます。
+
+    同じフォルダの一時ファイルに書き出してから os.replace() するので、
+    途中で失敗しても元のファイルは壊れません。
+    シンボリックリンクの場合はリンク先のファイルを置き換え、モードと所有者は元のファイルと同じにします。
+    """
+    filepath = os.path.realpath(filepath)
+    dirname, basename = os.path.split(filepath)
+    fd, temp_path = tempfile.mkstemp(prefix=f".{basename}.", suffix='.tmp', dir=dirname)
+    try:
+        with open(filepath, 'rb') as src:
+            st = os.fstat(src.fileno())
+            os.write(fd, head)
+            copy_file_body(src, fd, offset)
+        # コピーが途中で終わった (読んでいる間にファイルが変わったなど) 場合は置き換えない
+        expected = len(head) + st.st_size - offset
+        written = os.fstat(fd).st_size
+        if written != expected:
+            raise IOError(f"コピーしたサイズが合いません ({written} / {expected} バイト)")
+        os.fsync(fd)
+        os.close(fd)
+        fd = -1
+        if hasattr(os, 'chown'):
+            try:
+                os.chown(temp_path, st.st_uid, st.st_gid)
+            except PermissionError:
+                # 他のユーザーのファイルの所有者は管理者でなければ戻せない
+                pass
+        shutil.copymode(filepath, temp_path)
+        os.replace(temp_path, filepath)
+    except BaseException:
+        if fd >= 0:
+            os.close(fd)
+        os.remove(temp_path)
+        raise
+
+
+# ★この型を追加: ファイルのチェック結果
+class CheckResult(NamedTuple):
+    error: Optional[str]  # 読み込みに失敗した場合のエラーメッセージ
+    has_bom: bool  # BOMがあるか
+    invalid_offset: Optional[int]  # UTF-8として不正な最初のバイトの位置 (UTF-8なら None)
+
+
+# ★この関数を追加 (check_and_process_file から読み込み部分を分離し、並列に実行できるようにした)
+def check_file(filepath: str) -> CheckResult:
+    """
+    ファイルを読み込み、BOMの有無とUTF-8として妥当かどうかを調べます。
     """
     try:
-        # 1. ファイルを開き、最初の数バイトを読み込んでエンコーディングをチェック
+        # 1. ファイルを開き、最初の数バイトを読み込んでBOMをチェック
         with open(filepath, 'rb') as f:
-            # BOMチェックのため、少なくともBOMのサイズ（3バイト）を読み込む
-            initial_bytes = f.read(4096)
-            has_bom = initial_bytes.startswith(UTF8_BOM)
-            
-            # ファイル全体を読み直すためにポインタをリセット
+            # BOMチェックのため、BOMのサイズ（3バイト）を読み込む
+            has_bom = f.read(len(UTF8_BOM)) == UTF8_BOM
+
+            # 2. UTF-8エンコーディングの確認 (BOMの有無に関わらず)
+            # ★ファイル全体を読み込まず、チャンクごとに逐次デコードして確認します
+            # 不正なバイトが見つかった時点で読み込みをやめます
             f.seek(0)
-            file_content = f.read()
+            invalid_offset = find_invalid_utf8(f)
 
     except FileNotFoundError:
-        print(f"エラー: ファイルが見つかりません - {filepath}", file=sys.stdout)
-        return
-    except IOError as e:
-        print(f"エラー: ファイルの読み込みに失敗しました - {filepath} ({e})", file=sys.stdout)
-        return
+        return CheckResult(f"エラー: ファイルが見つかりません - {filepath}", False, None)
+    except Exception as e:
+        return CheckResult(f"エラー: ファイルの読み込みに失敗しました - {filepath} ({e})", False, None)
+
+    return CheckResult(None, has_bom, invalid_offset)
+
+
+# ★引数に max_arg_length, result, quiet を追加
+def check_and_process_file(filepath: str, action: str, max_arg_length: int,
+                           result: Optional[CheckResult] = None, quiet: bool = False) -> str:
+    """
+    ファイルをチェックし、指定されたアクション（BOM除去/付加）を実行します。
+    result を渡した場合はファイルを読み直さずにその結果を使います。
+    quiet が True の場合は何も表示しません。
+
+    戻り値は集計用の状態です ('error', 'not_utf8', 'bom', 'no_bom', 'removed', 'added', 'failed')。
+    """
+    out = (lambda *args, **kwargs: None) if quiet else print
+
+    if result is None:
+        result = check_file(filepath)
+    if result.error:
+        out(result.error, file=sys.stdout)
+        return 'error'
+    has_bom = result.has_bom
 
-    # 2. UTF-8エンコーディングの確認 (BOMの有無に関わらず)
-    # デコードを試みることで、UTF-8として妥当かどうかを確認します
-    is_utf8 = False
-    try:
-        # BOM付き/なしの両方を考慮してデコードを試みる
-        file_content.decode('utf-8')
-        is_utf8 = True
-    except UnicodeDecodeError:
-        # UTF-8としてデコードできない場合は、UTF-8ではない
-        is_utf8 = False
-    
-    
     # 3. 結果の表示とアクションの実行
     
-    if not is_utf8:
+    if result.invalid_offset is not None:
         # UTF-8でない場合
         spaces = ' ' * (max_arg_length - cp932_length(filepath) + 1) #★ spacesを追加
-        print(f"{filepath}{spaces}: **UTF-8ではありません**")
-        return
+        out(f"{filepath}{spaces}: **UTF-8ではありません** (位置 {result.invalid_offset})") #★ 不正なバイトの位置を追加
+        return 'not_utf8'
 
     # UTF-8である場合
     bom_status = "BOM付き" if has_bom else "BOMなし"
     spaces = ' ' * (max_arg_length - cp932_length(filepath) + 1) #★ spacesを追加
-    print(f"{filepath}{spaces}: UTF-8, {bom_status}")
+    out(f"{filepath}{spaces}: UTF-8, {bom_status}")
 
     # BOM除去オプション (-d)
     if action == 'remove' and has_bom:
-        print(f"  -> アクション: BOMを除去します...")
+        out(f"  -> アクション: BOMを除去します...")
         try:
-            # BOMを除去したコンテンツ（BOM付きならBOMサイズ以降）
-            new_content = file_content[len(UTF8_BOM):]
-            # ファイルに書き戻す
-            with open(filepath, 'wb') as f:
-                f.write(new_content)
-            print("  -> 成功: BOMが除去されました。")
+            # BOMサイズ以降をコピーした一時ファイルで置き換える
+            rewrite_file(filepath, b'', len(UTF8_BOM))
+            out("  -> 成功: BOMが除去されました。")
+            return 'removed'
         except IOError as e:
-            print(f"  -> エラー: ファイルの書き込みに失敗しました - {e}", file=sys.stdout)
+            out(f"  -> エラー: ファイルの書き込みに失敗しました - {e}", file=sys.stdout)
+            return 'failed'
             
     # BOM付加オプション (-a)
     elif action == 'add' and not has_bom:
-        print(f"  -> アクション: BOMを付加します...")
+        out(f"  -> アクション: BOMを付加します...")
         try:
-            # BOMを先頭に付加したコンテンツ
-            new_content = UTF8_BOM + file_content
-            # ファイルに書き戻す
-            with open(filepath, 'wb') as f:
-                f.write(new_content)
-            print("  -> 成功: BOMが付加されました。")
+            # BOMの後に元のファイル全体をコピーした一時ファイルで置き換える
+            rewrite_file(filepath, UTF8_BOM, 0)
+            out("  -> 成功: BOMが付加されました。")
+            return 'added'
         except IOError as e:
-            print(f"  -> エラー: ファイルの書き込みに失敗しました - {e}", file=sys.stdout)
+            out(f"  -> エラー: ファイルの書き込みに失敗しました - {e}", file=sys.stdout)
+            return 'failed'
             
     # BOM除去/付加のアクションが指定されたが、対象外の状態だった場合
     elif action in ('remove', 'add'):
         status = "既にBOMがありません。" if action == 'remove' else "既にBOMがあります。"
-        print(f"  -> スキップ: {status}")
+        out(f"  -> スキップ: {status}")
+
+    return 'bom' if has_bom else 'no_bom'
+
+
+# ★この関数を追加
+def expand_files(patterns: List[str]) -> List[str]:
+    """
+    ワイルドカード ('**' で再帰) とディレクトリ (配下を再帰) を展開し、ファイルのリストを返します。
+    引数ごとにソートし、重複は除きます。
+    """
+    all_files = []
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            # ディレクトリの場合は配下のファイルをすべて対象にする
+            matches = []
+            for dirpath, dirnames, filenames in os.walk(pattern):
+                matches.extend(os.path.join(dirpath, name) for name in filenames)
+        else:
+            # globを使ってワイルドカードを展開
+            matches = glob.glob(pattern, recursive=True)
+        # ファイル（ディレクトリではないもの）のみを追加
+        for f in sorted(matches):
+            if f not in seen and os.path.isfile(f):
+                seen.add(f)
+                all_files.append(f)
+    return all_files
+
+
+# ★この関数を追加
+def default_cache_path() -> str:
+    """
+    キャッシュファイルのデフォルトのパスを返します (ユーザーのキャッシュフォルダの下)。
+    """
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~/AppData/Local')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'mypytools', 'bom-cache.sqlite3')
+
+
+# ★このクラスを追加
+class ResultCache:
+    """
+    チェック結果のキャッシュ。(パス, サイズ, 更新時刻, inode) が同じファイルは読み直さずに結果を返します。
+    max_entries を超えた分は、最後に使われたのが古いものから削除します。
+    """
+
+    def __init__(self, cache_path: str, max_entries: int):
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        self.max_entries = max_entries
+        self.conn = sqlite3.connect(cache_path)
+        try:
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                ' path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER,'
+                ' has_bom INTEGER, invalid_offset INTEGER, used REAL)'
+            )
+            self.conn.execute('CREATE INDEX IF NOT EXISTS results_used ON results (used)')
+        except sqlite3.DatabaseError:
+            # SQLite のデータベースではないファイルなど
+            self.conn.close()
+            raise
+        self.now = time.time()
+        self.hits: List[str] = []
+
+    @staticmethod
+    def stat_file(filepath: str) -> tuple[str, Optional[os.stat_result]]:
+        path = os.path.abspath(filepath)
+        try:
+            return path, os.stat(path)
+        except OSError:
+            return path, None
+
+    def lookup(self, filepath: str) -> Optional[CheckResult]:
+        """キャッシュにある結果を返します。ファイルが変更されている場合は None を返します。"""
+        path, st = self.stat_file(filepath)
+        if st is None:
+            return None
+        row = self.conn.execute(
+            'SELECT has_bom, invalid_offset FROM results WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?',
+            (path, st.st_size, st.st_mtime_ns, st.st_ino)
+        ).fetchone()
+        if row is None:
+            return None
+        self.hits.append(path)
+        return CheckResult(None, bool(row[0]), row[1])
+
+    def store(self, filepath: str, result: CheckResult, st: Optional[os.stat_result] = None):
+        """
+        結果を保存します。st にはチェックする前に取得したファイルの状態を渡します
+        (チェック中に変更されても、次回は読み直されるように)。
+        """
+        if result.error:
+            return
+        path, current = self.stat_file(filepath)
+        st = st or current
+        if st is None:
+            return
+        self.conn.execute(
+            'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (path, st.st_size, st.st_mtime_ns, st.st_ino, int(result.has_bom), result.invalid_offset, self.now)
+        )
+
+    def close(self):
+        """使われた結果の時刻を更新し、上限を超えた古い結果を削除して閉じます。"""
+        self.conn.executemany('UPDATE results SET used = ? WHERE path = ?', ((self.now, path) for path in self.hits))
+        self.conn.execute(
+            'DELETE FROM results WHERE path IN (SELECT path FROM results ORDER BY used DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+        self.conn.commit()
+        self.conn.close()
+
+
+# ★この関数を追加
+def iter_check_results(all_files: List[str], jobs: int) -> Iterator[CheckResult]:
+    """
+    ファイルを jobs 個のプロセスで並列にチェックし、結果を all_files の順に返します。
+    """
+    if jobs <= 1 or len(all_files) <= 1:
+        yield from map(check_file, all_files)
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        # 小さいファイルが大量にある場合に備えて、ある程度まとめてワーカーに渡す
+        chunksize = max(1, min(256, len(all_files) // (jobs * 4)))
+        yield from executor.map(check_file, all_files, chunksize=chunksize)
 
 
 def main(args: List[str]):
@@ -107,7 +357,7 @@ def main(args: List[str]):
     """
     parser = argparse.ArgumentParser(
         description="UTF-8ファイルのBOM (バイトオーダーマーク) をチェックし、オプションで除去/付加します。",
-        usage='%(prog)s [-d | -a] <file1> [...]'
+        usage='%(prog)s [-d | -a] [-j N] [-s] [-c] [--cache-path PATH] <file1> [...]'
     )
     
     # 排他的なオプショングループ (削除 -d または追加 -a)
@@ -122,12 +372,43 @@ def main(args: List[str]):
         action='store_true',
         help='指定されたUTF-8ファイルにBOMを付加します。'
     )
+
+    # ★並列数と集計のみのオプションを追加
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=1,
+        help='並列にチェックするプロセス数。0 の場合はCPU数 (デフォルト: 1)。'
+    )
+    parser.add_argument(
+        '-s', '--summary',
+        action='store_true',
+        help='ファイルごとの結果を表示せず、集計だけを表示します。'
+    )
+
+    # ★キャッシュのオプションを追加
+    parser.add_argument(
+        '-c', '--cache',
+        action='store_true',
+        help='チェック結果をキャッシュし、変更のないファイルは読み直しません。'
+    )
+    parser.add_argument(
+        '--cache-path',
+        metavar='PATH',
+        help=f'キャッシュファイルのパス。指定すると -c も指定したことになります (デフォルト: {default_cache_path()})。'
+    )
+    parser.add_argument(
+        '--cache-size',
+        type=int,
+        default=200000,
+        help='キャッシュに保存するファイル数の上限。古いものから削除します (デフォルト: 200000)。'
+    )
     
     # 必須のファイル引数（ワイルドカードを想定）
     parser.add_argument(
         'files',
         nargs='+',  # 1つ以上のファイルパスを受け付ける
-        help='処理対象のファイルパス。ワイルドカードが使用可能です (例: "*.txt")。'
+        help='処理対象のファイルパス。ワイルドカード (例: "*.txt", "src/**/*.py") やディレクトリも指定できます。'
     )
     
     # 引数を解析
@@ -140,13 +421,8 @@ def main(args: List[str]):
     elif parsed_args.add_bom:
         action = 'add'
     
-    # ファイルリストをワイルドカード展開して取得
-    all_files = []
-    for pattern in parsed_args.files:
-        # globを使ってワイルドカードを展開
-        matches = glob.glob(pattern)
-        # ファイル（ディレクトリではないもの）のみを追加
-        all_files.extend([f for f in matches if os.path.isfile(f)])
+    # ファイルリストをワイルドカード展開して取得 (★再帰とディレクトリに対応)
+    all_files = expand_files(parsed_args.files)
 
     if not all_files:
         print("ファイルが見つかりませんでした。", file=sys.stdout)
@@ -155,10 +431,51 @@ def main(args: List[str]):
         sys.exit(1)
 
     max_arg_length = max(cp932_length(path) for path in all_files) #★ max_arg_lengthの取得を追加
+    jobs = parsed_args.jobs or os.cpu_count() or 1
+
+    # ★キャッシュにある結果を使い、それ以外のファイルだけをチェックする
+    cache = None
+    if parsed_args.cache or parsed_args.cache_path:
+        cache_path = parsed_args.cache_path or default_cache_path()
+        try:
+            cache = ResultCache(cache_path, parsed_args.cache_size)
+        except (OSError, sqlite3.DatabaseError) as e:
+            print(f"エラー: キャッシュファイルを開けません - {cache_path} ({e})", file=sys.stdout)
+            sys.exit(1)
+    cached = [cache.lookup(path) for path in all_files] if cache else [None] * len(all_files)
+    unchecked = [path for path, result in zip(all_files, cached) if result is None]
+    stats = {path: ResultCache.stat_file(path)[1] for path in unchecked} if cache else {}
+    checked = iter_check_results(unchecked, jobs)
+
+    # 各ファイルを処理 (★チェックは並列に行い、表示とアクションは元の順に行う)
+    counts = collections.Counter()
+    try:
+        for filepath, result in zip(all_files, cached):
+            if result is None:
+                result = next(checked)
+                if cache:
+                    cache.store(filepath, result, stats[filepath])
+            status = check_and_process_file(filepath, action, max_arg_length, result, parsed_args.summary) #★ 引数にmax_arg_lengthを追加
+            counts[status] += 1
+            # BOMを除去/付加した場合は、書き換え後のファイルの結果を保存する
+            if cache and status in ('removed', 'added'):
+                cache.store(filepath, CheckResult(None, status == 'added', None))
+    finally:
+        if cache:
+            cache.close()
 
-    # 各ファイルを処理
-    for filepath in all_files:
-        check_and_process_file(filepath, action, max_arg_length) #★ 引数にmax_arg_lengthを追加
+    # ★集計を表示
+    # 書き込みに失敗したファイルは BOM の有無の集計に含めず、別に数える (合計がファイル数になる)
+    if parsed_args.summary:
+        print(f"ファイル数: {len(all_files)}")
+        print(f"  UTF-8, BOM付き: {counts['bom'] + counts['added']}")
+        print(f"  UTF-8, BOMなし: {counts['no_bom'] + counts['removed']}")
+        print(f"  UTF-8ではない : {counts['not_utf8']}")
+        print(f"  読み込みエラー: {counts['error']}")
+        print(f"  書き込みエラー: {counts['failed']}")
+        if action:
+            print(f"  BOMを除去    : {counts['removed']}")
+            print(f"  BOMを付加    : {counts['added']}")
 
 if __name__ == '__main__':
     # スクリプト名を除いた引数をmain関数に渡す
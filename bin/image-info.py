@@ -1,35 +1,145 @@
-# pip install Pillow
+# lib/imagetools.py を使う (環境変数 PYTHONPATH に lib を登録しておく)
+# PNG, JPEG, GIF, BMP, WebP, TIFF 以外の形式を調べるには Pillow が必要 (pip install Pillow)
+# 似た画像を探す (--duplicates) には Pillow と NumPy が必要 (pip install Pillow numpy)
 
-import glob
+import argparse
+import csv
+import json
 import os
 import sys
-import PIL
-from PIL import Image
+import imagedup
+import imagetools
+import mediacache
 
-def get_image_info(image_path):
-    with Image.open(image_path) as img:
-        return (img.format, img.mode, img.width, img.height)
+# CSV, JSONL の列
+FIELDS = ['path', 'format', 'mode', 'width', 'height']
+DUPLICATE_FIELDS = ['group', 'distance', 'hash', 'path']
+
+
+def make_writer(output_format, fields=FIELDS):
+    """
+    1行分の値 (fields の順) を書き出す関数を返す。
+    table は従来の表形式、csv と jsonl は後の処理で読み込むための形式。
+    """
+    if output_format == 'csv':
+        writer = csv.writer(sys.stdout, lineterminator='\n')
+        writer.writerow(fields)
+        return writer.writerow
+    if output_format == 'jsonl':
+        return lambda values: print(json.dumps(dict(zip(fields, values)), ensure_ascii=False))
+
+    if fields == DUPLICATE_FIELDS:
+        print('group dist hash              image-file')
+        print('----- ---- ----------------  ----------')
+
+        def write_row(values):
+            (group, distance, value, path) = values
+            print(f"{group:5} {distance:4} {value:16}  {path}")
+        return write_row
+
+    print('format mode  width height  image-file')
+    print('------ ----- ----- ------  ----------')
+
+    def write_row(values):
+        (path, fmt, mode, width, height) = values
+        print(f"{fmt:6} {mode:5} {width:5} {height:6}  {path}")
+    return write_row
+
+
+def report_error(error, output_format):
+    if output_format == 'table':
+        print(f"ERROR: {error}")
+    else:
+        # CSV, JSONL の出力には混ぜない
+        print(f"ERROR: {error}", file=sys.stderr)
+
+
+def find_duplicates(paths, cache, args):
+    """
+    画像の知覚ハッシュをプロセスプールで計算し、似た画像のグループを表示する (--duplicates)。
+    ハッシュはキャッシュに保存するので、次回は追加・変更された画像だけを計算する。
+    """
+    def scan(paths):
+        return imagedup.scan_hashes(paths, args.hash, args.jobs)
+
+    hashes = []
+    for path, result in mediacache.scan_with_cache(paths, cache, args.hash, scan, imagedup.ImageHash,
+                                                   imagetools.UnknownFormatError):
+        if isinstance(result, imagetools.UnknownFormatError):
+            continue
+        if isinstance(result, Exception):
+            report_error(f"{path}: {result}", args.format)
+            continue
+        hashes.append((path, result.hash))
+
+    write_row = make_writer(args.format, DUPLICATE_FIELDS)
+    for number, group in enumerate(imagedup.group_duplicates(hashes, args.distance), 1):
+        if number > 1 and args.format == 'table':
+            print()
+        for path, value, distance in group:
+            write_row([number, distance, value, path])
 
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        myname = os.path.basename(__file__)
-        print(f"Usage: {myname} file ...")
-        exit(0)
-    
-    paths = []
-    for arg in sys.argv[1:]:
-        paths.extend(glob.glob(arg))
-    
-    print('format mode  width height  image-file') 
-    print('------ ----- ----- ------  ----------') 
-    
-    for path in paths:
+    parser = argparse.ArgumentParser(
+        description="画像ファイルの 形式, モード, 幅, 高さ を表示する",
+        epilog="例: image-info.py *.jpg\n"
+               "    image-info.py photos -j 32 -f csv > photos.csv  (フォルダの配下をすべて調べる)\n"
+               "    image-info.py \"photos/**/*.png\" -k            (入力の順に表示する)\n"
+               "    image-info.py photos -d -c                     (似た画像をグループごとに表示する)",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('files', nargs='+',
+                        help="画像ファイル。ワイルドカード ('**' で再帰) やフォルダ (配下を再帰) も指定できる")
+    parser.add_argument('-j', '--jobs', type=int, default=8,
+                        help="並列に調べるスレッド数。ネットワーク上のフォルダでは多めにするとよい。デフォルトは 8")
+    parser.add_argument('-k', '--keep-order', action='store_true',
+                        help="終わった順ではなく、入力の順に表示する")
+    parser.add_argument('-f', '--format', choices=['table', 'csv', 'jsonl'], default='table',
+                        help="出力の形式。デフォルトは 'table'")
+    parser.add_argument('-c', '--cache', action='store_true',
+                        help="結果をキャッシュし、変更のないファイルは開かない (video-info.py と共有)")
+    parser.add_argument('--cache-path', metavar='PATH',
+                        help="キャッシュファイル。指定すると -c も指定したことになる。"
+                             f"デフォルトは {mediacache.default_cache_path()}")
+    parser.add_argument('--cache-size', type=int, default=1000000,
+                        help="キャッシュに保存するファイル数の上限。古いものから削除する。デフォルトは 1000000")
+    parser.add_argument('-d', '--duplicates', action='store_true',
+                        help="知覚ハッシュで似た画像 (縮小・再圧縮したものなど) を探し、グループごとに表示する"
+                             " (Pillow と NumPy が必要。-j はプロセス数になる)")
+    parser.add_argument('--hash', choices=imagedup.METHODS, default='dhash',
+                        help="--duplicates で使うハッシュ。デフォルトは 'dhash'")
+    parser.add_argument('--distance', type=int, default=8,
+                        help="--duplicates で同じグループにする、ハッシュの違うビット数 (0-64)。デフォルトは 8")
+    args = parser.parse_args()
+
+    paths = imagetools.iter_files(args.files)
+    cache = None
+    if args.cache or args.cache_path:
         try:
-            (fmt, mode, width, height) = get_image_info(path)
-            print(f"{fmt:6} {mode:5} {width:5} {height:6}  {path}")
-        except PIL.UnidentifiedImageError:
-            # 有効な画像形式でない場合は無視
-            pass
-        except Exception as e:
-            print(f"ERROR: {e}")
+            cache = mediacache.MediaCache(args.cache_path, args.cache_size)
+        except mediacache.CacheError as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            sys.exit(1)
+
+    def scan(paths):
+        return imagetools.scan_images(paths, args.jobs, args.keep_order)
+
+    try:
+        if args.duplicates:
+            find_duplicates(paths, cache, args)
+            sys.exit(0)
+
+        write_row = make_writer(args.format)
+        for path, info in mediacache.scan_with_cache(paths, cache, 'image', scan, imagetools.ImageInfo,
+                                                     imagetools.UnknownFormatError, args.keep_order):
+            if isinstance(info, imagetools.UnknownFormatError):
+                # 有効な画像形式でない場合は無視
+                continue
+            if isinstance(info, Exception):
+                report_error(info, args.format)
+                continue
+            write_row([path, *info])
+    finally:
+        if cache:
+            cache.close()
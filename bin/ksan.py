@@ -1,13 +1,465 @@
-import sys
+# ksan.py 簡易計算機
+#   ksan.py 計算式        計算式を評価して表示する (例: ksan.py "(1 + 2) * 3",  ksan.py "cos(pi) + math.sqrt(2)")
+#   ksan.py               1行に1つずつ計算式を読んで評価する (対話モード。パイプからの入力も読める)
+#                         "r = 2" のように変数に代入でき、後の行で使える。_ は直前の結果
+#   ksan.py 計算式 x=0:10:0.5 [y=1:3] [--csv]
+#                         変数の範囲 (開始:終了:刻み。終了を含む) の各値で計算式を評価し、表 (または CSV) にする
+#                         変数が複数あればすべての組み合わせ。x=- は標準入力の値 (1行に1つ) を使う
+#                         NumPy の配列でまとめて計算する (pip install numpy)
+#
+# 計算式は構文木を調べ、数値の演算と math の関数 (math. を付けても付けなくてもよい) だけを許す。
+# 整数の大きさ (MAX_INT_BITS) と、リストなどの繰り返し・連結の長さ (MAX_ITEMS) には上限がある。
+# 一度コンパイルした計算式はキャッシュし、同じ式をコンパイルし直さない。
+
+import ast
+import functools
 import math
+import numbers
+import re
+import sys
+import types
+
+# 許す構文木の要素
+ALLOWED_NODES = (
+    ast.Expression, ast.Module, ast.Assign, ast.AugAssign,
+    ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp, ast.Call, ast.keyword,
+    ast.Constant, ast.Name, ast.Attribute, ast.Tuple, ast.List, ast.Load, ast.Store,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+    ast.LShift, ast.RShift, ast.BitAnd, ast.BitOr, ast.BitXor,
+    ast.UAdd, ast.USub, ast.Not, ast.Invert, ast.And, ast.Or,
+    ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+)
+
+# 整数の計算の結果の上限 (ビット数)。9 ** 9 ** 9 のような計算で止まらないようにする
+MAX_INT_BITS = 1000000
+
+# リスト, タプル, 文字列の繰り返し・連結の結果の長さの上限。[1] * 10 ** 9 のような計算でメモリを使い切らないようにする
+MAX_ITEMS = 1000000
+
+# sum, prod で整数の足し算・掛け算を繰り返す手間の上限 (要素の数 × ビット数)
+MAX_WORK_BITS = 10 ** 10
+
+# 繰り返し・連結できる並び
+SEQUENCES = (list, tuple, str)
+
+# コンパイルした計算式をキャッシュする数
+CACHE_SIZE = 256
+
+# 変数の範囲の指定 (x=0:10:0.5 または標準入力の x=-)
+SWEEP_PATTERN = re.compile(r'^([A-Za-z_][A-Za-z0-9_]*)=(-|[^:=]*:[^:=]*(?::[^:=]*)?)$')
+
+# 表の列の幅
+TABLE_WIDTH = 18
+
+# 一度に文字列にして書く行数
+OUTPUT_CHUNK = 100000
+
+
+class CalcError(Exception):
+    pass
+
+
+def _power(base, exponent):
+    if isinstance(base, int) and isinstance(exponent, int) and abs(base) > 1 and exponent > 0:
+        if exponent * math.log2(abs(base)) > MAX_INT_BITS:
+            raise CalcError("数が大きすぎます")
+    return base ** exponent
+
+
+def _shift(value, count):
+    if isinstance(value, int) and isinstance(count, int) and (count > MAX_INT_BITS or
+                                                              value.bit_length() + count > MAX_INT_BITS):
+        raise CalcError("数が大きすぎます")
+    return value << count
+
+
+def _multiply(left, right):
+    if isinstance(left, int) and isinstance(right, int):
+        if left.bit_length() + right.bit_length() > MAX_INT_BITS:
+            raise CalcError("数が大きすぎます")
+    else:
+        # 並びと整数の積は繰り返し
+        for items, count in ((left, right), (right, left)):
+            if isinstance(items, SEQUENCES) and isinstance(count, numbers.Integral) and len(items) * count > MAX_ITEMS:
+                raise CalcError("リストなどが長すぎます")
+    return left * right
+
+
+def _add(left, right):
+    # 並びどうしの和は連結
+    if isinstance(left, SEQUENCES) and isinstance(right, SEQUENCES) and len(left) + len(right) > MAX_ITEMS:
+        raise CalcError("リストなどが長すぎます")
+    return left + right
+
+
+def _pow(base, exponent, modulo=None):
+    # 剰余を指定した pow は結果が modulo より小さいので、大きさを確かめない
+    return _power(base, exponent) if modulo is None else pow(base, exponent, modulo)
+
+
+def _bounded(func, log_result):
+    """
+    結果の大きさ (自然対数) が MAX_INT_BITS を超える整数の計算 (factorial(10 ** 7) など) は CalcError にする。
+    引数が不正な場合は func 自身のエラーに任せる
+    """
+    @functools.wraps(func)
+    def call(*args):
+        if all(isinstance(arg, int) for arg in args):
+            try:
+                too_large = log_result(*args) / math.log(2) > MAX_INT_BITS
+            except (ValueError, OverflowError):
+                too_large = False
+            if too_large:
+                raise CalcError("数が大きすぎます")
+        return func(*args)
+    return call
+
+
+def _prod(values, *, start=1):
+    """math.prod と同じ。結果の大きさと、掛け算を繰り返す手間を確かめる"""
+    values = list(values)
+    bits = sum(math.log2(abs(value)) for value in [start, *values] if isinstance(value, int) and abs(value) > 1)
+    if bits > MAX_INT_BITS or len(values) * bits > MAX_WORK_BITS:
+        raise CalcError("数が大きすぎます")
+    result = start
+    for value in values:
+        result = _multiply(result, value)
+    return result
+
+
+def _sum(values, start=0):
+    """sum と同じ。並びの連結には使わせず、足し算を繰り返す手間を確かめる"""
+    if isinstance(start, SEQUENCES):
+        raise CalcError("sum で足せるのは数だけです")
+    values = list(values)
+    bits = max((value.bit_length() for value in [start, *values] if isinstance(value, int)), default=0)
+    if len(values) * bits > MAX_WORK_BITS:
+        raise CalcError("数が大きすぎます")
+    return sum(values, start)
+
+
+# math の関数と定数 (結果がいくらでも大きくなる整数の関数は大きさを確かめる)
+MATH_FUNCTIONS = {name: getattr(math, name) for name in dir(math) if not name.startswith('_')}
+MATH_FUNCTIONS.update({
+    'factorial': _bounded(math.factorial, lambda n: math.lgamma(n + 1)),
+    'comb': _bounded(math.comb, lambda n, k: math.lgamma(n + 1) - math.lgamma(k + 1) - math.lgamma(n - k + 1)),
+    'perm': _bounded(math.perm, lambda n, k=None: math.lgamma(n + 1) - math.lgamma(n - (n if k is None else k) + 1)),
+    'lcm': _bounded(math.lcm, lambda *args: sum(math.log(abs(arg)) for arg in args if arg)),
+    'prod': _prod,
+})
+
+# 計算式で使える関数と定数。math. を付けた場合も同じ関数を使う
+FUNCTIONS = dict(MATH_FUNCTIONS)
+FUNCTIONS.update({
+    'math': types.SimpleNamespace(**MATH_FUNCTIONS),
+    'abs': abs, 'round': round, 'min': min, 'max': max, 'sum': _sum,
+    'int': int, 'float': float, 'complex': complex, 'bool': bool,
+    'divmod': divmod, 'pow': _pow, 'bin': bin, 'oct': oct, 'hex': hex,
+})
+
+
+class _Checker(ast.NodeTransformer):
+    """
+    許していない要素があれば CalcError を出す。べき乗, シフト, 掛け算, 足し算は大きさを確かめる関数の呼び出しに置き換える。
+    計算式が読む名前を names に集める
+    """
+
+    def __init__(self):
+        self.names = set()
+
+    def generic_visit(self, node):
+        if not isinstance(node, ALLOWED_NODES):
+            raise CalcError(f"使えない構文です: {type(node).__name__}")
+        return super().generic_visit(node)
+
+    def visit_Constant(self, node):
+        if type(node.value) not in (int, float, complex, bool):
+            raise CalcError(f"使えない値です: {node.value!r}")
+        return node
+
+    def visit_Name(self, node):
+        # _ (直前の結果) 以外の _ で始まる名前は、べき乗などを置き換えた内部の関数のために空けておく
+        if node.id.startswith('_') and node.id != '_':
+            raise CalcError(f"使えない名前です: {node.id}")
+        if isinstance(node.ctx, ast.Load):
+            self.names.add(node.id)
+        return node
+
+    def visit_Attribute(self, node):
+        # math.cos のような math の関数と定数だけ
+        if not (isinstance(node.value, ast.Name) and node.value.id == 'math' and node.attr in MATH_FUNCTIONS):
+            raise CalcError(f"使えない属性です: {node.attr}")
+        return node
 
-if len(sys.argv) < 2:
-    print('Usage: ksan.py 計算式')
+    def visit_Assign(self, node):
+        if not all(isinstance(target, ast.Name) for target in node.targets):
+            raise CalcError("代入できるのは変数だけです")
+        for target in node.targets:
+            if target.id in FUNCTIONS or (target.id.startswith('_') and target.id != '_'):
+                raise CalcError(f"この名前には代入できません: {target.id}")
+        return self.generic_visit(node)
 
-else:
+    def visit_AugAssign(self, node):
+        if not isinstance(node.target, ast.Name):
+            raise CalcError("代入できるのは変数だけです")
+        # x **= y は x = x ** y にして、べき乗の大きさを確かめる
+        value = ast.BinOp(ast.Name(node.target.id, ast.Load()), node.op, node.value)
+        return self.visit(ast.copy_location(ast.Assign([node.target], value), node))
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        for op, func in ((ast.Pow, '_power'), (ast.LShift, '_shift'), (ast.Mult, '_multiply'), (ast.Add, '_add')):
+            if isinstance(node.op, op):
+                call = ast.Call(ast.Name(func, ast.Load()), [node.left, node.right], [])
+                return ast.copy_location(call, node)
+        return node
+
+
+class _Vectorizer(ast.NodeTransformer):
+    """配列で計算できるように、条件式, and, or, not, 連続した比較を NumPy の関数の呼び出しに置き換える"""
+
+    @staticmethod
+    def _call(func, args, node):
+        return ast.copy_location(ast.Call(ast.Name(func, ast.Load()), args, []), node)
+
+    def visit_IfExp(self, node):
+        self.generic_visit(node)
+        return self._call('_where', [node.test, node.body, node.orelse], node)
+
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        func = '_and' if isinstance(node.op, ast.And) else '_or'
+        result = node.values[0]
+        for value in node.values[1:]:
+            result = self._call(func, [result, value], node)
+        return result
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            return self._call('_not', [node.operand], node)
+        return node
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        # a < b < c は (a < b) and (b < c)
+        left = node.left
+        result = None
+        for op, right in zip(node.ops, node.comparators):
+            compare = ast.copy_location(ast.Compare(left, [op], [right]), node)
+            result = compare if result is None else self._call('_and', [result, compare], node)
+            left = right
+        return result
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def compile_line(line, vectorized=False):
+    """
+    1行の計算式 (または "変数 = 計算式") を調べてコンパイルし、(コードオブジェクト, 代入か, 読む名前) を返す。
+    vectorized が真なら、NumPy の配列で計算できるように条件式などを置き換える。
+    使えない構文は CalcError、文法の誤りは SyntaxError を出す。
+    """
     try:
-        exp = ' '.join(map(str, sys.argv[1:]))
-        print(eval(exp))
+        tree = ast.parse(line, mode='eval')
+        assignment = False
+    except SyntaxError:
+        tree = ast.parse(line, mode='exec')
+        if len(tree.body) != 1 or not isinstance(tree.body[0], (ast.Assign, ast.AugAssign)):
+            raise
+        assignment = True
+    checker = _Checker()
+    tree = checker.visit(tree)
+    if vectorized:
+        tree = _Vectorizer().visit(tree)
+    tree = ast.fix_missing_locations(tree)
+    return compile(tree, '<ksan>', 'exec' if assignment else 'eval'), assignment, frozenset(checker.names)
+
+
+def check_names(names, *namespaces):
+    """計算式が読む名前が、使える関数・定数か変数であることを確かめる"""
+    for name in sorted(names):
+        if not any(name in namespace for namespace in namespaces):
+            raise CalcError(f"名前が定義されていません: {name}")
+
+
+class Calculator:
+    """変数を保持して1行ずつ計算する"""
+
+    def __init__(self):
+        self.globals = dict(FUNCTIONS, __builtins__={}, _power=_power, _shift=_shift, _multiply=_multiply, _add=_add)
+        self.variables = {}
+
+    def run(self, line):
+        """line を評価して結果を返す。代入の場合は None を返す"""
+        code, assignment, names = compile_line(line.strip())
+        check_names(names, self.globals, self.variables)
+        if assignment:
+            eval(code, self.globals, self.variables)
+            return None
+        value = eval(code, self.globals, self.variables)
+        self.variables['_'] = value
+        return value
+
+
+def _integral(func):
+    # 範囲の値は float なので、factorial のように整数が必要な関数には整数の値を int にして渡す
+    def call(*args):
+        return func(*(int(arg) if isinstance(arg, float) and arg.is_integer() else arg for arg in args))
+    return call
+
+
+def numpy_functions(np):
+    """math の関数と定数を NumPy の同じ働きの関数 (ないものは np.vectorize) にした、配列用の名前の辞書を返す"""
+    renames = {'asin': 'arcsin', 'acos': 'arccos', 'atan': 'arctan', 'atan2': 'arctan2',
+               'asinh': 'arcsinh', 'acosh': 'arccosh', 'atanh': 'arctanh', 'pow': 'power'}
+    functions = {}
+    for name, value in MATH_FUNCTIONS.items():
+        if callable(value):
+            # NumPy の gcd, lcm は整数の配列しか受け付けない
+            ufunc = None if name in ('gcd', 'lcm') else getattr(np, renames.get(name, name), None)
+            value = ufunc if isinstance(ufunc, np.ufunc) else np.vectorize(_integral(value))
+        functions[name] = value
+    # math.log は2つ目の引数に底を指定できる
+    functions['log'] = lambda x, base=None: np.log(x) if base is None else np.log(x) / np.log(base)
+    # prod は配列のリストを要素ごとに掛ける
+    functions['prod'] = _prod
+
+    def power(base, exponent):
+        # 整数どうしは Python の整数で計算する (np.power の int64 はあふれる)
+        if isinstance(base, int) and isinstance(exponent, int):
+            return _power(base, exponent)
+        return np.power(base, exponent)
+
+    def shift(value, count):
+        # 範囲の値は float なので、整数の値だけ int64 にしてシフトする
+        if isinstance(value, int) and isinstance(count, int):
+            return _shift(value, count)
+        value, count = np.asarray(value), np.asarray(count)
+        if np.any(value % 1) or np.any(count % 1):
+            raise CalcError("シフトできるのは整数だけです")
+        return np.left_shift(value.astype(np.int64), count.astype(np.int64))
+
+    # 組み込み関数は使わせない (__builtins__ がないと eval が本来の組み込み関数を入れる)
+    names = dict(functions, __builtins__={}, math=types.SimpleNamespace(**functions))
+    names.update({
+        'abs': np.abs, 'round': np.round, 'sum': _sum, 'pow': np.power, 'divmod': np.divmod,
+        'min': lambda *values: functools.reduce(np.minimum, values),
+        'max': lambda *values: functools.reduce(np.maximum, values),
+        'int': np.trunc, 'float': lambda x: np.asarray(x, dtype=float),
+        '_power': power, '_shift': shift, '_multiply': _multiply, '_add': _add,
+        '_where': np.where, '_and': np.logical_and, '_or': np.logical_or, '_not': np.logical_not,
+    })
+    return names
+
+
+def sweep_values(np, calculator, spec):
+    """開始:終了:刻み (終了を含む。刻みは省略すると 1) の値の配列を返す。値には計算式も使える"""
+    if spec == '-':
+        return np.array(sys.stdin.read().replace(',', ' ').split(), dtype=float)
+    parts = [calculator.run(part) for part in spec.split(':')]
+    start, stop = parts[0], parts[1]
+    step = parts[2] if len(parts) > 2 else 1
+    if not step or (stop - start) / step < 0:
+        raise CalcError(f"範囲が不正です: {spec}")
+    # 刻みの丸め誤差で終了の値が落ちないように、少しだけ余裕を見る
+    count = math.floor((stop - start) / step * (1 + 1e-12) + 1e-9) + 1
+    return start + step * np.arange(count, dtype=float)
+
+
+def sweep(calculator, expression, sweeps, csv_output):
+    """sweeps の変数の範囲のすべての組み合わせで expression を評価し、表または CSV で表示する"""
+    try:
+        import numpy as np
+    except ImportError:
+        raise CalcError("範囲の計算には NumPy が必要です (pip install numpy)")
+
+    names = [name for name, _ in sweeps]
+    axes = [sweep_values(np, calculator, spec) for _, spec in sweeps]
+    columns = [grid.ravel() for grid in np.meshgrid(*axes, indexing='ij')]
+
+    code, assignment, used = compile_line(expression.strip(), vectorized=True)
+    if assignment:
+        raise CalcError("範囲の計算では代入は使えません")
+    functions = numpy_functions(np)
+    variables = dict(zip(names, columns))
+    check_names(used, functions, variables)
+    with np.errstate(all='ignore'):
+        result = eval(code, functions, variables)
+    result = np.broadcast_to(np.asarray(result), columns[0].shape)
+    if result.dtype == bool:
+        result = result.astype(int)
+
+    columns.append(result)
+    if csv_output:
+        print(','.join(names + ['value']))
+        formats = ['%.17g'] * len(columns)
+        separator = ','
+    else:
+        print(' '.join(f"{name:>{TABLE_WIDTH}}" for name in names + ['value']))
+        print(' '.join(['-' * TABLE_WIDTH] * len(columns)))
+        formats = [f'%{TABLE_WIDTH}.12g'] * len(columns)
+        separator = ' '
+    if np.iscomplexobj(result):
+        formats[-1] = '%s'
+    write_rows(columns, separator.join(formats))
+
+
+def write_rows(columns, fmt):
+    # np.savetxt は1行ずつ Python で書くので遅い。まとめて文字列にして書く
+    for start in range(0, len(columns[0]), OUTPUT_CHUNK):
+        rows = zip(*[column[start:start + OUTPUT_CHUNK].tolist() for column in columns])
+        sys.stdout.write('\n'.join(map(fmt.__mod__, rows)) + '\n')
+
+
+def error_message(e):
+    if isinstance(e, MemoryError):
+        return "メモリが足りません"
+    return str(e) or type(e).__name__
+
+
+def repl(calculator, interactive):
+    if interactive:
+        try:
+            # 入力の履歴と編集 (Windows にはない)
+            import readline
+        except ImportError:
+            pass
+    while True:
+        try:
+            line = input('> ' if interactive else '')
+        except EOFError:
+            break
+        except KeyboardInterrupt:
+            print()
+            continue
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        if interactive and line.strip() in ('exit', 'quit'):
+            break
+        try:
+            value = calculator.run(line)
+            if value is not None:
+                print(value, flush=not interactive)
+        except Exception as e:
+            print(f"ERROR: {error_message(e)}", flush=not interactive)
+
+
+if __name__ == '__main__':
+    calculator = Calculator()
+    if len(sys.argv) < 2:
+        repl(calculator, sys.stdin.isatty())
+    else:
+        try:
+            args = sys.argv[1:]
+            csv_output = '--csv' in args
+            sweeps = [SWEEP_PATTERN.match(arg).groups() for arg in args if SWEEP_PATTERN.match(arg)]
+            exp = ' '.join(arg for arg in args if arg != '--csv' and not SWEEP_PATTERN.match(arg))
+            if sweeps:
+                sweep(calculator, exp, sweeps, csv_output)
+            else:
+                value = calculator.run(exp)
+                if value is not None:
+                    print(value)
 
-    except Exception as e:
-        print(f"ERROR: {e}")
+        except Exception as e:
+            print(f"ERROR: {error_message(e)}")
@@ -1,20 +1,37 @@
-# pip install opencv-python
+# pip install opencv-python (MP4/MOV, Matroska/WebM, AVI 以外の形式を調べるのに使う)
+# lib/mediacache.py, lib/videotools.py を使う (環境変数 PYTHONPATH に lib を登録しておく)
+# シグネチャで動画か画像かを決められないファイルを調べるのに Pillow を使う (pip install Pillow)
 
+import argparse
 import glob
 import os
 import sys
-import cv2
 import math
-from PIL import Image
+import mediacache
+import videotools
 
 class BadFormatError(Exception):
     pass
-    
+
 
 def get_video_info(video_path):
-    if is_image_file(video_path):
+    # 先頭のシグネチャで決まる画像は開かない。決まらないファイルだけ Pillow で画像かどうかを調べる
+    kind = videotools.sniff_kind(video_path)
+    if kind == videotools.IMAGE or (kind is None and is_image_file(video_path)):
         raise BadFormatError()
-        
+
+    # MP4/MOV, Matroska/WebM, AVI はヘッダーを直接読む。読めないものだけ OpenCV で開く
+    if kind == videotools.VIDEO:
+        info = videotools.read_video_info(video_path)
+        if info is not None:
+            # キャッシュに保存する値 (mediacache.KINDS['video'] の順)
+            return (info.width, info.height, round(info.fps, 1), info.frames, info.duration)
+    return get_video_info_cv2(video_path)
+
+
+def get_video_info_cv2(video_path):
+    import cv2
+
     cap = cv2.VideoCapture(video_path)
 
     if not cap.isOpened():
@@ -24,14 +41,20 @@ def get_video_info(video_path):
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     fps    = round(cap.get(cv2.CAP_PROP_FPS), 1)
     frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    time   = get_time_string(frames / fps)
+    duration = frames / fps
 
     cap.release()
-    
-    return (width, height, fps, frames, time)
+
+    # キャッシュに保存する値 (mediacache.KINDS['video'] の順)
+    return (width, height, fps, frames, duration)
 
 
 def is_image_file(path):
+    try:
+        from PIL import Image
+    except ImportError:
+        # Pillow がなければ OpenCV に任せる
+        return False
     try:
         with Image.open(path) as img:
             return True
@@ -46,24 +69,53 @@ def get_time_string(seconds):
 
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        myname = os.path.basename(__file__)
-        print(f"Usage: {myname} file ...")
-        exit(0)
-    
+    parser = argparse.ArgumentParser(description="動画の 幅, 高さ, FPS, フレーム数, 視聴時間 を表示する")
+    parser.add_argument('files', nargs='+', help="動画ファイル (ワイルドカードも指定できる)")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help=f"並列に調べるプロセス数。デフォルトは CPU の数 ({os.cpu_count()})")
+    parser.add_argument('-t', '--timeout', type=float, default=60,
+                        help="1ファイルを調べる時間の上限 (秒)。超えたファイルはエラーにし、そのプロセスを作り直す。"
+                             "デフォルトは 60")
+    parser.add_argument('-c', '--cache', action='store_true',
+                        help="結果をキャッシュし、変更のないファイルは開かない (image-info.py と共有)")
+    parser.add_argument('--cache-path', metavar='PATH',
+                        help="キャッシュファイル。指定すると -c も指定したことになる。"
+                             f"デフォルトは {mediacache.default_cache_path()}")
+    parser.add_argument('--cache-size', type=int, default=1000000,
+                        help="キャッシュに保存するファイル数の上限。古いものから削除する。デフォルトは 1000000")
+    args = parser.parse_args()
+
     paths = []
-    for arg in sys.argv[1:]:
+    for arg in args.files:
         paths.extend(glob.glob(arg))
-    
-    print('width height  fps frames time   video-file') 
-    print('----- ----- ----- ------ -----  ----------') 
-    
-    for path in paths:
+
+    cache = None
+    if args.cache or args.cache_path:
         try:
-            (width, height, fps, frames, time) = get_video_info(path)
-            print(f"{width:5} {height:5} {fps:5} {frames:6} {time:5}  {path}")
-        except BadFormatError:
-            # 有効な動画形式でない
-            print(f"////////// not video /////////  {path}")
-        except Exception as e:
-            print(f"ERROR: {e}")
+            cache = mediacache.MediaCache(args.cache_path, args.cache_size)
+        except mediacache.CacheError as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            sys.exit(1)
+
+    print('width height  fps frames time   video-file')
+    print('----- ----- ----- ------ -----  ----------')
+
+    def scan_videos(paths):
+        # キャッシュにないファイルを複数のプロセスで調べ、入力の順に (パス, 情報または例外) を返す
+        return videotools.scan_videos(paths, get_video_info, args.jobs, args.timeout, ordered=True)
+
+    try:
+        for path, info in mediacache.scan_with_cache(paths, cache, 'video', scan_videos, lambda *values: values,
+                                                     BadFormatError, ordered=True):
+            if isinstance(info, BadFormatError):
+                # 有効な動画形式でない
+                print(f"////////// not video /////////  {path}")
+            elif isinstance(info, Exception):
+                print(f"ERROR: {info}")
+            else:
+                (width, height, fps, frames, duration) = info
+                time = get_time_string(duration)
+                print(f"{width:5} {height:5} {fps:5} {frames:6} {time:5}  {path}")
+    finally:
+        if cache:
+            cache.close()
@@ -1,21 +1,24 @@
-# pip install numpy scipy
+# lib/wavtools.py を使う (環境変数 PYTHONPATH に lib を登録しておく)
 
 import argparse
+import csv
+import os
 import sys
-import numpy as np
-from scipy.io import wavfile
+import wavtools
 
-# 1フレームあたりのミリ秒数 (1/30秒)
-FRAME_MS = 1000 / 30
 
-def cut_wav_file_scipy(input_path: str, output_path: str, start: int, end: int, unit: str):
+def cut_wav_file(input_path: str, output_path: str, start: int, end: int, unit: str):
     """
-    scipy.io.wavfile を使用してWAVファイルを切り出す関数。
+    WAVファイルを切り出す関数。
+
+    ヘッダーだけを解析し、指定範囲のデータだけを読み込んで書き出すので、
+    長いファイルから短い範囲を切り出すときも、必要な分しか読み込まない。
+    出力は以前の scipy.io.wavfile を使った実装と同じバイト列になる。
+    入力・出力に '-' を指定すると、標準入力から読み、標準出力に書き出す。
     """
     try:
-        # 1. WAVファイルの読み込み
-        # rate: サンプリング周波数 (Hz), data: 音声データ (NumPy配列)
-        rate, data = wavfile.read(input_path)
+        # 1. WAVファイルのヘッダーの読み込み
+        src = sys.stdin.buffer if input_path == '-' else open(input_path, 'rb')
     except FileNotFoundError:
         print(f"エラー: 入力ファイルが見つかりません - {input_path}")
         sys.exit(1)
@@ -23,73 +26,165 @@ def cut_wav_file_scipy(input_path: str, output_path: str, start: int, end: int,
         print(f"エラー: WAVファイルの読み込みに失敗しました - {e}")
         sys.exit(1)
 
-    # 音声データの総サンプル数
-    total_samples = len(data)
-    # 音声データの長さ (ミリ秒)
-    total_ms = int(total_samples / rate * 1000)
-
-    # 2. 範囲の計算 (サンプルインデックスに変換)
-    start_sample = 0
-    end_sample = total_samples 
-
-    if unit == 'ms':
-        # ミリ秒をサンプル数に変換: sample = ms * rate / 1000
-        start_sample = int(start * rate / 1000)
-        end_sample = int(end * rate / 1000)
-    elif unit == 'frame':
-        # フレーム数をミリ秒に変換し、それをサンプル数に変換
-        start_ms = start * FRAME_MS
-        end_ms = end * FRAME_MS
-        start_sample = int(start_ms * rate / 1000)
-        end_sample = int(end_ms * rate / 1000)
-    
-    # endが0の場合はファイルの最後までと見なす
-    if end == 0 and unit in ('ms', 'frame'):
-        end_sample = total_samples
+    with src:
+        try:
+            info = wavtools.read_wav_header(src)
+        except Exception as e:
+            print(f"エラー: WAVファイルの読み込みに失敗しました - {e}")
+            sys.exit(1)
 
-    # 3. 範囲のバリデーション
-    if start_sample < 0 or start_sample >= total_samples:
-        print(f"エラー: 開始位置が音声ファイルの範囲外です。")
-        sys.exit(1)
+        # 2. 範囲の計算とバリデーション (サンプルインデックスに変換)
+        try:
+            start_sample, end_sample = wavtools.compute_cut_range(info, start, end, unit)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+
+        # 3. ファイルの書き出し (この範囲のデータだけを読み込む)
+        try:
+            copied = wavtools.write_segment(src, info, output_path, start_sample, end_sample)
+            print_cut_result(wavtools.CutResult(info, start_sample, start_sample + copied, output_path))
+        except ValueError as e:
+            # 標準入力が開始位置より前で終わった場合
+            print(e)
+            sys.exit(1)
+        except BrokenPipeError as e:
+            if output_path != '-':
+                print(f"エラー: ファイルの書き出しに失敗しました - {e}")
+                sys.exit(1)
+            # パイプの後のコマンドが読むのをやめた (head など) のはエラーにしない
+            wavtools.discard_stdout()
+            sys.exit(0)
+        except Exception as e:
+            print(f"エラー: ファイルの書き出しに失敗しました - {e}")
+            sys.exit(1)
+
+
+def print_cut_result(result: wavtools.CutResult):
+    rate = result.info.rate
+    print(f"切り出しが完了しました: {result.output}")
+    print(f"   サンプリングレート: {rate} Hz")
+    print(f"   開始サンプル: {result.start_sample}, 終了サンプル: {result.end_sample}")
+    print(f"   期間: {(result.end_sample - result.start_sample) / rate * 1000:.0f} ms")
+
+
+def read_cue_list(cue_path: str) -> list[tuple[int, int, str]]:
+    """
+    キューリスト (CSV) を読み込む。1行に「開始,終了,出力ファイル」を書く。
+    '#' で始まる行と、数値で始まらない見出し行は無視する。
+    """
+    segments = []
+    with open(cue_path, newline='', encoding='utf-8-sig') as f:
+        for row in csv.reader(f):
+            if not row or row[0].lstrip().startswith('#'):
+                continue
+            try:
+                start, end = int(row[0]), int(row[1])
+            except (ValueError, IndexError):
+                continue
+            if len(row) < 3 or not row[2].strip():
+                raise ValueError(f"出力ファイルが指定されていません: {','.join(row)}")
+            segments.append((start, end, row[2].strip()))
+    return segments
+
+
+def cut_wav_segments(input_path: str, segments: list[tuple[int, int, str]], unit: str, jobs: int = 1) -> int:
+    """
+    1つのWAVファイルから複数の範囲を切り出す関数。
+
+    入力は1回だけ開き、開始位置の順に並べた範囲を先頭から順に書き出すので、
+    処理時間は入力の長さではなく出力の合計サイズに比例する。
+    jobs が2以上の場合は、その数のスレッドで並列に書き出す。
+
+    :return: 失敗した範囲の数
+    """
+    try:
+        results = wavtools.cut_segments(input_path, segments, unit, jobs)
+    except FileNotFoundError:
+        print(f"エラー: 入力ファイルが見つかりません - {input_path}")
+        return len(segments)
+    except Exception as e:
+        print(f"エラー: WAVファイルの読み込みに失敗しました - {e}")
+        return len(segments)
+
+    failures = 0
+    for (start, end, output_path), result in zip(segments, results):
+        if isinstance(result, ValueError):
+            print(f"{result} ({start}, {end}, {output_path})")
+            failures += 1
+        elif isinstance(result, Exception):
+            print(f"エラー: ファイルの書き出しに失敗しました - {output_path} ({result})")
+            failures += 1
+        else:
+            print_cut_result(result)
+    return failures
 
-    if end_sample < start_sample:
-        print(f"エラー: 終了位置が開始位置より前です。")
-        sys.exit(1)
-    
-    # 終了位置が総サンプル数を超えている場合は、総サンプル数に丸める
-    if end_sample > total_samples:
-        end_sample = total_samples
-    
-    # 4. NumPyのスライス機能で音声データを切り出し
-    cut_data = data[start_sample:end_sample]
 
-    # 5. ファイルの書き出し
+def analyze_wav_file(input_path: str, args) -> wavtools.Analysis:
+    """
+    WAVファイルをブロックごとに解析し、音のある区間を求める関数 (--analyze, --trim, --split 用)。
+    メモリに置くのは1ブロック分だけなので、数時間のファイルでも使える。
+    """
     try:
-        # wavfile.write()でNumPy配列をWAVファイルとして書き込む
-        wavfile.write(output_path, rate, cut_data)
-        
-        print(f"切り出しが完了しました: {output_path}")
-        print(f"   サンプリングレート: {rate} Hz")
-        print(f"   開始サンプル: {start_sample}, 終了サンプル: {end_sample}")
-        print(f"   期間: {(end_sample - start_sample) / rate * 1000:.0f} ms")
+        return wavtools.analyze(input_path, threshold_db=args.threshold, window_ms=args.window,
+                                min_silence_ms=args.min_silence, min_sound_ms=args.min_sound,
+                                pad_ms=args.pad, level=args.level)
+    except FileNotFoundError:
+        print(f"エラー: 入力ファイルが見つかりません - {input_path}")
+        sys.exit(1)
     except Exception as e:
-        print(f"エラー: ファイルの書き出しに失敗しました - {e}")
+        print(f"エラー: WAVファイルの解析に失敗しました - {e}")
         sys.exit(1)
 
 
+def region_outputs(base_path: str, count: int) -> list[str]:
+    """区間ごとの出力ファイル名 (base_path に _001, _002, ... を付けたもの)"""
+    stem, ext = os.path.splitext(base_path)
+    return [f"{stem}_{n:03d}{ext or '.wav'}" for n in range(1, count + 1)]
+
+
+def print_analysis(analysis: wavtools.Analysis, base_path: str, unit: str):
+    """
+    解析結果を表示する。区間は「開始,終了,出力ファイル」のキューリストとして出力し、
+    それ以外の行は '#' で始めるので、そのまま保存して --cue に渡せる。
+    開始は切り捨て、終了は切り上げて unit に変換する。
+    """
+    info = analysis.info
+    total = info.total_samples
+    regions = analysis.regions
+    rate = info.rate
+    print(f"# サンプリングレート: {rate} Hz, 長さ: {total / rate * 1000:.0f} ms ({total} サンプル)")
+    print(f"# ピーク: {analysis.peak_db:.1f} dBFS, RMS: {analysis.rms_db:.1f} dBFS")
+    if not regions:
+        print("# 音のある区間は見つかりませんでした。")
+        return
+    print(f"# 先頭の無音: {regions[0][0] / rate * 1000:.0f} ms, "
+          f"末尾の無音: {(total - regions[-1][1]) / rate * 1000:.0f} ms, 区間: {len(regions)}")
+    for (start, end), output in zip(regions, region_outputs(base_path, len(regions))):
+        print(f"{wavtools.from_samples(start, unit, rate)},"
+              f"{wavtools.from_samples(end, unit, rate, round_up=True)},{output}")
+
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(
         description="WAVファイルをミリ秒またはフレーム単位で切り出すツール",
-        epilog="例: wav_cutter.py input.wav output.wav -s 1000 -e 5000 -u ms"
+        epilog="例: wav_cutter.py input.wav output.wav -s 1000 -e 5000 -u ms\n"
+               "    wav_cutter.py input.wav --cue cues.csv -u frame  (cues.csv の各行: 開始,終了,出力ファイル)\n"
+               "    wav_cutter.py input.wav --analyze > cues.csv     (音のある区間をキューリストとして表示)\n"
+               "    wav_cutter.py input.wav output.wav --trim        (先頭と末尾の無音を取り除く)\n"
+               "    wav_cutter.py input.wav part.wav --split         (音のある区間ごとに part_001.wav, ... に切り出す)\n"
+               "    wav-delay.py in.wav - --ms 500 | wav_cutter.py - out.wav -s 0 -e 3000  (- は標準入力・標準出力)",
+        formatter_class=argparse.RawDescriptionHelpFormatter
     )
     
     # 必須の引数
-    parser.add_argument("input_file", help="入力WAVファイルのパス")
-    parser.add_argument("output_file", help="出力WAVファイルのパス")
+    parser.add_argument("input_file", help="入力WAVファイルのパス ('-' は標準入力)")
+    parser.add_argument("output_file", nargs='?',
+                        help="出力WAVファイルのパス ('-' は標準出力。--cue を使う場合は不要)")
 
     # 範囲指定の引数
-    parser.add_argument("-s", "--start", type=int, required=True,
+    parser.add_argument("-s", "--start", type=int,
                         help="切り出しを開始する位置（ミリ秒またはフレーム）")
     parser.add_argument("-e", "--end", type=int, default=0,
                         help="切り出しを終了する位置（ミリ秒またはフレーム）。0の場合はファイルの最後まで。")
@@ -98,10 +193,82 @@ if __name__ == "__main__":
     parser.add_argument("-u", "--unit", choices=['ms', 'frame'], default='ms',
                         help="範囲指定の単位 ('ms': ミリ秒, 'frame': 1/30秒フレーム)。デフォルトは 'ms'")
 
+    # キューリストの引数
+    parser.add_argument("-c", "--cue",
+                        help="複数の範囲を一度に切り出すキューリスト (CSV: 開始,終了,出力ファイル)")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="キューリストの範囲を並列に書き出すスレッド数。デフォルトは 1")
+
+    # 無音の解析の引数
+    parser.add_argument("-a", "--analyze", action='store_true',
+                        help="音量を解析し、音のある区間をキューリストとして表示する (-u の単位)")
+    parser.add_argument("-t", "--trim", action='store_true',
+                        help="先頭と末尾の無音を取り除いて出力ファイルに書き出す")
+    parser.add_argument("--split", action='store_true',
+                        help="音のある区間ごとに、出力ファイル名に _001, _002, ... を付けて書き出す")
+    parser.add_argument("--threshold", type=float, default=-45.0,
+                        help="音があるとみなす音量 (dBFS)。デフォルトは -45")
+    parser.add_argument("--level", choices=['rms', 'peak'], default='rms',
+                        help="判定に使う窓ごとの音量。デフォルトは 'rms'")
+    parser.add_argument("--window", type=int, default=10,
+                        help="音量を計算する窓の長さ (ミリ秒)。デフォルトは 10")
+    parser.add_argument("--min-silence", type=int, default=300,
+                        help="区間を分ける無音の最小の長さ (ミリ秒)。デフォルトは 300")
+    parser.add_argument("--min-sound", type=int, default=100,
+                        help="これより短い音のある区間は無視する (ミリ秒)。デフォルトは 100")
+    parser.add_argument("--pad", type=int, default=50,
+                        help="区間の前後に残す余白 (ミリ秒)。デフォルトは 50")
+
     args = parser.parse_args()
 
+    if args.output_file == '-':
+        # WAVデータを標準出力に書き出すので、メッセージは標準エラー出力に出す
+        sys.stdout = sys.stderr
+
+    if args.input_file == '-' and (args.cue or args.trim or args.split):
+        # 標準入力は1回しか読めないので、解析してから切り出すことや、複数の範囲の切り出しはできない
+        parser.error("--cue, --trim, --split には標準入力 ('-') を使えません。")
+
+    if args.analyze:
+        analysis = analyze_wav_file(args.input_file, args)
+        base_path = args.output_file or args.input_file
+        print_analysis(analysis, 'stdin.wav' if base_path == '-' else base_path, args.unit)
+        sys.exit(0)
+
+    if args.trim or args.split:
+        if args.output_file is None:
+            parser.error("--trim, --split には出力ファイルを指定してください。")
+        analysis = analyze_wav_file(args.input_file, args)
+        regions = analysis.regions
+        if not regions:
+            print("エラー: 音のある区間が見つかりませんでした。")
+            sys.exit(1)
+        if args.trim:
+            # 最初の区間の開始から最後の区間の終了までを切り出す
+            segments = [(regions[0][0], regions[-1][1], args.output_file)]
+        else:
+            outputs = region_outputs(args.output_file, len(regions))
+            segments = [(start, end, output) for (start, end), output in zip(regions, outputs)]
+        if cut_wav_segments(args.input_file, segments, 'sample', args.jobs):
+            sys.exit(1)
+        sys.exit(0)
+
+    if args.cue:
+        # 複数の範囲を一度に切り出す
+        try:
+            segments = read_cue_list(args.cue)
+        except Exception as e:
+            print(f"エラー: キューリストの読み込みに失敗しました - {e}")
+            sys.exit(1)
+        if cut_wav_segments(args.input_file, segments, args.unit, args.jobs):
+            sys.exit(1)
+        sys.exit(0)
+
+    if args.output_file is None or args.start is None:
+        parser.error("出力ファイルと -s/--start を指定するか、--cue を指定してください。")
+
     # メイン処理の実行
-    cut_wav_file_scipy(
+    cut_wav_file(
         input_path=args.input_file,
         output_path=args.output_file,
         start=args.start,
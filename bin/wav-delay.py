@@ -1,77 +1,71 @@
-# pip install numpy scipy
+# lib/wavtools.py を使う (環境変数 PYTHONPATH に lib を登録しておく)
 
-import numpy as np
-from scipy.io import wavfile
 import argparse
 import os
 import sys
+import wavtools
 
 # フレームレートの定義（1/30秒フレームの場合）
-FRAME_RATE_FOR_OPTION = 30 
+FRAME_RATE_FOR_OPTION = wavtools.FRAME_RATE
 
 def add_silence_to_wav(input_filepath, output_filepath, length, unit):
     """
     WAVファイルの先頭に指定した長さの無音部分を挿入し、新しいファイルとして保存する。
 
-    :param input_filepath: 入力WAVファイルのパス
-    :param output_filepath: 出力WAVファイルのパス
+    ヘッダーを書き、無音をブロック単位で書き、元のデータをそのままコピーするので、
+    ファイル全体をメモリに読み込まない (メモリより大きなファイルも扱える)。
+
+    :param input_filepath: 入力WAVファイルのパス ('-' は標準入力)
+    :param output_filepath: 出力WAVファイルのパス ('-' は標準出力)
     :param length: 無音部分の長さ（単位によってミリ秒またはフレーム）
     :param unit: 長さの単位 ('ms' または 'frame')
     :raises FileNotFoundError: 入力ファイルが存在しない場合
     :raises Exception: WAVファイルの読み書きエラーなど
     """
     
-    if not os.path.exists(input_filepath):
+    if input_filepath != '-' and not os.path.exists(input_filepath):
         raise FileNotFoundError(f"エラー: 入力ファイルが見つかりません: {input_filepath}")
 
     print(f"入力ファイル: {input_filepath}")
-    
+
+    # 標準入力は1回しか読めないので、ヘッダーを読んだ入力をそのまま書き出しに使う
+    with wavtools.open_stream(input_filepath, 'rb') as src:
+        _add_silence(src, input_filepath, output_filepath, length, unit)
+
+
+def _add_silence(src, input_filepath, output_filepath, length, unit):
     try:
-        # WAVファイルの読み込み
+        # WAVファイルのヘッダーの読み込み
         # rate: サンプリングレート (Hz)
-        # data: 音声データ (NumPy配列)
-        rate, data = wavfile.read(input_filepath)
+        info = wavtools.read_wav_header(src)
+        rate = info.rate
     except Exception as e:
         raise Exception(f"エラー: WAVファイルの読み込みに失敗しました: {e}")
 
-    # サンプル数（データポイント数）を計算
+    # サンプル数（データポイント数）を計算 (不正な単位は ValueError)
+    silence_samples = wavtools.to_samples(length, unit, rate)
     if unit == 'ms':
-        # ミリ秒 (ms) からサンプル数を計算: rate (サンプル/秒) * length (ms) / 1000 (ms/秒)
-        silence_samples = int(rate * length / 1000)
         print(f"無音の長さ: {length} ミリ秒 -> {silence_samples} サンプル")
-    elif unit == 'frame':
-        # フレーム (1/30秒) からサンプル数を計算: rate (サンプル/秒) * length (フレーム) / FRAME_RATE_FOR_OPTION (フレーム/秒)
-        silence_samples = int(rate * length / FRAME_RATE_FOR_OPTION)
-        print(f"無音の長さ: {length} フレーム (1/{FRAME_RATE_FOR_OPTION}秒) -> {silence_samples} サンプル")
     else:
-        # このエラーはargparseで防がれるが、念のため
-        raise ValueError(f"エラー: 不正な単位 '{unit}' が指定されました。'ms' または 'frame' を使用してください。")
+        print(f"無音の長さ: {length} フレーム (1/{FRAME_RATE_FOR_OPTION}秒) -> {silence_samples} サンプル")
 
     if silence_samples <= 0:
-        print("警告: 指定された長さが無効またはゼロです。処理をスキップします。")
-        # 元ファイルをコピーする処理なども考えられるが、ここでは単に終了とする
-        return
-
-    # データタイプ (dtype) とチャンネル数を取得
-    dtype = data.dtype
-    if data.ndim == 1:
-        # モノラル
-        channels = 1
-        # 無音データを生成 (dtypeを合わせることが重要)
-        silence_data = np.zeros(silence_samples, dtype=dtype)
-    else:
-        # ステレオまたはマルチチャンネル
-        channels = data.shape[1]
-        # 無音データを生成 (形状を (サンプル数, チャンネル数) に合わせる)
-        silence_data = np.zeros((silence_samples, channels), dtype=dtype)
-
-    # 無音データと元の音声データを結合
-    new_data = np.concatenate((silence_data, data))
+        if output_filepath != '-':
+            print("警告: 指定された長さが無効またはゼロです。処理をスキップします。")
+            # 元ファイルをコピーする処理なども考えられるが、ここでは単に終了とする
+            return
+        # パイプの途中では後のコマンドが入力を待っているので、無音なしでそのまま流す
+        print("警告: 指定された長さが無効またはゼロです。無音を挿入せずに出力します。")
+        silence_samples = 0
 
     try:
         # 新しいWAVファイルとして保存
-        wavfile.write(output_filepath, rate, new_data)
+        # (無音の分だけ長くしたヘッダー、無音、元の音声データの順に書き出す)
+        wavtools.write_delayed(src, info, output_filepath, silence_samples)
         print(f"成功: 無音を挿入したファイルを保存しました: {output_filepath}")
+    except BrokenPipeError:
+        # 標準出力の先のコマンドが終わった: 呼び出し元で正常に終える
+        raise
     except Exception as e:
         raise Exception(f"エラー: WAVファイルの書き出しに失敗しました: {e}")
 
@@ -87,12 +81,12 @@ if __name__ == '__main__':
     parser.add_argument(
         'input_file',
         type=str,
-        help="入力WAVファイルのパス（例: input.wav）"
+        help="入力WAVファイルのパス（例: input.wav、'-' は標準入力）"
     )
     parser.add_argument(
         'output_file',
         type=str,
-        help="出力WAVファイルのパス（例: output.wav）"
+        help="出力WAVファイルのパス（例: output.wav、'-' は標準出力）"
     )
     
     # 無音の長さを指定するグループ（--ms または --frame のどちらか必須）
@@ -110,6 +104,10 @@ if __name__ == '__main__':
 
     args = parser.parse_args()
 
+    if args.output_file == '-':
+        # WAVデータを標準出力に書き出すので、メッセージは標準エラー出力に出す
+        sys.stdout = sys.stderr
+
     # 単位と長さを決定
     if args.ms is not None:
         length = args.ms
@@ -123,6 +121,13 @@ if __name__ == '__main__':
         
     try:
         add_silence_to_wav(args.input_file, args.output_file, length, unit)
+    except BrokenPipeError as e:
+        if args.output_file != '-':
+            print(f"エラー: WAVファイルの書き出しに失敗しました: {e}", file=sys.stderr)
+            sys.exit(1)
+        # パイプの後のコマンドが読むのをやめた (head など) のはエラーにしない
+        wavtools.discard_stdout()
+        sys.exit(0)
     except (FileNotFoundError, ValueError, Exception) as e:
         print(e, file=sys.stderr)
         sys.exit(1)
@@ -1,26 +1,133 @@
 # pip install send2trash
+# 指定したファイルをゴミ箱に移動し、同じ名前の 0 バイトのファイルを作る (モードと所有者は元のファイルと同じにする)
 
-import sys
-import os
+import argparse
+import collections
+import concurrent.futures
 import glob
-from send2trash import send2trash
+import os
+import sys
+import time
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: wipe.py <file1> ...")
-        exit(0)
+# 1回の send2trash に渡すファイル数の上限
+BATCH_SIZE = 1000
 
-    for pattern in sys.argv[1:]:
-        for file_path in glob.glob(pattern):
-            if os.path.isdir(file_path):
+
+def find_files(patterns):
+    """パターン ('**' で再帰) に合うファイルを、フォルダごとに {フォルダ: [パス, ...]} で返す (フォルダ自体は含めない)"""
+    folders = collections.defaultdict(list)
+    seen = set()
+    for pattern in patterns:
+        for path in glob.iglob(pattern, recursive=True):
+            if path in seen or os.path.isdir(path):
                 continue
+            seen.add(path)
+            folders[os.path.dirname(path)].append(path)
+    return folders
+
+
+def trash_files(paths):
+    """
+    paths をまとめてゴミ箱に移動し、移動できなかったファイルを {パス: 例外} で返す。
+    まとめての移動が途中で失敗した場合は、残りを1つずつ移動して失敗したファイルを調べる。
+    """
+    from send2trash import send2trash
+    try:
+        send2trash(paths)
+        return {}
+    except Exception:
+        pass
+    errors = {}
+    for path in paths:
+        if not os.path.lexists(path):
+            continue
+        try:
+            send2trash(path)
+        except Exception as e:
+            errors[path] = e
+    return errors
+
+
+def create_empty(path, st):
+    # 元のファイルと同じモード, 所有者で 0 バイトのファイルを作る
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, st.st_mode & 0o777)
+    os.close(fd)
+    os.chmod(path, st.st_mode & 0o7777)
+    if hasattr(os, 'chown'):
+        try:
+            os.chown(path, st.st_uid, st.st_gid)
+        except PermissionError:
+            # 他のユーザーのファイルの所有者は管理者でなければ戻せない
+            pass
+
+
+def wipe(folders, jobs=8):
+    """
+    find_files の結果のファイルをゴミ箱に移動して 0 バイトのファイルを作り、(パス, 例外または None) を返す。
+    ゴミ箱への移動はフォルダごとにまとめて行い、0 バイトのファイルを作るのはスレッドで並行して行う。
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {}
+        for paths in folders.values():
+            for k in range(0, len(paths), BATCH_SIZE):
+                batch = []
+                stats = {}
+                for path in paths[k:k + BATCH_SIZE]:
+                    try:
+                        stats[path] = os.stat(path)
+                        batch.append(path)
+                    except OSError as e:
+                        yield path, e
+                errors = trash_files(batch) if batch else {}
+                for path in batch:
+                    if path in errors:
+                        yield path, errors[path]
+                    else:
+                        futures[executor.submit(create_empty, path, stats[path])] = path
+
+            # 終わったものから返す
+            for future in [future for future in futures if future.done()]:
+                yield futures.pop(future), future.exception()
+
+        for future in concurrent.futures.as_completed(futures):
+            yield futures[future], future.exception()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="ファイルをゴミ箱に移動し、同じ名前の 0 バイトのファイルを作る",
+        epilog="例: wipe.py build/*.o\n"
+               "    wipe.py \"build/**/*.obj\" -n   (消すファイルを表示するだけ)",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('files', nargs='+', help="ファイル。ワイルドカード ('**' で再帰) も指定できる")
+    parser.add_argument('-n', '--dry-run', action='store_true', help="消すファイルを表示するだけで、何もしない")
+    parser.add_argument('-j', '--jobs', type=int, default=8,
+                        help="0 バイトのファイルを作るスレッド数。デフォルトは 8")
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("-j/--jobs には 1 以上の数を指定してください。")
+
+    t0 = time.perf_counter()
+    folders = find_files(args.files)
 
-            try:
-                send2trash(file_path)
-                with open(file_path, 'w') as f:
-                    pass
-                print(f"WIPED OUT: {file_path}")
+    if args.dry_run:
+        count = 0
+        for paths in folders.values():
+            for path in paths:
+                print(f"WIPE: {path}")
+                count += 1
+        print(f"{count} files would be wiped")
+        sys.exit(0)
 
-            except Exception as e:
-                print(f"ERROR: {file_path}: {e}")
-    
\ No newline at end of file
+    wiped = 0
+    failed = 0
+    for path, error in wipe(folders, args.jobs):
+        if error is None:
+            wiped += 1
+            print(f"WIPED OUT: {path}")
+        else:
+            failed += 1
+            print(f"ERROR: {path}: {error}")
+    elapsed = time.perf_counter() - t0
+    print(f"{wiped} files wiped, {failed} errors, {elapsed:.2f} sec")
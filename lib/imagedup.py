@@ -0,0 +1,210 @@
+# imagedup.py
+#
+# 画像の知覚ハッシュと、似た画像 (縮小・再圧縮した重複) のグループ分け
+#   ハッシュは 64 ビットの dHash (隣の画素との明暗) または pHash (DCT の低周波成分)。
+#   JPEG は Pillow の draft() で縮小しながらデコードし、縮小画像からの計算は NumPy で行う。
+#   グループ分けは多重インデックスハッシュで、ハミング距離が近いハッシュだけを探す (全ペアを比べない)。
+#   Pillow と NumPy は使うときに初めて import する。
+
+import collections
+import concurrent.futures
+import functools
+import itertools
+import math
+from typing import Iterable, Iterator, Optional
+import imagetools
+
+# ハッシュの一辺のビット数 (8 x 8 = 64 ビット)
+HASH_SIZE = 8
+
+# pHash で DCT をかける縮小画像の一辺
+PHASH_IMAGE_SIZE = 32
+
+# 多重インデックスハッシュで 64 ビットのハッシュを分ける数の範囲 (3 なら 22, 21, 21 ビット)
+MIN_CHUNKS = 3
+MAX_CHUNKS = 8
+
+# ハッシュの方式 (mediacache.KINDS のキーにもなる)
+METHODS = ('dhash', 'phash')
+
+# 画像のハッシュ (16桁の16進数の文字列)
+ImageHash = collections.namedtuple('ImageHash', ['hash'])
+
+
+def _load_gray(path: str, size: tuple[int, int]):
+    """画像を開き、size 以上の大きさまで縮小しながらデコードしてグレースケールにする"""
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        img = Image.open(path)
+    except UnidentifiedImageError as e:
+        raise imagetools.UnknownFormatError(str(e)) from None
+    with img:
+        # JPEG は DCT の段階で 1/2, 1/4, 1/8 に縮小してデコードする (それ以外の形式では何もしない)。
+        # 縮小しすぎると再圧縮した画像とのハッシュの差が大きくなるので、size の8倍は残す
+        img.draft('L', (size[0] * 8, size[1] * 8))
+        return img.convert('L').resize(size, Image.Resampling.LANCZOS)
+
+
+def _bits_to_hex(bits) -> str:
+    import numpy as np
+
+    return np.packbits(bits.ravel()).tobytes().hex()
+
+
+def dhash(path: str) -> ImageHash:
+    """dHash: (HASH_SIZE + 1) x HASH_SIZE に縮小し、各画素が右隣より明るいかを 1 ビットにする"""
+    import numpy as np
+
+    pixels = np.asarray(_load_gray(path, (HASH_SIZE + 1, HASH_SIZE)), dtype=np.int16)
+    return ImageHash(_bits_to_hex(pixels[:, :-1] > pixels[:, 1:]))
+
+
+@functools.lru_cache(maxsize=None)
+def _dct_matrix(n: int):
+    import numpy as np
+
+    k = np.arange(n)[:, None]
+    return np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n))
+
+
+def phash(path: str) -> ImageHash:
+    """pHash: PHASH_IMAGE_SIZE の正方形に縮小して 2 次元 DCT をかけ、低周波成分が中央値より大きいかを 1 ビットにする"""
+    import numpy as np
+
+    pixels = np.asarray(_load_gray(path, (PHASH_IMAGE_SIZE, PHASH_IMAGE_SIZE)), dtype=np.float64)
+    dct = _dct_matrix(PHASH_IMAGE_SIZE)
+    low = (dct @ pixels @ dct.T)[:HASH_SIZE, :HASH_SIZE]
+    return ImageHash(_bits_to_hex(low > np.median(low)))
+
+
+def hash_file(path: str, method: str = 'dhash') -> tuple[str, object]:
+    """画像のハッシュを計算し (パス, ImageHash) を返す。失敗した場合は ImageHash の代わりに例外を返す"""
+    try:
+        return path, (dhash if method == 'dhash' else phash)(path)
+    except Exception as e:
+        return path, e
+
+
+def scan_hashes(paths: Iterable[str], method: str = 'dhash', jobs: Optional[int] = None) -> Iterator[tuple[str, object]]:
+    """
+    paths の画像のハッシュを jobs 個のプロセスで並列に計算し、(パス, ImageHash または例外) を返す。
+    画像のデコードは CPU を使うので、スレッドではなくプロセスで並列にする。jobs が None ならCPU数。
+    """
+    func = functools.partial(hash_file, method=method)
+    if jobs == 1:
+        yield from map(func, paths)
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        # 小さい画像が大量にある場合に備えて、ある程度まとめてワーカーに渡す
+        yield from executor.map(func, paths, chunksize=32)
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _popcount(values):
+    import numpy as np
+
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    # NumPy 2.0 より前
+    return np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def _flip_masks(bits: int, radius: int) -> list[int]:
+    """bits ビットのうち radius ビット以下を反転するマスク (0 を含む)"""
+    return [sum(1 << p for p in positions)
+            for r in range(radius + 1) for positions in itertools.combinations(range(bits), r)]
+
+
+def _chunk_count(count: int, max_distance: int) -> int:
+    """
+    多重インデックスハッシュで 64 ビットを分ける数を、おおよその計算量が最も少なくなるように選ぶ。
+    分ける数を増やすと探す値 (反転するマスク) が減るが、部分が短くなって候補が増える。
+    """
+    def cost(chunks):
+        width = 64 // chunks
+        masks = sum(math.comb(width + 1, r) for r in range(max_distance // chunks + 1))
+        return chunks * masks * (count + count * count / 2 ** width + 1000)
+    return min(range(MIN_CHUNKS, MAX_CHUNKS + 1), key=cost)
+
+
+def similar_pairs(values, max_distance: int):
+    """
+    64 ビットのハッシュの配列 values から、ハミング距離が max_distance 以下の組 (i, j) (i < j) を
+    形が (組の数, 2) の NumPy の配列で返す。
+
+    多重インデックスハッシュ: 64 ビットを m 個の部分に分けると、距離が d 以下の組は
+    どれかの部分の距離が d // m 以下になる。部分ごとに、値からそのビット数以下を反転した値と
+    同じ部分を持つものを候補にして、全体の距離を確かめる。全ペアは比べず、計算は NumPy でまとめて行う。
+    """
+    import numpy as np
+
+    values = np.asarray(values, dtype=np.uint64)
+    chunks = _chunk_count(len(values), max_distance)
+    index = np.arange(len(values))
+    found = [np.empty((0, 2), dtype=np.int64)]
+    shift = 0
+    for c in range(chunks):
+        width = 64 // chunks + (1 if c < 64 % chunks else 0)
+        chunk = ((values >> np.uint64(shift)) & np.uint64((1 << width) - 1)).astype(np.int64)
+        shift += width
+        # 部分の値ごとの表 (その値を持つ項目は order[starts[値]:starts[値] + counts[値]])
+        order = np.argsort(chunk, kind='stable')
+        counts = np.bincount(chunk, minlength=1 << width)
+        starts = np.cumsum(counts) - counts
+        for mask in _flip_masks(width, max_distance // chunks):
+            keys = chunk ^ mask
+            n = counts[keys]
+            total = int(n.sum())
+            if total == 0:
+                continue
+            # 各項目 i と、keys[i] を部分に持つ項目 j の組を展開する
+            i = np.repeat(index, n)
+            offsets = np.arange(total) - np.repeat(np.cumsum(n) - n, n)
+            j = order[np.repeat(starts[keys], n) + offsets]
+            keep = i < j
+            i, j = i[keep], j[keep]
+            keep = _popcount(values[i] ^ values[j]) <= max_distance
+            found.append(np.stack([i[keep], j[keep]], axis=1))
+    # 複数の部分で見つかった組は1つにする
+    return np.unique(np.concatenate(found), axis=0)
+
+
+def group_duplicates(hashes: Iterable[tuple[str, str]], max_distance: int) -> list[list[tuple[str, str, int]]]:
+    """
+    (パス, ハッシュ) をハミング距離が max_distance 以下のものどうしでつなぎ、2つ以上のファイルを持つグループを返す。
+    グループは (パス, ハッシュ, グループの最初のファイルからの距離) のリストで、パスの順に並べる。
+    近いものをつないでいくので、グループの両端は max_distance より離れていることがある。
+    """
+    import numpy as np
+
+    items = sorted(hashes)
+    values = [int(value, 16) for _, value in items]
+    # 同じハッシュはまとめてから組を探す (同じ画像が大量にあっても組の数が増えないように)
+    unique, inverse = np.unique(np.array(values, dtype=np.uint64), return_inverse=True)
+    parent = list(range(len(unique)))
+
+    def find(k):
+        while parent[k] != k:
+            parent[k] = parent[parent[k]]
+            k = parent[k]
+        return k
+
+    for a, b in similar_pairs(unique, max_distance).tolist():
+        a, b = find(a), find(b)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+
+    members = collections.defaultdict(list)
+    for k, u in enumerate(inverse.ravel().tolist()):
+        members[find(u)].append(k)
+    groups = []
+    for indexes in sorted(members.values()):
+        if len(indexes) < 2:
+            continue
+        first = values[indexes[0]]
+        groups.append([(items[k][0], items[k][1], hamming(values[k], first)) for k in indexes])
+    return groups
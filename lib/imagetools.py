@@ -0,0 +1,506 @@
+# imagetools.py
+#
+# 画像ファイルの情報 (形式, モード, 幅, 高さ)
+#   PNG, JPEG, GIF, BMP, WebP, TIFF はファイルの先頭のヘッダーだけを読んで調べる (ほとんどは数百バイト)。
+#   結果は Pillow の Image.open() の format, mode, width, height と同じになる。
+#   それ以外の形式と、ヘッダーだけでは Pillow と同じモードを決められない場合だけ Pillow を使う
+#   (Pillow はそのとき初めて import する)。
+#   多数のファイルは iter_files() で列挙しながら scan_images() でスレッド並列に調べられる。
+
+import collections
+import concurrent.futures
+import glob
+import os
+import struct
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional, Union
+
+# 最初に読むバイト数 (JPEG, TIFF 以外はこの中で分かる)
+SNIFF_SIZE = 512
+
+# 画像の情報
+ImageInfo = collections.namedtuple('ImageInfo', ['format', 'mode', 'width', 'height'])
+
+
+class UnknownFormatError(Exception):
+    """画像ファイルとして認識できない"""
+    pass
+
+
+# ==============================================================================
+# PNG
+# ==============================================================================
+
+# (ビット深度, カラータイプ) -> モード
+#   16ビットのグレースケールは Pillow のバージョンによってモードが違うので Pillow に任せる
+PNG_MODES = {
+    (1, 0): '1', (2, 0): 'L', (4, 0): 'L', (8, 0): 'L',
+    (8, 2): 'RGB', (16, 2): 'RGB',
+    (1, 3): 'P', (2, 3): 'P', (4, 3): 'P', (8, 3): 'P',
+    (8, 4): 'LA', (16, 4): 'LA',
+    (8, 6): 'RGBA', (16, 6): 'RGBA',
+}
+
+
+def sniff_png(head: bytes, f: BinaryIO) -> Optional[ImageInfo]:
+    # シグネチャの直後は必ず IHDRチャンク
+    if len(head) < 29 or head[12:16] != b'IHDR' or struct.unpack('>I', head[8:12])[0] != 13:
+        return None
+    width, height, bit_depth, color_type = struct.unpack('>IIBB', head[16:26])
+    mode = PNG_MODES.get((bit_depth, color_type))
+    if mode is None or width == 0 or height == 0:
+        return None
+    return ImageInfo('PNG', mode, width, height)
+
+
+# ==============================================================================
+# JPEG
+# ==============================================================================
+
+# フレームの開始 (SOF) マーカー。DHT (C4), JPG (C8), DAC (CC) を除く C0〜CF
+JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+# 長さを持たないマーカー (TEM, RST0〜7, SOI)
+JPEG_STANDALONE_MARKERS = frozenset([0x01] + list(range(0xD0, 0xD9)))
+
+# 成分の数 -> モード
+JPEG_MODES = {1: 'L', 3: 'RGB', 4: 'CMYK'}
+
+
+def _mpf_image_count(data: bytes) -> Optional[int]:
+    """APP2 の MPF (マルチピクチャー) の NumberOfImages タグ (0xB001) の値"""
+    if len(data) < 8 or data[:2] not in (b'II', b'MM'):
+        return None
+    endian = '<' if data[:2] == b'II' else '>'
+    offset = struct.unpack(endian + 'I', data[4:8])[0]
+    if offset + 2 > len(data):
+        return None
+    count = struct.unpack(endian + 'H', data[offset:offset + 2])[0]
+    for k in range(count):
+        entry = data[offset + 2 + k * 12:offset + 14 + k * 12]
+        if len(entry) < 12:
+            return None
+        tag, _, _, value = struct.unpack(endian + 'HHII', entry)
+        if tag == 0xB001:
+            return value
+    return None
+
+
+def sniff_jpeg(head: bytes, f: BinaryIO) -> Optional[ImageInfo]:
+    # マーカーのセグメントを順にたどり、最初の SOF から大きさと成分の数を得る
+    # (EXIF などの大きなセグメントは読まずに読み飛ばす)
+    image_format = 'JPEG'
+    position = 2
+    while True:
+        f.seek(position)
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        while marker[1] == 0xFF:
+            # 埋め草の 0xFF
+            next_byte = f.read(1)
+            if not next_byte:
+                return None
+            position += 1
+            marker = marker[1:] + next_byte
+        code = marker[1]
+        if code in JPEG_STANDALONE_MARKERS:
+            position += 2
+            continue
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack('>H', length_bytes)[0]
+        if length < 2:
+            return None
+
+        if code in JPEG_SOF_MARKERS:
+            sof = f.read(6)
+            if len(sof) < 6:
+                return None
+            precision, height, width, components = struct.unpack('>BHHB', sof)
+            mode = JPEG_MODES.get(components)
+            # Pillow は 8ビット以外を開けない
+            if precision != 8 or mode is None or width == 0 or height == 0:
+                return None
+            return ImageInfo(image_format, mode, width, height)
+        elif code == 0xE2 and length >= 6:
+            # 複数の画像を持つ MPF のファイルは、Pillow では MPO になる
+            data = f.read(length - 2)
+            if data[:4] == b'MPF\x00':
+                count = _mpf_image_count(data[4:])
+                if count is None:
+                    return None
+                if count > 1:
+                    image_format = 'MPO'
+        elif code in (0xDA, 0xD9):
+            # SOF の前にスキャンやファイルの終わりがある
+            return None
+        position += 2 + length
+
+
+# ==============================================================================
+# GIF
+# ==============================================================================
+
+def _is_gray_palette(palette: bytes) -> bool:
+    """パレットが 0, 1, 2, ... のグレースケールそのものか (Pillow ではモード L になる)"""
+    return all(palette[k] == palette[k + 1] == palette[k + 2] == k // 3 for k in range(0, len(palette), 3))
+
+
+def sniff_gif(head: bytes, f: BinaryIO) -> Optional[ImageInfo]:
+    if len(head) < 13:
+        return None
+    width, height, flags = struct.unpack('<HHB', head[6:11])
+    # グローバルカラーテーブルがなければ、モードは最初の画像のパレットで決まるので Pillow に任せる
+    if not flags & 0x80:
+        return None
+    position = 13 + (3 << ((flags & 7) + 1))
+    f.seek(13)
+    palette = f.read(position - 13)
+    if len(palette) < position - 13 or _is_gray_palette(palette):
+        return None
+
+    # 最初の画像にローカルカラーテーブルがないことを確かめる (拡張ブロックは読み飛ばす)
+    while True:
+        f.seek(position)
+        block = f.read(1)
+        if block == b'!':
+            position += 2
+            while True:
+                f.seek(position)
+                size = f.read(1)
+                if not size:
+                    return None
+                position += 1 + size[0]
+                if size[0] == 0:
+                    break
+        elif block == b',':
+            descriptor = f.read(9)
+            if len(descriptor) < 9 or descriptor[8] & 0x80:
+                return None
+            return ImageInfo('GIF', 'P', width, height)
+        else:
+            return None
+
+
+# ==============================================================================
+# BMP
+# ==============================================================================
+
+# Windows の情報ヘッダーのサイズ (BITMAPINFOHEADER, V2, V3, OS/2 v2, V4, V5)
+BMP_INFO_HEADER_SIZES = (40, 52, 56, 64, 108, 124)
+
+
+def sniff_bmp(head: bytes, f: BinaryIO) -> Optional[ImageInfo]:
+    if len(head) < 26:
+        return None
+    header_size = struct.unpack('<I', head[14:18])[0]
+    if header_size == 12:
+        # OS/2 v1
+        width, height, planes, bits = struct.unpack('<HHHH', head[18:26])
+        compression, colors, entry_size = 0, 0, 3
+    elif header_size in BMP_INFO_HEADER_SIZES and len(head) >= 50:
+        width, height, planes, bits, compression = struct.unpack('<iiHHI', head[18:34])
+        colors = struct.unpack('<I', head[46:50])[0]
+        entry_size = 4
+    else:
+        return None
+    height = abs(height)
+    if width <= 0 or height == 0:
+        return None
+
+    if compression != 0:
+        # ビットフィールドや RLE は Pillow に任せる
+        return None
+    if bits in (16, 24, 32):
+        return ImageInfo('BMP', 'RGB', width, height)
+    if bits not in (1, 4, 8):
+        return None
+
+    # パレットがグレースケールなら 1 または L、そうでなければ P (Pillow と同じ判定)
+    colors = colors or 1 << bits
+    if colors > 1 << bits:
+        return None
+    f.seek(14 + header_size)
+    palette = f.read(colors * entry_size)
+    if len(palette) < colors * entry_size:
+        return None
+    levels = (0, 255) if colors == 2 else range(colors)
+    gray = all(palette[k * entry_size:k * entry_size + 3] == bytes((level,)) * 3 for k, level in enumerate(levels))
+    if colors == 2 and gray:
+        return ImageInfo('BMP', '1', width, height)
+    return ImageInfo('BMP', 'L' if gray else 'P', width, height)
+
+
+# ==============================================================================
+# WebP
+# ==============================================================================
+
+def sniff_webp(head: bytes, f: BinaryIO) -> Optional[ImageInfo]:
+    if len(head) < 30:
+        return None
+    chunk = head[12:16]
+    if chunk == b'VP8 ':
+        # 非可逆: キーフレームのスタートコードの後に 14ビットずつの幅と高さ
+        if head[23:26] != b'\x9d\x01\x2a':
+            return None
+        width, height = struct.unpack('<HH', head[26:30])
+        width, height, alpha = width & 0x3FFF, height & 0x3FFF, False
+    elif chunk == b'VP8L':
+        # 可逆: 14ビットずつの (幅 - 1), (高さ - 1) とアルファの有無
+        if head[20] != 0x2F:
+            return None
+        bits = struct.unpack('<I', head[21:25])[0]
+        width, height, alpha = (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1, bool(bits >> 28 & 1)
+    elif chunk == b'VP8X':
+        # 拡張: フラグと 24ビットずつの (幅 - 1), (高さ - 1)
+        flags = head[20]
+        width = int.from_bytes(head[24:27], 'little') + 1
+        height = int.from_bytes(head[27:30], 'little') + 1
+        alpha = bool(flags & 0x10)
+    else:
+        return None
+    if width == 0 or height == 0:
+        return None
+    return ImageInfo('WEBP', 'RGBA' if alpha else 'RGB', width, height)
+
+
+# ==============================================================================
+# TIFF
+# ==============================================================================
+
+# タグの型 -> (struct の書式, バイト数)
+TIFF_TYPES = {1: ('B', 1), 3: ('H', 2), 4: ('I', 4)}
+
+TIFF_TAGS = {
+    256: 'width', 257: 'height', 258: 'bits', 262: 'photometric', 266: 'fill_order',
+    277: 'samples', 284: 'planar', 338: 'extra_samples', 339: 'sample_format',
+}
+
+# (測光解釈, ビット数, ExtraSamples) -> モード (Pillow の TiffImagePlugin.OPEN_INFO の一部)
+TIFF_MODES = {
+    (0, (1,), ()): '1', (1, (1,), ()): '1',
+    (0, (2,), ()): 'L', (1, (2,), ()): 'L',
+    (0, (4,), ()): 'L', (1, (4,), ()): 'L',
+    (0, (8,), ()): 'L', (1, (8,), ()): 'L',
+    (1, (8, 8), (2,)): 'LA',
+    (2, (8, 8, 8), ()): 'RGB',
+    (2, (8, 8, 8, 8), ()): 'RGBA', (2, (8, 8, 8, 8), (0,)): 'RGB',
+    (2, (8, 8, 8, 8), (1,)): 'RGBA', (2, (8, 8, 8, 8), (2,)): 'RGBA',
+    (3, (1,), ()): 'P', (3, (2,), ()): 'P', (3, (4,), ()): 'P', (3, (8,), ()): 'P',
+    (3, (8, 8), (2,)): 'PA',
+    (5, (8, 8, 8, 8), ()): 'CMYK',
+}
+
+
+def sniff_tiff(head: bytes, f: BinaryIO) -> Optional[ImageInfo]:
+    endian = '<' if head[:2] == b'II' else '>'
+    offset = struct.unpack(endian + 'I', head[4:8])[0]
+    f.seek(offset)
+    count_bytes = f.read(2)
+    if len(count_bytes) < 2:
+        return None
+    count = struct.unpack(endian + 'H', count_bytes)[0]
+    entries = f.read(count * 12)
+    if len(entries) < count * 12:
+        return None
+
+    # 最初の IFD から必要なタグだけを読む
+    tags = {}
+    for k in range(count):
+        tag, type_, n, value = struct.unpack(endian + 'HHI4s', entries[k * 12:k * 12 + 12])
+        name = TIFF_TAGS.get(tag)
+        if name is None:
+            continue
+        if type_ not in TIFF_TYPES or n == 0:
+            return None
+        code, size = TIFF_TYPES[type_]
+        if n * size > 4:
+            f.seek(struct.unpack(endian + 'I', value)[0])
+            value = f.read(n * size)
+            if len(value) < n * size:
+                return None
+        tags[name] = struct.unpack(f'{endian}{n}{code}', value[:n * size])
+
+    width, height = tags.get('width', (0,))[0], tags.get('height', (0,))[0]
+    samples = tags.get('samples', (1,))[0]
+    bits = tags.get('bits', (1,))
+    if len(bits) == 1 and samples > 1:
+        bits = bits * samples
+    if (width == 0 or height == 0 or 'photometric' not in tags or len(bits) != samples
+            or tags.get('fill_order', (1,)) != (1,) or tags.get('planar', (1,)) != (1,)
+            or any(v != 1 for v in tags.get('sample_format', (1,)))):
+        return None
+
+    mode = TIFF_MODES.get((tags['photometric'][0], bits, tags.get('extra_samples', ())))
+    if mode is None:
+        return None
+    return ImageInfo('TIFF', mode, width, height)
+
+
+# ==============================================================================
+# 形式の判定
+# ==============================================================================
+
+# 先頭のバイト列 -> ヘッダーの解析関数
+SNIFFERS: list[tuple[bytes, Callable[[bytes, BinaryIO], Optional[ImageInfo]]]] = [
+    (b'\x89PNG\r\n\x1a\n', sniff_png),
+    (b'\xff\xd8\xff', sniff_jpeg),
+    (b'GIF87a', sniff_gif),
+    (b'GIF89a', sniff_gif),
+    (b'BM', sniff_bmp),
+    (b'II*\x00', sniff_tiff),
+    (b'MM\x00*', sniff_tiff),
+]
+
+
+def find_sniffer(head: bytes) -> Optional[Callable[[bytes, BinaryIO], Optional[ImageInfo]]]:
+    """ファイルの先頭のバイト列から、ヘッダーの解析関数を選ぶ (該当しなければ None)"""
+    for magic, sniffer in SNIFFERS:
+        if head.startswith(magic):
+            return sniffer
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return sniff_webp
+    return None
+
+
+def sniff_image(f: BinaryIO) -> Optional[ImageInfo]:
+    """
+    バイナリモードで開いたファイルのヘッダーだけを読み、画像の情報を返す。
+    対応していない形式や、Pillow と同じ結果になると言えない場合は None を返す。
+    """
+    head = f.read(SNIFF_SIZE)
+    sniffer = find_sniffer(head)
+    if sniffer is None:
+        return None
+    try:
+        return sniffer(head, f)
+    except (struct.error, IndexError):
+        return None
+
+
+def pillow_image_info(path: str) -> ImageInfo:
+    """
+    Pillow で画像を開いて情報を返す。画像として認識できない場合は UnknownFormatError を送出する。
+    Pillow はここで初めて import する (インストールされていなければ ImportError)。
+    """
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(path) as img:
+            return ImageInfo(img.format, img.mode, img.width, img.height)
+    except UnidentifiedImageError as e:
+        raise UnknownFormatError(str(e)) from None
+
+
+def get_image_info(path: str, use_pillow: bool = True) -> ImageInfo:
+    """
+    画像ファイルの情報 (形式, モード, 幅, 高さ) を返す。
+    まずヘッダーだけを調べ、分からなければ Pillow で開く (use_pillow が偽なら開かない)。
+    画像として認識できない場合は UnknownFormatError を送出する。
+    Pillow がない環境では、ヘッダーで分からない画像も UnknownFormatError になる。
+    """
+    with open(path, 'rb') as f:
+        info = sniff_image(f)
+    if info is not None:
+        return info
+    if not use_pillow:
+        raise UnknownFormatError(f"ヘッダーから画像の情報が分かりません: {path}")
+    try:
+        return pillow_image_info(path)
+    except ImportError:
+        raise UnknownFormatError(f"Pillow がないため画像の情報が分かりません: {path}") from None
+
+
+# ==============================================================================
+# 多数のファイルの列挙と並列の読み込み
+# ==============================================================================
+
+def iter_files(patterns: Iterable[str]) -> Iterator[str]:
+    """
+    ワイルドカード ('**' で再帰) とディレクトリ (配下を再帰) を展開し、ファイルのパスを返す。
+    全体を展開し終わるのを待たず、見つけた順に返す (ディレクトリの中は名前順)。重複は除く。
+    """
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            # os.scandir の種類の情報を使うので、ファイルごとの stat はしない
+            matches = _walk_files(pattern)
+        else:
+            matches = (path for path in glob.iglob(pattern, recursive=True) if os.path.isfile(path))
+        for path in matches:
+            if path not in seen:
+                seen.add(path)
+                yield path
+
+
+def _walk_files(folder: str) -> Iterator[str]:
+    try:
+        with os.scandir(folder) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+    except OSError:
+        return
+    subfolders = []
+    for entry in entries:
+        try:
+            if entry.is_dir():
+                subfolders.append(entry.path)
+            elif entry.is_file():
+                yield entry.path
+        except OSError:
+            pass
+    for subfolder in subfolders:
+        yield from _walk_files(subfolder)
+
+
+# scan_images() が返す (パス, 情報または例外)
+ScanResult = tuple[str, Union[ImageInfo, Exception]]
+
+
+def _scan_one(path: str, use_pillow: bool) -> ScanResult:
+    try:
+        return path, get_image_info(path, use_pillow)
+    except Exception as e:
+        return path, e
+
+
+def scan_images(paths: Iterable[str], jobs: int = 8, ordered: bool = False,
+                use_pillow: bool = True) -> Iterator[ScanResult]:
+    """
+    paths の画像を jobs 個のスレッドで並列に調べ、(パス, ImageInfo) を返す。
+    失敗したファイルは ImageInfo の代わりに例外 (UnknownFormatError など) を返す。
+
+    ネットワーク上のフォルダのように1ファイルごとの待ち時間が長い場合に、その待ち時間を重ねる。
+    paths は少しずつ読み進める (実行中のファイルは jobs の数倍まで) ので、列挙と並行して調べられる。
+    結果は終わった順に返し、ordered が真の場合は paths の順に返す。
+    """
+    if jobs <= 1:
+        for path in paths:
+            yield _scan_one(path, use_pillow)
+        return
+
+    limit = jobs * 4
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+    try:
+        if ordered:
+            pending = collections.deque()
+            for path in paths:
+                if len(pending) >= limit:
+                    yield pending.popleft().result()
+                pending.append(executor.submit(_scan_one, path, use_pillow))
+            while pending:
+                yield pending.popleft().result()
+        else:
+            pending = set()
+            for path in paths:
+                if len(pending) >= limit:
+                    done, pending = concurrent.futures.wait(
+                        pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+                pending.add(executor.submit(_scan_one, path, use_pillow))
+            for future in concurrent.futures.as_completed(pending):
+                yield future.result()
+    finally:
+        # 途中でやめた場合は、まだ始まっていないファイルを調べない
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,223 @@
+# mediacache.py
+#
+# 画像・動画の情報のキャッシュ (image-info.py, video-info.py で共有する)
+#   画像の知覚ハッシュ (imagedup.py) も同じように保存する。
+#   ユーザーのキャッシュフォルダの SQLite データベースに、(パス, サイズ, 更新時刻) ごとに結果を保存する。
+#   変更のないファイルは stat を1回するだけで、開かずに結果を返す。
+#   画像・動画として認識できなかったことも保存する (次回も開かない)。
+
+import collections
+import os
+import sqlite3
+import sys
+import time
+from typing import Callable, Iterable, Iterator, Optional
+
+# 種類ごとに保存する列 (値のタプルはこの順)
+KINDS = {
+    'image': ('format', 'mode', 'width', 'height'),
+    'video': ('width', 'height', 'fps', 'frames', 'duration'),
+    'dhash': ('hash',),
+    'phash': ('hash',),
+}
+
+# まとめて引くパスの数 (SQLite のプレースホルダーの上限 999 より少なく)
+BATCH_SIZE = 500
+
+
+def default_cache_path() -> str:
+    """キャッシュファイルのデフォルトのパス (ユーザーのキャッシュフォルダの下)"""
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~/AppData/Local')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'mypytools', 'media-cache.sqlite3')
+
+
+class CacheError(Exception):
+    """キャッシュファイルを開けない (SQLite のデータベースではないなど)"""
+    pass
+
+
+class MediaCache:
+    """
+    画像・動画の情報のキャッシュ。(パス, サイズ, 更新時刻) が同じファイルは保存した結果を返す。
+    閉じるときに、max_age_days 日以上使われていないものと、max_entries を超えた古いものを削除する。
+    """
+
+    def __init__(self, cache_path: Optional[str] = None, max_entries: int = 1000000, max_age_days: float = 90):
+        cache_path = cache_path or default_cache_path()
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.conn = None
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+            # image-info.py と video-info.py が同時に使っても待つように
+            self.conn = sqlite3.connect(cache_path, timeout=30)
+            self._create_table()
+        except (OSError, sqlite3.DatabaseError) as e:
+            if self.conn is not None:
+                self.conn.close()
+            raise CacheError(f"キャッシュファイルを開けません: {cache_path} ({e})") from e
+        self.now = time.time()
+        self.hits: list[tuple[str, str]] = []
+
+    def _create_table(self):
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS media ('
+            ' path TEXT, kind TEXT, size INTEGER, mtime_ns INTEGER, ok INTEGER,'
+            ' format TEXT, mode TEXT, width INTEGER, height INTEGER,'
+            ' fps REAL, frames INTEGER, duration REAL, used REAL,'
+            ' PRIMARY KEY (path, kind))'
+        )
+        # 後から追加した列 (古いキャッシュファイルにはない)
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(media)')}
+        if 'hash' not in columns:
+            self.conn.execute('ALTER TABLE media ADD COLUMN hash TEXT')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS media_used ON media (used)')
+
+    @staticmethod
+    def stat_file(path: str) -> tuple[str, Optional[os.stat_result]]:
+        path = os.path.abspath(path)
+        try:
+            return path, os.stat(path)
+        except OSError:
+            return path, None
+
+    def lookup_many(self, paths: Iterable[str], kind: str) -> tuple[dict, dict]:
+        """
+        paths をまとめて引き、(結果, 状態) の辞書を返す。
+        結果はキャッシュにあったパスだけで、値は KINDS[kind] の順のタプル (認識できなかったファイルは None)。
+        状態は見つからなかったパスの os.stat の結果で、store() に渡す。
+        """
+        columns = ', '.join(KINDS[kind])
+        found = {}
+        stats = {}
+        keys = {}
+        for path in paths:
+            key, st = self.stat_file(path)
+            if st is not None:
+                keys[key] = path
+            stats[path] = st
+        key_list = list(keys)
+        for k in range(0, len(key_list), BATCH_SIZE):
+            batch = key_list[k:k + BATCH_SIZE]
+            rows = self.conn.execute(
+                f'SELECT path, size, mtime_ns, ok, {columns} FROM media'
+                f' WHERE kind = ? AND path IN ({", ".join("?" * len(batch))})',
+                [kind, *batch]
+            )
+            for key, size, mtime_ns, ok, *values in rows:
+                path = keys[key]
+                st = stats[path]
+                if st.st_size == size and st.st_mtime_ns == mtime_ns:
+                    found[path] = tuple(values) if ok else None
+                    del stats[path]
+                    self.hits.append((key, kind))
+        return found, stats
+
+    def store(self, path: str, kind: str, values: Optional[tuple], st: Optional[os.stat_result] = None):
+        """
+        結果 (KINDS[kind] の順のタプル、認識できなかった場合は None) を保存する。
+        st には調べる前に取得したファイルの状態を渡す (調べている間に変更されても、次回は読み直されるように)。
+        """
+        key = os.path.abspath(path)
+        if st is None:
+            key, st = self.stat_file(path)
+            if st is None:
+                return
+        columns = KINDS[kind]
+        self.conn.execute(
+            f'INSERT OR REPLACE INTO media (path, kind, size, mtime_ns, ok, used, {", ".join(columns)})'
+            f' VALUES (?, ?, ?, ?, ?, ?{", ?" * len(columns)})',
+            (key, kind, st.st_size, st.st_mtime_ns, values is not None, self.now,
+             *(values if values is not None else [None] * len(columns)))
+        )
+
+    def close(self):
+        """使われた結果の時刻を更新し、古い結果と上限を超えた結果を削除して閉じる。"""
+        self.conn.executemany('UPDATE media SET used = ? WHERE path = ? AND kind = ?',
+                              ((self.now, path, kind) for path, kind in self.hits))
+        self.conn.execute('DELETE FROM media WHERE used < ?', (self.now - self.max_age_days * 86400,))
+        self.conn.execute(
+            'DELETE FROM media WHERE rowid IN (SELECT rowid FROM media ORDER BY used DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+        self.conn.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _batches(items: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def scan_with_cache(paths: Iterable[str], cache: Optional[MediaCache], kind: str,
+                    scan: Callable[[Iterable[str]], Iterator[tuple[str, object]]],
+                    make: Callable, not_media: type, ordered: bool = False) -> Iterator[tuple[str, object]]:
+    """
+    キャッシュにあるファイルはその結果を、ないファイルだけを scan で調べた結果を (パス, 結果) で返す。
+
+    scan はパスの列を受け取り (パス, 結果または例外) を返す関数 (imagetools.scan_images など)。
+    キャッシュの結果は make(*値) にして返し、認識できなかったファイルは not_media の例外を返す。
+    scan が返した not_media の例外は「認識できなかった」として保存し、それ以外の例外は保存しない。
+    ordered が真の場合は paths の順に返す (scan も入力の順に返すこと)。
+    """
+    if cache is None:
+        yield from scan(paths)
+        return
+
+    # 結果を返す順の待ち行列。要素は [パス, 結果, 決まったか]
+    queue = collections.deque()
+    waiting = {}
+    stats = {}
+
+    def misses():
+        # paths をまとめてキャッシュで引き、ないものだけを scan に渡す
+        for batch in _batches(paths, BATCH_SIZE):
+            found, batch_stats = cache.lookup_many(batch, kind)
+            for path in batch:
+                if path in found:
+                    values = found[path]
+                    if values is None:
+                        queue.append([path, not_media(f"認識できない形式です (キャッシュ): {path}"), True])
+                    else:
+                        queue.append([path, make(*values), True])
+                    continue
+                stats[path] = batch_stats[path]
+                if ordered:
+                    entry = waiting[path] = [path, None, False]
+                    queue.append(entry)
+                yield path
+
+    def ready():
+        while queue and queue[0][2]:
+            path, result, _ = queue.popleft()
+            yield path, result
+
+    for path, result in scan(misses()):
+        st = stats.pop(path, None)
+        if isinstance(result, not_media):
+            cache.store(path, kind, None, st)
+        elif not isinstance(result, Exception):
+            cache.store(path, kind, tuple(result), st)
+        if ordered:
+            entry = waiting.pop(path)
+            entry[1:] = [result, True]
+        else:
+            yield path, result
+        yield from ready()
+    yield from ready()
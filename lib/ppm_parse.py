@@ -1,11 +1,18 @@
 # 質問「柊ゲオルク氏の ppmParse.cpp を Python にコンバートしてください」
 # 回答 (Google Gemini)
 
+import argparse
+import concurrent.futures
+import contextlib
+import glob
+import mmap
 import os
 import shutil
 import pathlib
 import struct
-from typing import Optional, List, Dict, Any
+import sys
+import time
+from typing import Optional, Iterator, List, Dict, Any, NamedTuple, Union
 
 # ==============================================================================
 # 補助関数: Search (ディレクトリ探索)
@@ -41,6 +48,113 @@ def search_file(search_folder: str, search_file_lower: str) -> Optional[str]:
         
     return None
 
+# ==============================================================================
+# 補助関数: 探索フォルダの索引作成
+# search_file() を参照ごとに呼ぶ代わりに、フォルダを1回だけ走査しておく
+# ==============================================================================
+def build_asset_index(*search_folders: Optional[str]) -> Dict[str, str]:
+    """
+    探索フォルダ以下のファイルを走査し、ファイル名（小文字）からフルパスを引く辞書を作る。
+
+    同じ名前のファイルが複数ある場合は search_file() と同じく最初に見つかったものを採用し、
+    先に指定したフォルダを優先する。
+
+    :param search_folders: 探索フォルダ (Noneは無視する)。
+    :return: {ファイル名（小文字）: フルパス} の辞書。
+    """
+    index: Dict[str, str] = {}
+    for search_folder in search_folders:
+        if not search_folder:
+            continue
+        try:
+            start_path = pathlib.Path(search_folder)
+            if not start_path.is_dir():
+                continue
+            for entry in start_path.rglob('*'):
+                if entry.is_file():
+                    index.setdefault(entry.name.lower(), str(entry.resolve()))
+        except Exception as e:
+            print(f"Error during file search in {search_folder}: {e}")
+    return index
+
+# ==============================================================================
+# 補助関数: ファイル全体を読み取り専用でmmapする
+# ==============================================================================
+def _map_file(rfp):
+    """
+    開いたファイルを読み取り専用でmmapする。空ファイルはmmapできないので空のbytesを返す。
+
+    :param rfp: バイナリモードで開いたファイルオブジェクト。
+    :return: with文で使えるmmapオブジェクト (または空のbytes)。
+    """
+    if os.fstat(rfp.fileno()).st_size == 0:
+        return contextlib.nullcontext(b'')
+    return mmap.mmap(rfp.fileno(), 0, access=mmap.ACCESS_READ)
+
+# ==============================================================================
+# 補助関数: '.' の位置から参照パスを判定する
+# C++のpmmParse関数の拡張子チェック部分 (pmm_parse と iter_pmm_references で共用)
+# ==============================================================================
+def _match_reference(data_buffer, i: int, data_len: int) -> Optional[tuple[int, int, int, str]]:
+    """
+    data_buffer[i] の '.' が .pmd/.avi/.bmp/.wav/.x のフルパスの拡張子かどうかを判定する。
+
+    :param data_buffer: PMMファイルの内容 (mmap または bytes)。
+    :param i: '.' の位置。
+    :param data_len: data_buffer の長さ。
+    :return: (パスの始端, ファイル名の始端, パスの終端 (.ext の次), 拡張子)、該当しない場合は None。
+    """
+    j = i + 1
+
+    # 拡張子の判定 ( Inc の代替。j-2 から 6バイトを読み込む)
+    # C++: memcpy(Inc,Main + j - 2, 6); strlwr(Inc);
+    # Pythonでは、i+1 から始まるファイル名っぽい部分をチェック
+
+    # 少なくとも 5バイト (.xxx\0) が必要 (i+1 + 3 + 1 = i+5)
+    if j + 3 >= data_len:
+        return None
+
+    inc_bytes = data_buffer[j - 2 : j + 4] # .ext の部分を含む6バイト
+    inc_str_lower = inc_bytes.lower().decode('ascii', errors='ignore')
+
+    # 拡張子チェックのロジックを再現 (ファイル名がフルパス表記かどうかもチェック)
+
+    # j から遡って ':' (ドライブレターやプロトコル) を探す
+    if data_buffer.rfind(b':', 0, j + 1) < 0:
+        return None
+
+    # --------------------------------
+    # .pmd, .avi, .bmp, .wav のチェック
+    # --------------------------------
+    if inc_str_lower[2:5] in ("pmd", "avi", "bmp", "wav"):
+        ext = inc_str_lower[2:5]
+        end = i + 4 # .ext (4文字) 分進める
+
+    # --------------------------------
+    # .x のチェック
+    # --------------------------------
+    elif len(inc_str_lower) >= 4 and \
+         inc_str_lower[0] != '\x00' and \
+         inc_str_lower[1] == '.' and \
+         inc_str_lower[2] == 'x' and \
+         inc_str_lower[3] == '\x00':
+        ext = "x"
+        end = i + 2 # .x (2文字) 分進める
+
+    else:
+        return None
+
+    # TargetFileの始端: .ext の直前から '\\' が見つかるまで遡る (ファイル名)
+    file_start = data_buffer.rfind(b'\\', 0, end) + 1
+
+    # TargetPathの始端: ファイル名の前から ':' が見つかるまで遡り、さらに1文字戻す
+    # (':' の前の文字、ドライブレターの 'C' など)
+    path_start = data_buffer.rfind(b':', 0, file_start) - 1
+    if path_start < 0:
+        path_start = 0 # バグ対策
+
+    return path_start, file_start, end, ext
+
 # ==============================================================================
 # メイン関数: pmmParse
 # C++のpmmParse関数をPythonで代替
@@ -49,7 +163,9 @@ def pmm_parse(
     read_file: str,
     out_folder: Optional[str],
     search_folder1: Optional[str],
-    search_folder2: Optional[str]
+    search_folder2: Optional[str],
+    asset_index: Optional[Dict[str, str]] = None,
+    logs: Optional[List[str]] = None
 ) -> tuple[int, str]:
     """
     PMMファイルを解析し、内部パスを探索フォルダに基づいて書き換え、新しいファイルとして出力する。
@@ -61,16 +177,19 @@ def pmm_parse(
     :param out_folder: 出力先フォルダのパス。Noneの場合は書き換え・出力を行わない。
     :param search_folder1: 探索フォルダ1。
     :param search_folder2: 探索フォルダ2。
+    :param asset_index: build_asset_index() で作った索引。指定した場合は探索フォルダを走査せずにこれを引く。
+    :param logs: ログの格納先リスト。指定した場合は標準出力に出さずにこのリストに追加する。
     :return: (結果コード (0: 成功, -1: 失敗), パスリスト (str))
     """
     
-    LOGS = [] # EditBufferの代替
+    LOGS = [] if logs is None else logs # EditBufferの代替
     path_list_result: List[str] = [] # PathListの代替
 
     def log(message: str):
         """ログ出力の代替 (C++のSetWindowText/wsprintfの代替)"""
         LOGS.append(message)
-        print(message, end='') # 標準出力にも出す (適宜調整)
+        if logs is None:
+            print(message, end='') # 標準出力にも出す (バッチ処理ではファイルごとに集める)
 
     # ----------------------------------------------------------------------
     # ファイル名抽出と拡張子チェック
@@ -119,221 +238,170 @@ def pmm_parse(
     # ----------------------------------------------------------------------
     # 重複対策 (workingファイルへのコピー)
     # ----------------------------------------------------------------------
+    # 入力はmmapで直接読むので、入力と出力が同じファイルになる場合だけ
+    # C++コードの「重複対策」を再現して working ファイルにコピーする
+    # (並列処理で同じフォルダに出力しても衝突しないよう、ファイルごとに名前を分ける)
     current_read_file = read_file
     temp_working_file = None
-    if out_folder:
-        # C++コードの「重複対策」を再現
-        temp_working_file = pathlib.Path(out_folder) / "working.pmm"
+    if out_file and out_file.exists() and os.path.samefile(read_file, out_file):
+        temp_working_file = pathlib.Path(out_folder) / f"working_{file_name}"
         try:
             shutil.copy2(read_file, temp_working_file)
             current_read_file = str(temp_working_file)
         except Exception as e:
-            log(f"working.pmmへのコピーに失敗しました: {e}\r\n")
+            log(f"{temp_working_file.name}へのコピーに失敗しました: {e}\r\n")
             return -1, ""
 
     # ----------------------------------------------------------------------
     # PMMファイル解析本体
     # ----------------------------------------------------------------------
-    
-    # データの構造体をPythonの辞書とリストで代替
+
+    # データの構造体をPythonのリストで代替
     # C++: TCreateData (Path, Data, Count) の連結リスト
-    # Python: [{ 'data': bytes, 'path': str }] のリスト
-    create_data_list: List[Dict[str, Any]] = []
-    
+    # Python: 入力ファイルのmmapを指す memoryview と、新しいパス (bytes) を順に並べたリスト
+    #         (書き出し時にそのまま writelines() に渡す)
+    create_data_list: List[Union[memoryview, bytes]] = []
+
     try:
         # PMMファイルはバイナリモードで処理
-        with open(current_read_file, 'rb') as rfp:
-            # ファイル全体を読み込む (C++のようにチャンク処理しないことで単純化)
-            file_data = rfp.read()
-            
+        with open(current_read_file, 'rb') as rfp, _map_file(rfp) as data_buffer:
             # C++コードは500バイトずつ読んで Before/Main/After のバッファで処理しているが、
-            # Pythonでは一度に読み込み、バイト配列として処理する
-            data_buffer = bytearray(file_data)
-            i = 0 # 現在のインデックス (C++の i に相当)
-            start = 0 # 前回の書き換えが発生した位置 (C++の Start に相当)
-            
-            # C++コードのループ処理を再現
-            while i < len(data_buffer):
-                # '.' の検出
-                if data_buffer[i:i+1] == b'.':
-                    j = i + 1
-                    
-                    # 拡張子の判定 ( Inc の代替。j-2 から 6バイトを読み込む)
-                    # C++: memcpy(Inc,Main + j - 2, 6); strlwr(Inc);
-                    # Pythonでは、i+1 から始まるファイル名っぽい部分をチェック
-                    
-                    # 少なくとも 5バイト (.xxx\0) が必要 (i+1 + 3 + 1 = i+5)
-                    if j + 3 < len(data_buffer): 
-                        inc_bytes = data_buffer[j - 2 : j + 4] # .ext の部分を含む6バイト
-                        inc_str_lower = inc_bytes.lower().decode('ascii', errors='ignore')
-
-                        ml = 0
-                        # 拡張子チェックのロジックを再現 (ファイル名がフルパス表記かどうかもチェック)
-                        
-                        # j から遡って ':' (ドライブレターやプロトコル) を探す
-                        p = j
-                        while p >= 0 and data_buffer[p] != ord(b':'):
-                            p -= 1
-                        has_full_path = p >= 0 and data_buffer[p] == ord(b':')
-                        
+            # Pythonではファイル全体を読み取り専用でmmapし、コピーせずに処理する
+            data_view = memoryview(data_buffer)
+            try:
+                data_len = len(data_buffer)
+                i = 0 # 現在のインデックス (C++の i に相当)
+                start = 0 # 前回の書き換えが発生した位置 (C++の Start に相当)
+
+                # C++コードのループ処理を再現
+                while i < data_len:
+                    # '.' の検出 (次の '.' まで一気に読み飛ばす)
+                    i = data_buffer.find(b'.', i)
+                    if i < 0:
+                        i = data_len
+                        break
+
+                    # 拡張子とフルパス表記をチェックし、参照されているパスの範囲を得る
+                    ref = _match_reference(data_buffer, i, data_len)
+
+                    # --------------------------------
+                    # パス/ファイル名抽出と書き換え処理
+                    # --------------------------------
+                    if ref is not None:
+                        # TargetPath (フルパス部分) と TargetFile (ファイル名部分) の範囲
+                        # i は .ext の次の位置になる
+                        j_path_start, j_file_start, i, ext_lower = ref
+
+                        # TargetPath (C++の TargetPath)
+                        # i - j_path_start の長さで TargetPath を抽出
+                        path_bytes = data_buffer[j_path_start : i]
+                        target_path = path_bytes.decode('shift_jis', errors='ignore').rstrip('\x00')
+
+                        # TargetFile (C++の TargetFile)
+                        # i - j_file_start の長さで TargetFile を抽出
+                        file_bytes = data_buffer[j_file_start : i]
+                        target_file = file_bytes.decode('shift_jis', errors='ignore').rstrip('\x00')
+
+                        # PathListに追加
+                        path_list_result.append(target_path)
+
+                        log("----------------------------------------\r\n")
+                        log(f"パス{target_path}を書き換えます。\r\n")
+
                         # --------------------------------
-                        # .pmd, .avi, .bmp, .wav のチェック
+                        # データ構造体の構築 (書き換え前のデータ保存)
                         # --------------------------------
-                        if (inc_str_lower[2:5] == "pmd" or \
-                            inc_str_lower[2:5] == "avi" or \
-                            inc_str_lower[2:5] == "bmp" or \
-                            inc_str_lower[2:5] == "wav") and has_full_path:
-                            
-                            i += 4 # .ext (4文字) 分進める
-                            ml = 1
-                        
+
+                        # 1. 前回の書き換えから今回のパスの始端までのデータ (Main[Start]...Main[j-1])
+                        # C++: j-Start の長さのデータ (コピーせず memoryview で参照する)
+                        create_data_list.append(data_view[start:j_path_start])
+
+                        # 2. 今回のパス文字列 (書き換え対象) の情報
+                        # C++: TargetPath, TargetFile
+                        target_file_unicode = target_file.lower()
+                        find_path = None
+
                         # --------------------------------
-                        # .x のチェック
+                        # 探索ロジック
                         # --------------------------------
-                        elif len(inc_str_lower) >= 4 and \
-                             inc_str_lower[0] != '\x00' and \
-                             inc_str_lower[1] == '.' and \
-                             inc_str_lower[2] == 'x' and \
-                             inc_str_lower[3] == '\x00' and has_full_path:
-                            
-                            i += 2 # .x (2文字) 分進める
-                            ml = 1
+                        if out_folder and asset_index is not None:
+                            find_path = asset_index.get(target_file_unicode)
+                        elif out_folder:
+                            if search_folder1:
+                                find_path = search_file(search_folder1, target_file_unicode)
+
+                            if find_path is None and search_folder2:
+                                find_path = search_file(search_folder2, target_file_unicode)
+
 
                         # --------------------------------
-                        # パス/ファイル名抽出と書き換え処理
+                        # パス書き換えの実行
                         # --------------------------------
-                        if ml == 1:
-                            # TargetPath (フルパス部分) と TargetFile (ファイル名部分) を抽出
-                            
-                            # TargetFileの終端: i (現在は .ext の次)
-                            # TargetFileの始端: 'j' から '\\' が見つかるまで遡る (ファイル名)
-                            j_file_start = i - 1 # .ext の直前から開始
-                            while j_file_start >= 0 and data_buffer[j_file_start] != ord(b'\\'):
-                                j_file_start -= 1
-                            j_file_start += 1 # ファイル名の開始位置
-                            
-                            # TargetPathの終端: i-1
-                            # TargetPathの始端: 'j' から ':' が見つかるまで遡り、さらに1文字戻す
-                            j_path_start = j_file_start - 1
-                            while j_path_start >= 0 and data_buffer[j_path_start] != ord(b':'):
-                                j_path_start -= 1
-                            j_path_start -= 1 # ':' の前の文字（ドライブレターの 'C' など）
-                            if j_path_start < 0:
-                                j_path_start = 0 # バグ対策
-                            
-                            # TargetPath (C++の TargetPath)
-                            # i - j_path_start の長さで TargetPath を抽出
-                            path_bytes = data_buffer[j_path_start : i]
-                            target_path = path_bytes.decode('shift_jis', errors='ignore').rstrip('\x00')
-                            
-                            # TargetFile (C++の TargetFile)
-                            # i - j_file_start の長さで TargetFile を抽出
-                            file_bytes = data_buffer[j_file_start : i]
-                            target_file = file_bytes.decode('shift_jis', errors='ignore').rstrip('\x00')
-                            
-                            # PathListに追加
-                            path_list_result.append(target_path)
-                            
-                            log("----------------------------------------\r\n")
-                            log(f"パス{target_path}を書き換えます。\r\n")
-                            
-                            # --------------------------------
-                            # データ構造体の構築 (書き換え前のデータ保存)
-                            # --------------------------------
-                            
-                            # 1. 前回の書き換えから今回のパスの始端までのデータ (Main[Start]...Main[j-1])
-                            # C++: j-Start の長さのデータ
-                            data_chunk = data_buffer[start:j_path_start]
-                            create_data_list.append({
-                                'data': data_chunk,
-                                'path': '',
-                                'count': len(data_chunk)
-                            })
-                            
-                            # 2. 今回のパス文字列 (書き換え対象) の情報
-                            # C++: TargetPath, TargetFile
-                            target_file_unicode = target_file.lower()
-                            find_path = None
-                            
-                            # --------------------------------
-                            # 探索ロジック
-                            # --------------------------------
-                            if out_folder:
-                                if search_folder1:
-                                    find_path = search_file(search_folder1, target_file_unicode)
-                                
-                                if find_path is None and search_folder2:
-                                    find_path = search_file(search_folder2, target_file_unicode)
-                            
-                            
-                            # --------------------------------
-                            # パス書き換えの実行
-                            # --------------------------------
-                            
-                            if out_folder and find_path: # 見つかった場合 (書き換え)
-                                log(f"パス{find_path}に変更しました。\r\n----------------------------------------\r\n")
-                                
-                                # 新しいパスを Shift-JIS (CP_ACP) にエンコード
-                                new_path_bytes = find_path.encode('shift_jis', errors='ignore')
-                                
-                                # 元のパス (target_path) と新しいパス (find_path) の長さ比較
-                                len_original = len(path_bytes)
-                                len_new = len(new_path_bytes)
-                                
-                                # 3. 新しいパス情報
-                                create_data_list.append({
-                                    'data': new_path_bytes, # 新しいパスのバイト列
-                                    'path': find_path, # ログ用
-                                    'count': len_new
-                                })
-                                
-                                # 4. 長さ調整用のパディング (C++のロジック再現)
-                                diff = len_original - len_new
-                                if diff > 0: # 新しいパスが短い -> ヌル文字でパディング
-                                    padding = b'\x00' * diff
-                                    create_data_list.append({
-                                        'data': padding,
-                                        'path': '',
-                                        'count': diff
-                                    })
-                                elif diff < 0: # 新しいパスが長い -> 読み込み位置をずらす
-                                    i += -diff # iを巻き戻して次のループで長い部分を処理
-                                    # C++ではメインバッファの i の位置にヌル文字を追加しているが、
-                                    # Pythonでは i を移動させるだけで対応。
-                                
-                            
-                            elif out_folder and not find_path: # 見つからなかった場合
-                                # avi, wav のみ続行可能
-                                ext_lower = inc_str_lower[2:5]
-                                if ext_lower == "avi" or ext_lower == "wav":
-                                    log(f"ファイル{target_file}が見つかりませんでした。続行します。\r\n----------------------------------------\r\n")
-                                    # 元のパスをそのまま使用 (そのまま書き出す)
-                                    create_data_list.append({
-                                        'data': path_bytes,
-                                        'path': target_path,
-                                        'count': len(path_bytes)
-                                    })
-                                else:
-                                    log(f"ファイル{target_file}が見つかりませんでした。失敗しました。\r\n----------------------------------------\r\n")
-                                    return -1, ""
-
-                            
-                            # 次の検索開始位置を i に設定 (i は既に .ext の後になっている)
-                            start = i
-                            i -= 1 # ループの最後で i++ されるため、1つ戻す (C++の --i; //相殺//iの場所が先頭だから。 に相当)
-
-                i += 1
-            
-            # --------------------------------
-            # ファイルの末尾部分のデータをリストに追加
-            # --------------------------------
-            # C++: CreateDataNow->Count = i - Start; memcpy(CreateDataNow->Data, Main + Start, i - Start);
-            data_chunk_end = data_buffer[start:i]
-            create_data_list.append({
-                'data': data_chunk_end,
-                'path': '',
-                'count': len(data_chunk_end)
-            })
+
+                        if out_folder and find_path: # 見つかった場合 (書き換え)
+                            log(f"パス{find_path}に変更しました。\r\n----------------------------------------\r\n")
+
+                            # 新しいパスを Shift-JIS (CP_ACP) にエンコード
+                            new_path_bytes = find_path.encode('shift_jis', errors='ignore')
+
+                            # 元のパス (target_path) と新しいパス (find_path) の長さ比較
+                            len_original = len(path_bytes)
+                            len_new = len(new_path_bytes)
+
+                            # 3. 新しいパス情報
+                            create_data_list.append(new_path_bytes)
+
+                            # 4. 長さ調整用のパディング (C++のロジック再現)
+                            diff = len_original - len_new
+                            if diff > 0: # 新しいパスが短い -> ヌル文字でパディング
+                                create_data_list.append(b'\x00' * diff)
+                            elif diff < 0: # 新しいパスが長い -> 読み込み位置をずらす
+                                i += -diff # iを巻き戻して次のループで長い部分を処理
+                                # C++ではメインバッファの i の位置にヌル文字を追加しているが、
+                                # Pythonでは i を移動させるだけで対応。
+
+
+                        elif out_folder and not find_path: # 見つからなかった場合
+                            # avi, wav のみ続行可能
+                            if ext_lower == "avi" or ext_lower == "wav":
+                                log(f"ファイル{target_file}が見つかりませんでした。続行します。\r\n----------------------------------------\r\n")
+                                # 元のパスをそのまま使用 (そのまま書き出す)
+                                create_data_list.append(data_view[j_path_start:i])
+                            else:
+                                log(f"ファイル{target_file}が見つかりませんでした。失敗しました。\r\n----------------------------------------\r\n")
+                                return -1, ""
+
+
+                        # 次の検索開始位置を i に設定 (i は既に .ext の後になっている)
+                        start = i
+                        i -= 1 # ループの最後で i++ されるため、1つ戻す (C++の --i; //相殺//iの場所が先頭だから。 に相当)
+
+                    i += 1
+
+                # --------------------------------
+                # ファイルの末尾部分のデータをリストに追加
+                # --------------------------------
+                # C++: CreateDataNow->Count = i - Start; memcpy(CreateDataNow->Data, Main + Start, i - Start);
+                create_data_list.append(data_view[start:i])
+
+                # ----------------------------------------------------------------------
+                # ファイル書き出し (mmapを閉じる前に、リストをまとめて書き出す)
+                # ----------------------------------------------------------------------
+                if out_folder and out_file:
+                    try:
+                        with open(out_file, 'wb') as wfp:
+                            wfp.writelines(create_data_list)
+
+                        log(f"ファイル{out_file}を出力完了しました。\r\n")
+
+                    except Exception as e:
+                        log(f"ファイルの書き出しに失敗しました: {e}\r\n")
+                        return -1, ""
+
+            finally:
+                # mmapを閉じる前に、参照している memoryview をすべて解放する
+                create_data_list.clear()
+                data_view.release()
 
     except FileNotFoundError:
         log(f"エラー: PMMファイルが見つかりません: {current_read_file}\r\n")
@@ -341,30 +409,15 @@ def pmm_parse(
     except Exception as e:
         log(f"解析中に予期せぬエラーが発生しました: {e}\r\n")
         return -1, ""
-
-    # ----------------------------------------------------------------------
-    # ファイル書き出し
-    # ----------------------------------------------------------------------
-    if out_folder and out_file:
-        try:
-            with open(out_file, 'wb') as wfp:
-                for item in create_data_list:
-                    wfp.write(item['data'])
-            
-            log(f"ファイル{out_file}を出力完了しました。\r\n")
-        
-        except Exception as e:
-            log(f"ファイルの書き出しに失敗しました: {e}\r\n")
-            return -1, ""
-
-    # ----------------------------------------------------------------------
-    # 後処理 (workingファイルの削除)
-    # ----------------------------------------------------------------------
-    if temp_working_file and out_folder:
-        try:
-            os.remove(temp_working_file)
-        except OSError as e:
-            log(f"working.pmmの削除に失敗しました: {e}\r\n")
+    finally:
+        # ------------------------------------------------------------------
+        # 後処理 (workingファイルの削除。途中で失敗した場合も削除する)
+        # ------------------------------------------------------------------
+        if temp_working_file:
+            try:
+                os.remove(temp_working_file)
+            except OSError as e:
+                log(f"{temp_working_file.name}の削除に失敗しました: {e}\r\n")
 
 
     # PathListの文字列化
@@ -372,44 +425,281 @@ def pmm_parse(
 
     return 0, path_list_str
 
+# ==============================================================================
+# 参照一覧: PMMファイルが参照しているファイルを書き換えずに列挙する
+# ==============================================================================
+
+# PMMファイル内の1つの参照
+class PmmReference(NamedTuple):
+    offset: int # パスの始端 (ファイル先頭からのバイト位置)
+    length: int # パスのバイト数 (Shift_JIS)
+    extension: str # 拡張子 (小文字, 'pmd', 'x', 'bmp', 'wav', 'avi')
+    path: str # フルパス
+    file_name: str # ファイル名
+
+
+def iter_pmm_references(read_file: str) -> Iterator[PmmReference]:
+    """
+    PMMファイルが参照しているファイルのパスを順に返す。書き換え用のバッファは作らない。
+
+    判定は pmm_parse と同じで、out_folder を None にしたときのパスリストと同じ順序になる。
+
+    :param read_file: 入力PMMファイルのパス。
+    :return: PmmReference を返すイテレーター。
+    """
+    with open(read_file, 'rb') as rfp, _map_file(rfp) as data_buffer:
+        data_len = len(data_buffer)
+        i = data_buffer.find(b'.')
+        while 0 <= i < data_len:
+            ref = _match_reference(data_buffer, i, data_len)
+            if ref is None:
+                i = data_buffer.find(b'.', i + 1)
+                continue
+            path_start, file_start, end, ext = ref
+            path = data_buffer[path_start:end].decode('shift_jis', errors='ignore').rstrip('\x00')
+            file_name = data_buffer[file_start:end].decode('shift_jis', errors='ignore').rstrip('\x00')
+            yield PmmReference(path_start, end - path_start, ext, path, file_name)
+            i = data_buffer.find(b'.', end)
+
+
+# ==============================================================================
+# バッチ処理: 複数のPMMファイルをプロセスプールで並列に処理する
+# ==============================================================================
+
+# バッチ処理の1ファイル分の結果
+class BatchResult(NamedTuple):
+    read_file: str # 入力PMMファイルのパス
+    out_folder: Optional[str] # 出力先フォルダのパス
+    code: int # 結果コード (0: 成功, -1: 失敗)
+    paths: str # パスリスト (str)
+    logs: List[str] # このファイルのログ
+    seconds: float # 処理時間 (秒)
+
+
+# ワーカープロセスで共有する探索フォルダの索引
+_worker_asset_index: Optional[Dict[str, str]] = None
+
+
+def _init_worker(asset_index: Dict[str, str]):
+    """ワーカープロセスの初期化 (索引はプロセスごとに1回だけ受け取る)"""
+    global _worker_asset_index
+    _worker_asset_index = asset_index
+
+
+def _parse_one(read_file: str, out_folder: Optional[str]) -> BatchResult:
+    """1ファイル分の pmm_parse を実行し、ログを集めて返す"""
+    logs: List[str] = []
+    t0 = time.perf_counter()
+    try:
+        code, paths = pmm_parse(read_file, out_folder, None, None,
+                                asset_index=_worker_asset_index, logs=logs)
+    except Exception as e:
+        logs.append(f"解析中に予期せぬエラーが発生しました: {e}\r\n")
+        code, paths = -1, ""
+    return BatchResult(read_file, out_folder, code, paths, logs, time.perf_counter() - t0)
+
+
+def _glob_base(pattern: str) -> str:
+    """ワイルドカードを含まない先頭部分のフォルダを返す (出力フォルダの構成に使う)"""
+    parts = pathlib.Path(pattern).parts
+    base = []
+    for part in parts[:-1]:
+        if glob.has_magic(part):
+            break
+        base.append(part)
+    return str(pathlib.Path(*base)) if base else '.'
+
+
+def collect_pmm_files(patterns: List[str]) -> List[tuple[str, str]]:
+    """
+    フォルダ/ワイルドカード/ファイルの指定から、PMMファイルの一覧を作る。
+
+    フォルダを指定した場合はその下を再帰的に探す。ワイルドカードは '**' も使える。
+
+    :param patterns: フォルダ、ワイルドカード、ファイルパスのリスト。
+    :return: [(PMMファイルのパス, 出力先での相対フォルダ)] のリスト (重複は除く)。
+    """
+    files: List[tuple[str, str]] = []
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            base = pattern
+            matches = sorted(str(p) for p in pathlib.Path(pattern).rglob('*')
+                             if p.suffix.lower() == '.pmm')
+        else:
+            base = _glob_base(pattern)
+            matches = sorted(glob.glob(pattern, recursive=True))
+        for match in matches:
+            if not os.path.isfile(match) or pathlib.Path(match).suffix.lower() != '.pmm':
+                continue
+            key = os.path.normcase(os.path.abspath(match))
+            if key in seen:
+                continue
+            seen.add(key)
+            files.append((match, os.path.dirname(os.path.relpath(match, base))))
+    return files
+
+
+def pmm_parse_batch(
+    patterns: List[str],
+    out_folder: Optional[str],
+    search_folder1: Optional[str],
+    search_folder2: Optional[str],
+    jobs: Optional[int] = None
+) -> List[BatchResult]:
+    """
+    複数のPMMファイルをプロセスプールで並列に解析・書き換えする。
+
+    探索フォルダは最初に1回だけ索引化し、全ワーカーで共有する。
+    出力は out_folder の下に、入力フォルダからの相対的な構成を保って書き出すので、
+    同じ名前のPMMファイルがあっても上書きし合わない。
+
+    :param patterns: 入力のフォルダ、ワイルドカード、ファイルパスのリスト。
+    :param out_folder: 出力先フォルダのパス。Noneの場合は書き換え・出力を行わない。
+    :param search_folder1: 探索フォルダ1。
+    :param search_folder2: 探索フォルダ2。
+    :param jobs: ワーカープロセス数。Noneの場合はCPU数。1の場合はプロセスを使わない。
+    :return: 入力順に並べた BatchResult のリスト。
+    """
+    files = collect_pmm_files(patterns)
+    asset_index = build_asset_index(search_folder1, search_folder2) if out_folder else {}
+
+    tasks = []
+    for read_file, rel_dir in files:
+        task_out = str(pathlib.Path(out_folder) / rel_dir) if out_folder else None
+        if task_out:
+            # 複数のワーカーが同時にフォルダを作らないよう、先に作っておく
+            os.makedirs(task_out, exist_ok=True)
+        tasks.append((read_file, task_out))
+
+    if jobs == 1 or len(tasks) <= 1:
+        _init_worker(asset_index)
+        return [_parse_one(read_file, task_out) for read_file, task_out in tasks]
+
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs, initializer=_init_worker, initargs=(asset_index,)) as executor:
+        futures = [executor.submit(_parse_one, read_file, task_out) for read_file, task_out in tasks]
+        return [future.result() for future in futures]
+
+
+def _inventory_one(read_file: str) -> tuple[str, List[PmmReference], Optional[str]]:
+    """1ファイル分の参照一覧を読み、(PMMファイルのパス, 参照のリスト, エラーメッセージ) を返す"""
+    try:
+        return read_file, list(iter_pmm_references(read_file)), None
+    except Exception as e:
+        return read_file, [], str(e)
+
+
+def print_inventory(
+    patterns: List[str],
+    search_folder1: Optional[str],
+    search_folder2: Optional[str],
+    quiet: bool = False,
+    jobs: Optional[int] = None
+):
+    """
+    PMMファイルの参照一覧をタブ区切りで表示する。
+
+    探索フォルダを指定した場合は、そこに見つからないファイルの行に MISSING を付け、
+    見つからないファイルがあれば終了コード1で終了する。
+
+    :param patterns: 入力のフォルダ、ワイルドカード、ファイルパスのリスト。
+    :param search_folder1: 探索フォルダ1。
+    :param search_folder2: 探索フォルダ2。
+    :param quiet: Trueの場合は MISSING の行と集計だけを表示する。
+    :param jobs: ワーカープロセス数。Noneの場合はCPU数。1の場合はプロセスを使わない。
+    """
+    t0 = time.perf_counter()
+    files = collect_pmm_files(patterns)
+    if not files:
+        print("PMMファイルが見つかりませんでした。")
+        sys.exit(1)
+
+    check = bool(search_folder1 or search_folder2)
+    asset_index = build_asset_index(search_folder1, search_folder2) if check else {}
+
+    ref_count = 0
+    missing_count = 0
+    read_files = [read_file for read_file, _ in files]
+    if jobs == 1 or len(read_files) <= 1:
+        executor = None
+        results = map(_inventory_one, read_files)
+    else:
+        # 参照の読み出しはワーカーで行い、欠落の判定と表示は入力順にここで行う
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+        results = executor.map(_inventory_one, read_files)
+    try:
+        for read_file, refs, error in results:
+            for ref in refs:
+                ref_count += 1
+                missing = check and ref.file_name.lower() not in asset_index
+                if missing:
+                    missing_count += 1
+                if missing or not quiet:
+                    mark = "\tMISSING" if missing else ""
+                    print(f"{read_file}\t{ref.offset}\t{ref.extension}\t{ref.path}{mark}")
+            if error is not None:
+                print(f"ERROR: {read_file}: {error}")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    elapsed = time.perf_counter() - t0
+    print("========================================")
+    print(f"PMMファイル: {len(files)}, 参照: {ref_count}, 見つからない参照: {missing_count}, 時間: {elapsed:.2f}秒")
+    if missing_count:
+        sys.exit(1)
+
+
 # ----------------------------------------------------------------------
 # 実行例
+#   ppm_parse.py -o 出力フォルダ -1 探索フォルダ1 [-2 探索フォルダ2] [-j 並列数] PMMファイル/フォルダ ...
+#   ppm_parse.py -1 探索フォルダ1 [-2 探索フォルダ2] PMMファイル/フォルダ ...   (参照一覧と欠落チェック)
 # ----------------------------------------------------------------------
+def main(args: List[str]):
+    parser = argparse.ArgumentParser(
+        description="PMMファイル内のパスを探索フォルダに基づいて書き換える (複数ファイルを並列処理)。"
+    )
+    parser.add_argument('inputs', nargs='+',
+                        help='PMMファイル、フォルダ、またはワイルドカード (例: "projects/**/*.pmm")')
+    parser.add_argument('-o', '--out', default=None,
+                        help='出力先フォルダ。省略した場合は書き換えずに参照の一覧を表示する'
+                             ' (探索フォルダを指定すると、見つからないファイルに MISSING を付ける)。')
+    parser.add_argument('-1', '--search1', default=None, help='探索フォルダ1')
+    parser.add_argument('-2', '--search2', default=None, help='探索フォルダ2')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='並列に処理するプロセス数 (デフォルトはCPU数)')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='ファイルごとのログを表示せず、集計だけを表示する。')
+    parsed_args = parser.parse_args(args)
+
+    if not parsed_args.out:
+        print_inventory(parsed_args.inputs, parsed_args.search1, parsed_args.search2, parsed_args.quiet,
+                        parsed_args.jobs)
+        return
+
+    t0 = time.perf_counter()
+    results = pmm_parse_batch(parsed_args.inputs, parsed_args.out,
+                              parsed_args.search1, parsed_args.search2, parsed_args.jobs)
+    elapsed = time.perf_counter() - t0
+
+    if not results:
+        print("PMMファイルが見つかりませんでした。")
+        sys.exit(1)
+
+    for result in results:
+        if not parsed_args.quiet:
+            print(f"======== {result.read_file} ({result.seconds:.2f}秒)")
+            print(''.join(result.logs).replace('\r\n', '\n'), end='')
+
+    failed = [result for result in results if result.code != 0]
+    print("========================================")
+    print(f"処理したファイル: {len(results)}, 成功: {len(results) - len(failed)}, 失敗: {len(failed)}, 時間: {elapsed:.2f}秒")
+    for result in failed:
+        print(f"  失敗: {result.read_file}")
+    if failed:
+        sys.exit(1)
+
+
 if __name__ == '__main__':
-    # この部分は実行環境に合わせて変更してください
-    # 存在しないファイルとフォルダを指定して、動作テストを行ってください。
-    
-    # テスト用のダミーファイルを作成 (実際にはPMMファイルを準備してください)
-    # PMMファイルはバイナリファイルなので、このテストコードは単なる実行例です。
-    
-    # 仮想的なファイルパス
-    DUMMY_READ_FILE = "test_input.pmm"
-    DUMMY_OUT_FOLDER = "test_output"
-    DUMMY_SEARCH_FOLDER1 = "search_dir_1"
-    DUMMY_SEARCH_FOLDER2 = "search_dir_2"
-    
-    # テストディレクトリのセットアップ
-    os.makedirs(DUMMY_SEARCH_FOLDER1, exist_ok=True)
-    os.makedirs(DUMMY_SEARCH_FOLDER2, exist_ok=True)
-    os.makedirs(DUMMY_OUT_FOLDER, exist_ok=True)
-    
-    # pmmParse のロジックはバイナリデータ内のパス文字列のバイト操作に大きく依存しているため、
-    # 実際のPMMファイルと依存ファイルを準備してテストする必要があります。
-    
-    # 簡単な実行例
-    # result_code, paths = pmm_parse(
-    #     read_file=DUMMY_READ_FILE, 
-    #     out_folder=DUMMY_OUT_FOLDER,
-    #     search_folder1=DUMMY_SEARCH_FOLDER1, 
-    #     search_folder2=DUMMY_SEARCH_FOLDER2
-    # )
-    
-    # print(f"\n--- 実行結果 ---")
-    # print(f"結果コード: {result_code}")
-    # print(f"検出されたパス: {paths}")
-    
-    # 実行後、生成されたディレクトリを削除したい場合はコメントを外す
-    # shutil.rmtree(DUMMY_OUT_FOLDER)
-    # shutil.rmtree(DUMMY_SEARCH_FOLDER1)
-    # shutil.rmtree(DUMMY_SEARCH_FOLDER2)
-    pass
+    main(sys.argv[1:])
@@ -0,0 +1,572 @@
+# videotools.py
+#
+# 動画ファイルの判定と情報 (幅, 高さ, FPS, フレーム数, 長さ)
+#   ファイルの先頭の数百バイトだけを読み、コンテナ形式と画像形式のシグネチャ (マジックバイト) から
+#   動画か画像かを決める。どちらとも決められないファイルだけを、Pillow や OpenCV で開いて調べる。
+#   MP4/MOV, Matroska/WebM, AVI はコンテナのヘッダーだけを読んで情報を返す (デコーダーは使わない)。
+#   フレーム数はコンテナに記録された値 (MP4 の stsz, AVI の strh/dmlh, Matroska の統計タグ) を使う。
+#   scan_videos は複数のプロセスで調べ、止まったファイル (壊れたファイル, 応答のないネットワーク) の
+#   プロセスは時間切れで終了させて作り直す。
+
+import collections
+import multiprocessing
+import multiprocessing.connection
+import os
+import struct
+import time
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional
+import imagetools
+
+# 最初に読むバイト数 (MPEG-TS は 188 バイトのパケットの先頭を3つ確かめる)
+SNIFF_SIZE = 512
+
+# 判定の結果
+VIDEO = 'video'
+IMAGE = 'image'
+
+# ISO BMFF (MP4, MOV, 3GP など) の ftyp のブランドのうち、静止画の形式 (HEIF, AVIF)
+IMAGE_BRANDS = frozenset([b'avif', b'heic', b'heix', b'heim', b'heis', b'mif1', b'mif2'])
+
+# ftyp のない古い QuickTime (MOV) の先頭のアトム
+QUICKTIME_ATOMS = frozenset([b'moov', b'mdat', b'free', b'skip', b'wide', b'pnot'])
+
+# 先頭のシグネチャで決まる動画のコンテナ
+VIDEO_SIGNATURES = [
+    b'\x1a\x45\xdf\xa3',                    # EBML (Matroska, WebM)
+    b'FLV\x01',                             # Flash Video
+    b'\x00\x00\x01\xba',                    # MPEG-PS (VOB, MPG)
+    b'\x30\x26\xb2\x75\x8e\x66\xcf\x11',    # ASF (WMV)
+]
+
+# MPEG-TS のパケットの長さ (M2TS は先頭に 4 バイトのタイムコードが付く)
+TS_PACKET_SIZE = 188
+M2TS_PACKET_SIZE = 192
+
+
+def _is_transport_stream(head: bytes) -> bool:
+    # 同期バイト 0x47 がパケットの長さごとに並んでいる
+    for offset, size in ((0, TS_PACKET_SIZE), (4, M2TS_PACKET_SIZE)):
+        positions = range(offset, len(head), size)[:3]
+        if len(positions) == 3 and all(head[p] == 0x47 for p in positions):
+            return True
+    return False
+
+
+def classify(head: bytes) -> Optional[str]:
+    """
+    ファイルの先頭のバイト列から、動画 (VIDEO) か画像 (IMAGE) かを返す。
+    シグネチャで決められない場合は None を返す。
+    """
+    if head[4:8] == b'ftyp':
+        return IMAGE if head[8:12] in IMAGE_BRANDS else VIDEO
+    if head[4:8] in QUICKTIME_ATOMS:
+        return VIDEO
+    if head[:4] == b'RIFF' and head[8:12] in (b'AVI ', b'AVIX'):
+        return VIDEO
+    if any(head.startswith(signature) for signature in VIDEO_SIGNATURES):
+        return VIDEO
+    if _is_transport_stream(head):
+        return VIDEO
+    if imagetools.find_sniffer(head) is not None:
+        return IMAGE
+    return None
+
+
+def sniff_kind(path: str) -> Optional[str]:
+    """ファイルの先頭だけを読み、動画 (VIDEO) か画像 (IMAGE) かを返す。決められない場合は None を返す。"""
+    with open(path, 'rb') as f:
+        return classify(f.read(SNIFF_SIZE))
+
+
+# 動画の情報 (mediacache.KINDS['video'] と同じ順)
+VideoInfo = collections.namedtuple('VideoInfo', ['width', 'height', 'fps', 'frames', 'duration'])
+
+
+# ==============================================================================
+# MP4, MOV (ISO BMFF)
+# ==============================================================================
+
+# 子のボックスを持つボックス (映像のトラックを探すのに通るものだけ)
+MP4_CONTAINERS = frozenset([b'moov', b'trak', b'mdia', b'minf', b'stbl'])
+
+
+def _iter_boxes(f: BinaryIO, start: int, end: int) -> Iterator[tuple[bytes, int, int]]:
+    """start から end までのボックスを (種類, データの開始位置, ボックスの終了位置) で返す。中身は読まない"""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        size, kind = struct.unpack('>I4s', f.read(8))
+        data = pos + 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            data += 8
+        elif size == 0:
+            # ファイルの最後まで
+            size = end - pos
+        if size < data - pos:
+            raise ValueError(f"ボックスのサイズが不正です: {kind!r}")
+        yield kind, data, min(pos + size, end)
+        pos += size
+
+
+def _find_box(f: BinaryIO, start: int, end: int, kind: bytes) -> Optional[tuple[int, int]]:
+    for box_kind, data, box_end in _iter_boxes(f, start, end):
+        if box_kind == kind:
+            return data, box_end
+    return None
+
+
+def _read_at(f: BinaryIO, pos: int, size: int) -> bytes:
+    f.seek(pos)
+    data = f.read(size)
+    if len(data) < size:
+        raise ValueError("ファイルが途中で終わっています")
+    return data
+
+
+def _read_mp4_track(f: BinaryIO, start: int, end: int) -> Optional[VideoInfo]:
+    """trak ボックスが映像のトラックなら、その情報を返す"""
+    boxes = {}
+
+    def collect(start, end):
+        for kind, data, box_end in _iter_boxes(f, start, end):
+            if kind in MP4_CONTAINERS:
+                collect(data, box_end)
+            elif kind in (b'hdlr', b'mdhd', b'stsd', b'stsz', b'stz2') and kind not in boxes:
+                boxes[kind] = data
+    collect(start, end)
+
+    if b'hdlr' not in boxes or _read_at(f, boxes[b'hdlr'] + 8, 4) != b'vide':
+        return None
+    if b'mdhd' not in boxes or b'stsd' not in boxes:
+        return None
+
+    version = _read_at(f, boxes[b'mdhd'], 1)[0]
+    if version == 1:
+        timescale, duration = struct.unpack('>IQ', _read_at(f, boxes[b'mdhd'] + 20, 12))
+    else:
+        timescale, duration = struct.unpack('>II', _read_at(f, boxes[b'mdhd'] + 12, 8))
+
+    # 最初のサンプル記述 (VisualSampleEntry) の幅と高さ
+    width, height = struct.unpack('>HH', _read_at(f, boxes[b'stsd'] + 8 + 32, 4))
+
+    # サンプル (フレーム) の数
+    if b'stsz' in boxes:
+        frames = struct.unpack('>I', _read_at(f, boxes[b'stsz'] + 8, 4))[0]
+    elif b'stz2' in boxes:
+        frames = struct.unpack('>I', _read_at(f, boxes[b'stz2'] + 8, 4))[0]
+    else:
+        return None
+
+    # フラグメント化された MP4 (moof にサンプルがある) や長さが不明なものは分からない
+    if frames == 0 or timescale == 0 or duration in (0, 0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF):
+        return None
+    seconds = duration / timescale
+    return VideoInfo(width, height, frames / seconds, frames, seconds)
+
+
+def read_mp4(f: BinaryIO, size: int) -> Optional[VideoInfo]:
+    """MP4/MOV の moov から、最初の映像トラックの情報を返す (moov がファイルの最後にあってもよい)"""
+    moov = _find_box(f, 0, size, b'moov')
+    if moov is None:
+        return None
+    for kind, data, end in _iter_boxes(f, *moov):
+        if kind == b'trak':
+            info = _read_mp4_track(f, data, end)
+            if info is not None:
+                return info
+    return None
+
+
+# ==============================================================================
+# Matroska, WebM (EBML)
+# ==============================================================================
+
+MKV_SEGMENT = 0x18538067
+MKV_SEEK_HEAD = 0x114D9B74
+MKV_SEEK = 0x4DBB
+MKV_SEEK_ID = 0x53AB
+MKV_SEEK_POSITION = 0x53AC
+MKV_INFO = 0x1549A966
+MKV_TIMESTAMP_SCALE = 0x2AD7B1
+MKV_DURATION = 0x4489
+MKV_TRACKS = 0x1654AE6B
+MKV_TRACK_ENTRY = 0xAE
+MKV_TRACK_UID = 0x73C5
+MKV_TRACK_TYPE = 0x83
+MKV_DEFAULT_DURATION = 0x23E383
+MKV_VIDEO = 0xE0
+MKV_PIXEL_WIDTH = 0xB0
+MKV_PIXEL_HEIGHT = 0xBA
+MKV_TAGS = 0x1254C367
+MKV_TAG = 0x7373
+MKV_TARGETS = 0x63C0
+MKV_TAG_TRACK_UID = 0x63C5
+MKV_SIMPLE_TAG = 0x67C8
+MKV_TAG_NAME = 0x45A3
+MKV_TAG_STRING = 0x4487
+MKV_CLUSTER = 0x1F43B675
+
+# 中身を読む要素の最大のサイズ (Info, Tracks, Tags などのヘッダー部分は小さい)
+MKV_MAX_ELEMENT_SIZE = 16 * 1024 * 1024
+
+
+def _vint_length(first: int) -> int:
+    # 先頭のバイトの最初の1のビットの位置が長さ
+    for length in range(1, 9):
+        if first & (0x80 >> (length - 1)):
+            return length
+    raise ValueError("EBML の可変長整数が不正です")
+
+
+def _decode_vint(data: bytes, keep_marker: bool) -> Optional[int]:
+    """EBML の可変長整数。keep_marker が真なら長さのビットを残す (要素の ID)。すべて1のサイズ (不明) は None"""
+    value = int.from_bytes(data, 'big')
+    if keep_marker:
+        return value
+    bits = 7 * len(data)
+    value &= (1 << bits) - 1
+    return None if value == (1 << bits) - 1 else value
+
+
+def _read_element_header(f: BinaryIO) -> tuple[int, Optional[int]]:
+    header = []
+    for keep_marker in (True, False):
+        first = f.read(1)
+        if not first:
+            raise EOFError
+        header.append(_decode_vint(first + f.read(_vint_length(first[0]) - 1), keep_marker))
+    return header[0], header[1]
+
+
+def _iter_elements(f: BinaryIO, start: int, end: int) -> Iterator[tuple[int, int, int]]:
+    """start から end までの要素を (ID, データの開始位置, データの終了位置) で返す。サイズが不明な要素は end まで"""
+    pos = start
+    while pos < end:
+        f.seek(pos)
+        try:
+            element_id, size = _read_element_header(f)
+        except EOFError:
+            return
+        data = f.tell()
+        data_end = end if size is None else min(data + size, end)
+        yield element_id, data, data_end
+        pos = data_end
+
+
+def _parse_children(data: bytes) -> dict[int, list[bytes]]:
+    """要素の中身のバイト列から、子の要素の ID ごとにデータのリストを返す"""
+    children = collections.defaultdict(list)
+    pos = 0
+    while pos < len(data):
+        header = []
+        for keep_marker in (True, False):
+            length = _vint_length(data[pos])
+            header.append(_decode_vint(data[pos:pos + length], keep_marker))
+            pos += length
+        element_id, size = header
+        size = len(data) - pos if size is None else size
+        children[element_id].append(data[pos:pos + size])
+        pos += size
+    return children
+
+
+def _read_children(f: BinaryIO, start: int, end: int) -> dict[int, list[bytes]]:
+    if end - start > MKV_MAX_ELEMENT_SIZE:
+        raise ValueError("要素が大きすぎます")
+    return _parse_children(_read_at(f, start, end - start))
+
+
+def _uint(data: bytes) -> int:
+    return int.from_bytes(data, 'big')
+
+
+def _float(data: bytes) -> float:
+    return struct.unpack('>f' if len(data) == 4 else '>d', data)[0] if data else 0.0
+
+
+def _frame_count_tags(tags: dict[int, list[bytes]]) -> dict[Optional[int], int]:
+    """Tags の統計タグ NUMBER_OF_FRAMES を、トラックの UID ごとに返す (対象のトラックがないタグは None)"""
+    counts = {}
+    for tag in tags.get(MKV_TAG, []):
+        tag = _parse_children(tag)
+        targets = _parse_children(tag[MKV_TARGETS][0]) if MKV_TARGETS in tag else {}
+        uid = _uint(targets[MKV_TAG_TRACK_UID][0]) if MKV_TAG_TRACK_UID in targets else None
+        for simple in tag.get(MKV_SIMPLE_TAG, []):
+            simple = _parse_children(simple)
+            name = simple.get(MKV_TAG_NAME, [b''])[0]
+            value = simple.get(MKV_TAG_STRING, [b''])[0]
+            if name == b'NUMBER_OF_FRAMES' and value.strip().isdigit():
+                counts[uid] = int(value)
+    return counts
+
+
+def read_matroska(f: BinaryIO, size: int) -> Optional[VideoInfo]:
+    """
+    Matroska/WebM の Info, Tracks, Tags から、最初の映像トラックの情報を返す。
+    Cluster (映像のデータ) は読まず、Cluster より後ろにある要素は SeekHead の位置から読む。
+    フレーム数は統計タグ NUMBER_OF_FRAMES があればその値、なければ長さと DefaultDuration から計算する。
+    """
+    elements = _iter_elements(f, 0, size)
+    segment = next((e for e in elements if e[0] == MKV_SEGMENT), None)
+    if segment is None:
+        return None
+    _, segment_start, segment_end = segment
+
+    found = {}
+    positions = {}
+    for element_id, data, end in _iter_elements(f, segment_start, segment_end):
+        if element_id == MKV_CLUSTER:
+            break
+        if element_id == MKV_SEEK_HEAD:
+            for seek in _read_children(f, data, end).get(MKV_SEEK, []):
+                seek = _parse_children(seek)
+                if MKV_SEEK_ID in seek and MKV_SEEK_POSITION in seek:
+                    positions.setdefault(_uint(seek[MKV_SEEK_ID][0]), segment_start + _uint(seek[MKV_SEEK_POSITION][0]))
+        elif element_id in (MKV_INFO, MKV_TRACKS, MKV_TAGS) and element_id not in found:
+            found[element_id] = _read_children(f, data, end)
+    for element_id in (MKV_INFO, MKV_TRACKS, MKV_TAGS):
+        if element_id not in found and element_id in positions:
+            element = next(_iter_elements(f, positions[element_id], segment_end), None)
+            if element is not None and element[0] == element_id:
+                found[element_id] = _read_children(f, element[1], element[2])
+    if MKV_INFO not in found or MKV_TRACKS not in found:
+        return None
+
+    info = found[MKV_INFO]
+    scale = _uint(info[MKV_TIMESTAMP_SCALE][0]) if MKV_TIMESTAMP_SCALE in info else 1000000
+    seconds = _float(info[MKV_DURATION][0]) * scale / 1e9 if MKV_DURATION in info else 0.0
+
+    for entry in found[MKV_TRACKS].get(MKV_TRACK_ENTRY, []):
+        entry = _parse_children(entry)
+        if MKV_TRACK_TYPE not in entry or _uint(entry[MKV_TRACK_TYPE][0]) != 1 or MKV_VIDEO not in entry:
+            continue
+        video = _parse_children(entry[MKV_VIDEO][0])
+        width = _uint(video[MKV_PIXEL_WIDTH][0])
+        height = _uint(video[MKV_PIXEL_HEIGHT][0])
+        uid = _uint(entry[MKV_TRACK_UID][0]) if MKV_TRACK_UID in entry else None
+        frame_ns = _uint(entry[MKV_DEFAULT_DURATION][0]) if MKV_DEFAULT_DURATION in entry else 0
+
+        counts = _frame_count_tags(found.get(MKV_TAGS, {}))
+        frames = counts.get(uid, counts.get(None))
+        if frames is None and frame_ns and seconds:
+            frames = round(seconds * 1e9 / frame_ns)
+        if not frames or not seconds:
+            return None
+        fps = 1e9 / frame_ns if frame_ns else frames / seconds
+        return VideoInfo(width, height, fps, frames, seconds)
+    return None
+
+
+# ==============================================================================
+# AVI
+# ==============================================================================
+
+def _iter_chunks(f: BinaryIO, start: int, end: int) -> Iterator[tuple[bytes, int, int]]:
+    """RIFF のチャンクを (ID, データの開始位置, データの終了位置) で返す。LIST の ID は 'LIST' の後のリストの種類"""
+    pos = start
+    while pos + 8 <= end:
+        chunk_id, size = struct.unpack('<4sI', _read_at(f, pos, 8))
+        data = pos + 8
+        if chunk_id == b'LIST':
+            chunk_id = _read_at(f, data, 4)
+            data += 4
+        yield chunk_id, data, min(pos + 8 + size, end)
+        # チャンクは2バイト境界にそろえる
+        pos += 8 + size + (size & 1)
+
+
+def read_avi(f: BinaryIO, size: int) -> Optional[VideoInfo]:
+    """AVI の hdrl (avih, strh, strf, dmlh) から、最初の映像ストリームの情報を返す"""
+    riff_end = min(size, 8 + struct.unpack('<I', _read_at(f, 4, 4))[0])
+    hdrl = next(((data, end) for chunk_id, data, end in _iter_chunks(f, 12, riff_end) if chunk_id == b'hdrl'), None)
+    if hdrl is None:
+        return None
+    avih = None
+    stream = None
+    total_frames = None
+    for chunk_id, data, end in _iter_chunks(f, *hdrl):
+        if chunk_id == b'avih':
+            avih = struct.unpack('<10I', _read_at(f, data, 40))
+        elif chunk_id == b'strl' and stream is None:
+            strl = {kind: (d, e) for kind, d, e in _iter_chunks(f, data, end)}
+            if b'strh' in strl and _read_at(f, strl[b'strh'][0], 4) == b'vids':
+                strh = struct.unpack('<4s4sIHHIIIII', _read_at(f, strl[b'strh'][0], 36))
+                bitmap = _read_at(f, strl[b'strf'][0], 12) if b'strf' in strl else None
+                stream = (strh, bitmap)
+        elif chunk_id == b'odml':
+            dmlh = dict((kind, d) for kind, d, _ in _iter_chunks(f, data, end)).get(b'dmlh')
+            if dmlh is not None:
+                total_frames = struct.unpack('<I', _read_at(f, dmlh, 4))[0]
+    if stream is None:
+        return None
+
+    strh, bitmap = stream
+    scale, rate, length = strh[6], strh[7], strh[9]
+    if bitmap is not None:
+        width, height = struct.unpack('<ii', bitmap[4:12])
+    elif avih is not None:
+        width, height = avih[8], avih[9]
+    else:
+        return None
+    # 1GB を超える OpenDML の AVI は、ファイル全体のフレーム数が dmlh にある
+    frames = total_frames or length or (avih[4] if avih else 0)
+    if not frames or not scale or not rate:
+        return None
+    fps = rate / scale
+    return VideoInfo(width, abs(height), fps, frames, frames / fps)
+
+
+# ==============================================================================
+# 判定と読み込み
+# ==============================================================================
+
+def read_video_info(path: str) -> Optional[VideoInfo]:
+    """
+    MP4/MOV, Matroska/WebM, AVI のヘッダーだけを読み、最初の映像トラックの情報を返す。
+    それ以外の形式や、ヘッダーから分からない場合 (フラグメント化された MP4 など) は None を返す。
+    """
+    with open(path, 'rb') as f:
+        head = f.read(SNIFF_SIZE)
+        size = os.fstat(f.fileno()).st_size
+        if head[4:8] == b'ftyp' or head[4:8] in QUICKTIME_ATOMS:
+            reader = read_mp4
+        elif head.startswith(b'\x1a\x45\xdf\xa3'):
+            reader = read_matroska
+        elif head[:4] == b'RIFF' and head[8:12] == b'AVI ':
+            reader = read_avi
+        else:
+            return None
+        try:
+            return reader(f, size)
+        except (struct.error, ValueError, IndexError, KeyError, EOFError):
+            return None
+
+
+# ==============================================================================
+# 複数のプロセスで調べる
+# ==============================================================================
+
+def _probe_worker(conn: multiprocessing.connection.Connection, probe: Callable) -> None:
+    # パスを受け取って probe の結果 (または例外) を返す。None を受け取ったら終わる
+    while True:
+        path = conn.recv()
+        if path is None:
+            return
+        try:
+            result = probe(path)
+        except Exception as e:
+            result = e
+        try:
+            conn.send(result)
+        except Exception as e:
+            # pickle できない例外 (OpenCV の例外など) は文字列にして返す
+            conn.send(RuntimeError(f"{type(result).__name__}: {result}"))
+
+
+class _Worker:
+    """1ファイルずつ調べるプロセス。時間切れの場合は kill() で終了させる"""
+
+    def __init__(self, probe: Callable):
+        self.conn, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_probe_worker, args=(child, probe), daemon=True)
+        self.process.start()
+        child.close()
+        self.task = None
+        self.deadline = None
+
+    def start(self, task: list, timeout: Optional[float]) -> None:
+        self.task = task
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+        self.conn.send(task[0])
+
+    def close(self) -> None:
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.kill()
+        self.conn.close()
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+
+
+def scan_videos(paths: Iterable[str], probe: Callable, jobs: Optional[int] = None,
+                timeout: Optional[float] = 60, ordered: bool = False) -> Iterator[tuple[str, object]]:
+    """
+    paths のファイルを jobs 個のプロセスで probe(パス) で調べ、(パス, 結果) を返す。
+    probe が例外を出したファイルは結果の代わりに例外を返す。
+    timeout 秒で終わらないファイルは TimeoutError を返し、そのプロセスを終了させて新しいプロセスを作る。
+    probe はプロセスに渡すので、モジュールの関数にすること (Windows では lambda は使えない)。
+    結果は終わった順に返し、ordered が真の場合は paths の順に返す。
+    """
+    jobs = jobs or os.cpu_count() or 1
+    limit = jobs * 4
+    paths = iter(paths)
+    # 要素は [パス, 結果, 終わったか]。ordered の場合は入力の順に並ぶ
+    tasks = collections.deque()
+    waiting = collections.deque()
+    workers = []
+    idle = []
+    try:
+        while True:
+            # 待ちのファイルを、実行中のファイルと返していない結果が limit を超えない範囲で読み進める
+            while len(tasks if ordered else waiting) < limit:
+                path = next(paths, None)
+                if path is None:
+                    break
+                task = [path, None, False]
+                waiting.append(task)
+                if ordered:
+                    tasks.append(task)
+            while waiting and (idle or len(workers) < jobs):
+                if not idle:
+                    worker = _Worker(probe)
+                    workers.append(worker)
+                    idle.append(worker)
+                idle.pop().start(waiting.popleft(), timeout)
+
+            busy = [worker for worker in workers if worker.task is not None]
+            if not busy:
+                break
+            deadlines = [worker.deadline for worker in busy if worker.deadline is not None]
+            wait = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            ready = multiprocessing.connection.wait([worker.conn for worker in busy], wait)
+
+            for worker in busy:
+                task = worker.task
+                if worker.conn in ready:
+                    try:
+                        task[1] = worker.conn.recv()
+                    except EOFError:
+                        # プロセスが異常終了した (デコーダーのクラッシュなど)
+                        task[1] = RuntimeError(f"調べるプロセスが異常終了しました: {task[0]}")
+                        worker.kill()
+                elif worker.deadline is not None and time.monotonic() >= worker.deadline:
+                    task[1] = TimeoutError(f"{timeout} 秒で終わりませんでした: {task[0]}")
+                    worker.kill()
+                else:
+                    continue
+                task[2] = True
+                worker.task = None
+                if worker.process.is_alive():
+                    idle.append(worker)
+                else:
+                    worker.conn.close()
+                    workers.remove(worker)
+                if not ordered:
+                    yield task[0], task[1]
+            while tasks and tasks[0][2]:
+                path, result, _ = tasks.popleft()
+                yield path, result
+    finally:
+        for worker in workers:
+            if worker.task is None:
+                worker.close()
+            else:
+                worker.kill()
+                worker.conn.close()
@@ -0,0 +1,798 @@
+# wavtools.py
+#
+# WAVファイルの切り出し・無音挿入・連結
+#   wav-cut.py, wav-delay.py の処理本体。ヘッダーだけを解析し、データはストリームとしてコピーする。
+#   ファイルパスの代わりに、バイナリモードで開いたファイルオブジェクトも渡せる。
+#   パス '-' は標準入力・標準出力で、パイプのようにシークできないストリームも先頭から順に処理する。
+#   4GBを超えるデータは RF64 (ds64チャンクに64ビットのサイズを書く形式) で読み書きする。
+#   無音・音量の解析 (analyze) だけは numpy を使う。
+
+import collections
+import concurrent.futures
+import contextlib
+import os
+import struct
+import sys
+from fractions import Fraction
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, NamedTuple, Optional, Union
+
+# 1秒あたりのフレーム数 (単位 'frame' は 1/30秒)
+FRAME_RATE = 30
+
+# WAVファイルのフォーマットタグ
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# 一度にコピーするバイト数の目安
+COPY_CHUNK_SIZE = 4 * 1024 * 1024
+
+# 長さが分からないストリームのヘッダーに書くサイズ (パイプに書き出すツールの慣例)
+# RF64 では「実際のサイズは ds64チャンクにある」という意味になる
+UNKNOWN_SIZE = 0xFFFFFFFF
+
+# ds64チャンクの中身の長さ (RIFF・data のサイズ、サンプル数、テーブルの数)
+DS64_SIZE = 28
+
+# ファイルパスまたはファイルオブジェクト
+PathOrFile = Union[str, os.PathLike, BinaryIO]
+
+
+class WavInfo(NamedTuple):
+    """WAVファイルのヘッダー情報"""
+    format_tag: int  # WAVE_FORMAT_PCM または WAVE_FORMAT_IEEE_FLOAT
+    channels: int  # チャンネル数
+    rate: int  # サンプリング周波数 (Hz)
+    bit_depth: int  # 1サンプルのビット数
+    block_align: int  # 1サンプル (全チャンネル分) のバイト数
+    data_offset: int  # dataチャンクの中身のファイル内の位置
+    data_size: Optional[int]  # dataチャンクのバイト数 (長さが分からないストリームでは None)
+    big_endian: bool  # RIFX (ビッグエンディアン) ファイルか
+
+    @property
+    def total_samples(self) -> Optional[int]:
+        """サンプル数 (長さが分からないストリームでは None)"""
+        return None if self.data_size is None else self.data_size // self.block_align
+
+    @property
+    def sample_size(self) -> int:
+        """入力の1チャンネル分のバイト数"""
+        return self.block_align // self.channels
+
+    @property
+    def out_sample_size(self) -> int:
+        """
+        出力の1チャンネル分のバイト数。
+        scipy.io.wavfile と同じく、3, 5〜7バイトのサンプルは4または8バイトに広げて書き出す。
+        """
+        size = self.sample_size
+        return 4 if size == 3 else 8 if size in (5, 6, 7) else size
+
+    @property
+    def needs_conversion(self) -> bool:
+        """データをそのままコピーできない (バイト順の変換やサンプルの拡張が必要) か"""
+        return self.big_endian or self.sample_size != self.out_sample_size
+
+
+@contextlib.contextmanager
+def open_stream(target: PathOrFile, mode: str):
+    """
+    パスなら開いて閉じ、ファイルオブジェクトならそのまま使う。
+    '-' は標準入力 ('rb') または標準出力 ('wb')。sys.stdout をメッセージ用に差し替えていても、
+    実際の標準出力に書き出す。
+    """
+    if hasattr(target, 'read') or hasattr(target, 'write'):
+        yield target
+    elif target == '-':
+        stream = sys.__stdin__.buffer if 'r' in mode else sys.__stdout__.buffer
+        yield stream
+        if 'w' in mode:
+            stream.flush()
+    else:
+        with open(target, mode) as f:
+            yield f
+
+
+def discard_stdout():
+    """
+    標準出力 ('-') のパイプの先が読むのをやめた (BrokenPipeError) ときに呼ぶ。
+    残りの出力を捨てるよう標準出力を os.devnull につなぎ直し、終了時の flush で再びエラーにならないようにする。
+    """
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.__stdout__.fileno())
+    os.close(devnull)
+
+
+def _seekable(f: BinaryIO) -> bool:
+    try:
+        return f.seekable()
+    except (AttributeError, ValueError):
+        return False
+
+
+def _skip(f: BinaryIO, size: int) -> int:
+    """size バイト読み飛ばす。シークできないストリームは読んで捨てる。読み飛ばしたバイト数を返す"""
+    if _seekable(f):
+        f.seek(size, 1)
+        return size
+    skipped = 0
+    while skipped < size:
+        data = f.read(min(size - skipped, COPY_CHUNK_SIZE))
+        if not data:
+            break
+        skipped += len(data)
+    return skipped
+
+
+def to_samples(value: int, unit: str, rate: int) -> int:
+    """
+    ミリ秒 ('ms') またはフレーム ('frame', 1/30秒) の長さをサンプル数に変換する (小数点以下は切り捨て)。
+    単位 'sample' の場合はそのまま返す。
+    """
+    if unit == 'ms':
+        return int(Fraction(value * rate, 1000))
+    elif unit == 'frame':
+        return int(Fraction(value * rate, FRAME_RATE))
+    elif unit == 'sample':
+        return value
+    raise ValueError(f"エラー: 不正な単位 '{unit}' が指定されました。'ms' または 'frame' を使用してください。")
+
+
+def from_samples(samples: int, unit: str, rate: int, round_up: bool = False) -> int:
+    """
+    サンプル数をミリ秒 ('ms') またはフレーム ('frame') に変換する (to_samples の逆)。
+    round_up が真なら切り上げ、偽なら切り捨てる。
+    """
+    if unit == 'sample':
+        return samples
+    per_second = 1000 if unit == 'ms' else FRAME_RATE if unit == 'frame' else None
+    if per_second is None:
+        raise ValueError(f"エラー: 不正な単位 '{unit}' が指定されました。'ms' または 'frame' を使用してください。")
+    value = samples * per_second
+    return -(-value // rate) if round_up else value // rate
+
+
+def read_wav_header(f: BinaryIO) -> WavInfo:
+    """
+    WAVファイルのヘッダーだけを読み、dataチャンクの位置とフォーマットを返す。
+    dataチャンクの中身は読まずに読み飛ばす。対応していない形式は ValueError を送出する。
+    読み終わると f は dataチャンクの中身の先頭を指す。
+
+    RF64 (BW64) では、サイズが 0xFFFFFFFF のチャンクは ds64チャンクの64ビットのサイズを使う。
+
+    シークできないストリームでは、dataチャンクのサイズが 0 または 0xFFFFFFFF なら
+    長さが分からないものとして data_size を None にする (最後まで読む)。
+    """
+    riff = f.read(12)
+    if len(riff) < 12 or riff[:4] not in (b'RIFF', b'RIFX', b'RF64', b'BW64') or riff[8:12] != b'WAVE':
+        raise ValueError("WAVファイルではありません。")
+    big_endian = riff[:4] == b'RIFX'
+    endian = '>' if big_endian else '<'
+
+    fmt = None
+    sizes = {}  # ds64チャンクにある64ビットのチャンクサイズ
+    position = 12
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            raise ValueError("dataチャンクが見つかりません。")
+        chunk_id = chunk[:4]
+        chunk_size = struct.unpack(endian + 'I', chunk[4:])[0]
+        position += 8
+        if chunk_size == UNKNOWN_SIZE and chunk_id in sizes:
+            chunk_size = sizes[chunk_id]
+
+        if chunk_id == b'ds64' and position == 20:
+            if chunk_size < DS64_SIZE:
+                raise ValueError("ds64チャンクが不正です。")
+            body = f.read(chunk_size)
+            position += len(body)
+            _, data_size, _, table_length = struct.unpack('<QQQI', body[:DS64_SIZE])
+            sizes[b'data'] = data_size
+            # data 以外の大きなチャンクのサイズのテーブル
+            for k in range(table_length):
+                entry = body[DS64_SIZE + k * 12:DS64_SIZE + k * 12 + 12]
+                if len(entry) == 12:
+                    sizes[entry[:4]] = struct.unpack('<Q', entry[4:])[0]
+            if chunk_size % 2:
+                position += _skip(f, 1)
+        elif chunk_id == b'fmt ':
+            if chunk_size < 16:
+                raise ValueError("fmtチャンクが不正です。")
+            body = f.read(chunk_size)
+            position += len(body)
+            fmt = list(struct.unpack(endian + 'HHIIHH', body[:16]))
+            if fmt[0] == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 18:
+                if struct.unpack(endian + 'H', body[16:18])[0] < 22:
+                    raise ValueError("fmtチャンクが不正です。")
+                # サブフォーマットのGUIDの先頭2バイトが実際のフォーマットタグ
+                fmt[0] = struct.unpack(endian + 'H', body[24:26])[0]
+            if chunk_size % 2:
+                position += _skip(f, 1)
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise ValueError("dataチャンクの前にfmtチャンクがありません。")
+            data_offset = position
+            if _seekable(f):
+                # ファイルが途中で切れている場合は、実際にある分だけを使う
+                data_offset = f.tell()
+                f.seek(0, 2)
+                data_size = min(chunk_size, f.tell() - data_offset)
+                f.seek(data_offset)
+            else:
+                data_size = None if chunk_size in (0, UNKNOWN_SIZE) else chunk_size
+            break
+        else:
+            # fact, LIST などのチャンクは読み飛ばす
+            position += _skip(f, chunk_size + chunk_size % 2)
+
+    format_tag, channels, rate, _, block_align, bit_depth = fmt
+    if channels == 0 or block_align == 0:
+        raise ValueError("fmtチャンクが不正です。")
+    sample_size = block_align // channels
+    if format_tag == WAVE_FORMAT_PCM:
+        if bit_depth <= 8 and sample_size != 1 or bit_depth > 64:
+            raise ValueError(f"{bit_depth}ビットの整数データには対応していません。")
+    elif format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        if bit_depth not in (32, 64) or sample_size * 8 != bit_depth:
+            raise ValueError(f"{bit_depth}ビットの浮動小数点データには対応していません。")
+    else:
+        raise ValueError(f"フォーマット {format_tag:#06x} には対応していません。")
+
+    return WavInfo(format_tag, channels, rate, bit_depth, block_align, data_offset, data_size, big_endian)
+
+
+def make_wav_header(info: WavInfo, samples: Optional[int], reserve: bool = False) -> bytes:
+    """
+    info の形式で samples サンプル分のデータを書き出すときのヘッダーを作る。
+    4GBに収まる場合は、scipy.io.wavfile.write() が書き出すヘッダーと同じバイト列になる。
+    収まらない場合は、WAVE の直後に ds64チャンクを置いた RF64 のヘッダーにする。
+
+    samples が None の場合は、長さが分からないストリーム用にサイズを 0xFFFFFFFF にする。
+    reserve が真なら、RIFF のままでも ds64チャンクと同じ長さの JUNKチャンクを置いて場所を空けておく。
+    こうしたヘッダーは、書き出した後で RIFF/RF64 のどちらにでも同じ長さのまま書き直せる。
+    """
+    sample_size = info.out_sample_size
+    block_align = info.channels * sample_size
+    data_size = None if samples is None else samples * block_align
+    is_float = info.format_tag == WAVE_FORMAT_IEEE_FLOAT
+
+    fmt_chunk = struct.pack('<HHIIHH', info.format_tag, info.channels, info.rate,
+                            info.rate * block_align, block_align, sample_size * 8)
+    if is_float:
+        # PCM以外は cbSize と factチャンクを付ける
+        fmt_chunk += b'\x00\x00'
+
+    chunks = b'fmt ' + struct.pack('<I', len(fmt_chunk)) + fmt_chunk
+    if is_float:
+        chunks += b'fact' + struct.pack('<II', 4, UNKNOWN_SIZE if samples is None else min(samples, UNKNOWN_SIZE))
+    chunks += b'data'
+
+    ds64_chunk_size = 8 + DS64_SIZE
+    riff_size = None
+    if data_size is not None:
+        riff_size = 4 + (ds64_chunk_size if reserve else 0) + len(chunks) + 4 + data_size
+    if riff_size is not None and riff_size >= UNKNOWN_SIZE:
+        # RF64: RIFF と data のサイズは ds64チャンクに書き、本来の場所は 0xFFFFFFFF にする
+        riff_size += 0 if reserve else ds64_chunk_size
+        ds64 = b'ds64' + struct.pack('<IQQQI', DS64_SIZE, riff_size, data_size, samples, 0)
+        return b'RF64' + struct.pack('<I', UNKNOWN_SIZE) + b'WAVE' + ds64 + chunks + struct.pack('<I', UNKNOWN_SIZE)
+
+    junk = b'JUNK' + struct.pack('<I', DS64_SIZE) + b'\x00' * DS64_SIZE if reserve else b''
+    size = struct.pack('<I', UNKNOWN_SIZE if data_size is None else data_size)
+    return b'RIFF' + struct.pack('<I', UNKNOWN_SIZE if riff_size is None else riff_size) + b'WAVE' + junk + chunks + size
+
+
+def _write_header(dst: BinaryIO, info: WavInfo, samples: Optional[int]) -> tuple[Optional[int], bool]:
+    """
+    ヘッダーを書き出し、後から書き直せる (シークできる) 場合はその位置と、ds64チャンクの場所を
+    空けたかを返す。長さが分からずに後から書き直す場合は、RF64 になってもよいように場所を空けておく。
+    """
+    position = dst.tell() if _seekable(dst) else None
+    header = make_wav_header(info, samples, reserve=samples is None and position is not None)
+    dst.write(header)
+    return position, header[:4] == b'RF64' or header[12:16] == b'JUNK'
+
+
+def _rewrite_header(dst: BinaryIO, info: WavInfo, written: tuple[Optional[int], bool], samples: int):
+    """
+    実際に書き出したサンプル数でヘッダーを書き直す (written は _write_header() の戻り値)。
+    シークできない出力 (パイプ) では書き直せないので、最初に書いたヘッダーのままになる。
+    """
+    position, reserved = written
+    if position is None:
+        return
+    end = dst.tell()
+    dst.seek(position)
+    dst.write(make_wav_header(info, samples, reserve=reserved))
+    dst.seek(end)
+
+
+def convert_samples(raw: bytes, info: WavInfo) -> bytes:
+    """
+    入力のサンプルのバイト列を、出力 (リトルエンディアン、4/8バイトに広げた形式) に変換する。
+    """
+    in_size = info.sample_size
+    out_size = info.out_sample_size
+    if not info.needs_conversion:
+        return raw
+
+    count = len(raw) // in_size
+    if info.big_endian:
+        # サンプルごとにバイト順を反転する
+        swapped = bytearray(len(raw))
+        for k in range(in_size):
+            swapped[k::in_size] = raw[in_size - 1 - k::in_size]
+        raw = swapped
+    if in_size == out_size:
+        return bytes(raw)
+
+    # 下位側に 0 を詰めて広げる (scipy.io.wavfile と同じく左詰め)
+    widened = bytearray(count * out_size)
+    pad = out_size - in_size
+    for k in range(in_size):
+        widened[pad + k::out_size] = raw[k::in_size]
+    return bytes(widened)
+
+
+def _copy_file_range(src: BinaryIO, dst: BinaryIO, offset: int, size: int) -> int:
+    """
+    os.copy_file_range / os.sendfile で、src の offset から size バイトを dst の現在位置にコピーする。
+    コピーできたバイト数を返す (使えない場合は 0 またはコピーできた途中まで)。
+    """
+    try:
+        src_fd, dst_fd = src.fileno(), dst.fileno()
+    except (AttributeError, OSError, ValueError):
+        return 0
+    dst.flush()
+    copied_total = 0
+    for copy in (getattr(os, 'copy_file_range', None), getattr(os, 'sendfile', None)):
+        if copy is None:
+            continue
+        try:
+            while copied_total < size:
+                count = min(size - copied_total, 1 << 30)
+                if copy is os.sendfile:
+                    copied = os.sendfile(dst_fd, src_fd, offset + copied_total, count)
+                else:
+                    copied = os.copy_file_range(src_fd, dst_fd, count, offset + copied_total)
+                if copied == 0:
+                    return copied_total
+                copied_total += copied
+            return copied_total
+        except OSError:
+            # このファイルシステムでは使えない: 続きを次の方法でコピーする
+            continue
+    return copied_total
+
+
+def copy_samples(src: BinaryIO, dst: BinaryIO, info: WavInfo, start_sample: int,
+                 end_sample: Optional[int] = None) -> int:
+    """
+    入力の start_sample から end_sample までのデータだけを読み、出力の形式に変換して書き出す。
+    end_sample が None の場合はデータの最後 (長さが分からないストリームでは入力の最後) まで。
+    変換が不要な場合は、可能ならカーネル内でコピーする。
+
+    シークできない入力 (パイプなど) は、read_wav_header() の直後の位置から start_sample まで
+    読み捨てて進むので、1つの入力につき1回だけ呼べる。入力がそこまでない場合は ValueError を送出する。
+
+    :return: コピーしたサンプル数
+    """
+    block_align = info.block_align
+    if end_sample is None:
+        end_sample = info.total_samples
+    remaining = None if end_sample is None else (end_sample - start_sample) * block_align
+    copied_bytes = 0
+
+    if _seekable(src):
+        offset = info.data_offset + start_sample * block_align
+        if remaining is not None and not info.needs_conversion:
+            copied = _copy_file_range(src, dst, offset, remaining)
+            offset += copied
+            remaining -= copied
+            copied_bytes += copied
+        src.seek(offset)
+    elif _skip(src, start_sample * block_align) < start_sample * block_align:
+        raise ValueError(f"エラー: 開始位置が音声ファイルの範囲外です。")
+
+    chunk_size = max(1, COPY_CHUNK_SIZE // block_align) * block_align
+    while remaining is None or remaining > 0:
+        raw = src.read(chunk_size if remaining is None else min(chunk_size, remaining))
+        # 最後の半端なサンプルは捨てる
+        raw = raw[:len(raw) - len(raw) % block_align]
+        if not raw:
+            break
+        dst.write(convert_samples(raw, info))
+        copied_bytes += len(raw)
+        if remaining is not None:
+            remaining -= len(raw)
+    return copied_bytes // block_align
+
+
+def write_silence(dst: BinaryIO, info: WavInfo, samples: int):
+    """
+    無音を samples サンプル分、固定サイズのブロックで書き出す。
+    8ビット (符号なし) の無音は 0x80、それ以外は 0。
+    """
+    fill = b'\x80' if info.format_tag == WAVE_FORMAT_PCM and info.out_sample_size == 1 else b'\x00'
+    remaining = samples * info.channels * info.out_sample_size
+    block = fill * min(remaining, COPY_CHUNK_SIZE)
+    while remaining > 0:
+        n = min(remaining, len(block))
+        dst.write(block[:n] if n < len(block) else block)
+        remaining -= n
+
+
+def compute_cut_range(info: WavInfo, start: int, end: int, unit: str) -> tuple[int, Optional[int]]:
+    """
+    切り出す範囲をサンプル番号 (開始, 終了) に変換する。範囲外なら ValueError を送出する。
+    end が 0 の場合はファイルの最後まで。長さが分からないストリームでは、終了は None になる。
+    """
+    total_samples = info.total_samples
+    start_sample = to_samples(start, unit, info.rate)
+    end_sample = total_samples if end == 0 else to_samples(end, unit, info.rate)
+
+    if start_sample < 0 or total_samples is not None and start_sample >= total_samples:
+        raise ValueError(f"エラー: 開始位置が音声ファイルの範囲外です。")
+
+    if end_sample is None:
+        return start_sample, None
+
+    if end_sample < start_sample:
+        raise ValueError(f"エラー: 終了位置が開始位置より前です。")
+
+    # 終了位置が総サンプル数を超えている場合は、総サンプル数に丸める
+    return start_sample, end_sample if total_samples is None else min(end_sample, total_samples)
+
+
+def write_segment(src: BinaryIO, info: WavInfo, output: PathOrFile, start_sample: int,
+                  end_sample: Optional[int]) -> int:
+    """
+    入力の start_sample から end_sample までを、新しいヘッダーを付けて output に書き出す。
+    長さが分からない場合は仮のヘッダーを書き、出力がシークできれば最後に書き直す。
+
+    :return: 書き出したサンプル数
+    """
+    samples = None if end_sample is None else end_sample - start_sample
+    with open_stream(output, 'wb') as dst:
+        written = _write_header(dst, info, samples)
+        copied = copy_samples(src, dst, info, start_sample, end_sample)
+        if copied != samples:
+            _rewrite_header(dst, info, written, copied)
+    return copied
+
+
+# ==============================================================================
+# 操作: 切り出し・無音挿入・連結
+# ==============================================================================
+
+# 切り出しの結果
+CutResult = collections.namedtuple('CutResult', ['info', 'start_sample', 'end_sample', 'output'])
+
+
+def cut(input: PathOrFile, output: PathOrFile, start: int, end: int = 0, unit: str = 'ms') -> CutResult:
+    """
+    WAVファイルの指定範囲を切り出す。end が 0 の場合はファイルの最後まで。
+    必要な範囲のデータだけを読み込む。範囲が不正な場合は ValueError を送出する。
+    """
+    with open_stream(input, 'rb') as src:
+        info = read_wav_header(src)
+        start_sample, end_sample = compute_cut_range(info, start, end, unit)
+        copied = write_segment(src, info, output, start_sample, end_sample)
+    return CutResult(info, start_sample, start_sample + copied, output)
+
+
+def cut_segments(input: str, segments: Iterable[tuple[int, int, str]], unit: str = 'ms',
+                 jobs: int = 1) -> list[Union[CutResult, Exception]]:
+    """
+    1つのWAVファイルから複数の範囲 (開始, 終了, 出力ファイル) を切り出す。
+
+    入力のヘッダーは1回だけ読み、開始位置の順に並べた範囲を先頭から順に書き出すので、
+    処理時間は入力の長さではなく出力の合計サイズに比例する。
+    jobs が2以上の場合は、連続した範囲のまとまりごとにスレッドで並列に書き出す。
+
+    :return: segments の順に、CutResult または失敗した原因の例外を並べたリスト。
+    """
+    segments = list(segments)
+    with open(input, 'rb') as f:
+        info = read_wav_header(f)
+
+    # 範囲をサンプル番号に変換し、開始位置の順に並べる
+    results: list[Any] = [None] * len(segments)
+    tasks = []
+    for index, (start, end, output) in enumerate(segments):
+        try:
+            start_sample, end_sample = compute_cut_range(info, start, end, unit)
+            tasks.append((start_sample, end_sample, index, output))
+        except ValueError as e:
+            results[index] = e
+    tasks.sort()
+
+    def write_tasks(task_list):
+        # スレッドごとに入力ファイルを開く (ファイル位置を共有しないように)
+        with open(input, 'rb') as src:
+            for start_sample, end_sample, index, output in task_list:
+                try:
+                    write_segment(src, info, output, start_sample, end_sample)
+                    results[index] = CutResult(info, start_sample, end_sample, output)
+                except Exception as e:
+                    results[index] = e
+
+    if jobs <= 1 or len(tasks) <= 1:
+        write_tasks(tasks)
+    else:
+        size = -(-len(tasks) // jobs)
+        groups = [tasks[k:k + size] for k in range(0, len(tasks), size)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            list(executor.map(write_tasks, groups))
+    return results
+
+
+# 無音挿入の結果
+DelayResult = collections.namedtuple('DelayResult', ['info', 'silence_samples', 'output'])
+
+
+def write_delayed(src: BinaryIO, info: WavInfo, output: PathOrFile, silence_samples: int) -> int:
+    """
+    ヘッダーを読んだ入力 src の先頭に silence_samples サンプルの無音を付けて output に書き出す。
+    長さが分からない場合は仮のヘッダーを書き、出力がシークできれば最後に書き直す。
+
+    :return: コピーした元のデータのサンプル数
+    """
+    total = info.total_samples
+    samples = None if total is None else silence_samples + total
+    with open_stream(output, 'wb') as dst:
+        written = _write_header(dst, info, samples)
+        write_silence(dst, info, silence_samples)
+        copied = copy_samples(src, dst, info, 0, total)
+        if silence_samples + copied != samples:
+            _rewrite_header(dst, info, written, silence_samples + copied)
+    return copied
+
+
+def delay(input: PathOrFile, output: PathOrFile, length: int, unit: str = 'ms') -> DelayResult:
+    """
+    WAVファイルの先頭に指定した長さの無音を挿入する。
+    ヘッダー、無音、元のデータの順に書き出すので、ファイル全体をメモリに読み込まない。
+    無音の長さが 0 以下の場合は何も書き出さない。
+    """
+    with open_stream(input, 'rb') as src:
+        info = read_wav_header(src)
+        silence_samples = to_samples(length, unit, info.rate)
+        if silence_samples > 0:
+            write_delayed(src, info, output, silence_samples)
+    return DelayResult(info, silence_samples, output)
+
+
+def concat(inputs: Iterable[PathOrFile], output: PathOrFile) -> WavInfo:
+    """
+    同じ形式 (フォーマット、チャンネル数、サンプリング周波数、ビット数) のWAVファイルを連結する。
+    形式が異なる場合や、長さが分からない入力 (サイズが 0xFFFFFFFF のストリーム) がある場合は
+    ValueError を送出する。連結後のヘッダー情報を返す。
+    """
+    inputs = list(inputs)
+    if not inputs:
+        raise ValueError("連結するファイルがありません。")
+
+    # 先にすべてのヘッダーを読み、形式をそろえて合計サンプル数を求める
+    infos = []
+    for input in inputs:
+        with open_stream(input, 'rb') as src:
+            infos.append(read_wav_header(src))
+    first = infos[0]
+    key = (first.format_tag, first.channels, first.rate, first.out_sample_size)
+    for input, info in zip(inputs, infos):
+        if (info.format_tag, info.channels, info.rate, info.out_sample_size) != key:
+            raise ValueError(f"形式が異なるファイルは連結できません: {input}")
+        if info.data_size is None:
+            # 連結後のヘッダーに書く合計の長さが決まらない
+            raise ValueError(f"長さが分からないストリームは連結できません: {input}")
+
+    total = sum(info.total_samples for info in infos)
+    with open_stream(output, 'wb') as dst:
+        dst.write(make_wav_header(first, total))
+        for input, info in zip(inputs, infos):
+            with open_stream(input, 'rb') as src:
+                copy_samples(src, dst, info, 0, info.total_samples)
+    return first._replace(data_size=total * first.channels * first.out_sample_size)
+
+
+# ==============================================================================
+# 解析: ブロックごとに読み、窓ごとの RMS/ピークから無音と音のある区間を求める
+# ==============================================================================
+
+# 1ブロック分の窓ごとの音量 (dBFS)。start は先頭の窓の開始サンプル、samples はブロックのサンプル数、
+# energy はブロック全体 (全チャンネル) の二乗和
+LevelBlock = collections.namedtuple('LevelBlock', ['start', 'samples', 'window', 'rms_db', 'peak_db', 'energy'])
+
+# 解析の結果。regions は音のある区間 [(開始サンプル, 終了サンプル)]、peak_db/rms_db はファイル全体の音量
+Analysis = collections.namedtuple('Analysis', ['info', 'regions', 'peak_db', 'rms_db'])
+
+# dBFS に変換するときの下限 (完全な無音を -200 dB として扱う)
+SILENCE_FLOOR = 1e-10
+
+
+def _to_db(np, value):
+    return 20 * np.log10(np.maximum(value, SILENCE_FLOOR))
+
+
+def samples_to_array(raw: bytes, info: WavInfo):
+    """
+    入力のサンプルのバイト列を、-1.0〜1.0 の float64 の配列 (サンプル数, チャンネル数) に変換する。
+    """
+    import numpy as np
+
+    raw = convert_samples(raw, info)
+    size = info.out_sample_size
+    if info.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        data = np.frombuffer(raw, dtype=f'<f{size}').astype(np.float64)
+    elif size == 1:
+        # 8ビットは符号なし (無音が 0x80)
+        data = (np.frombuffer(raw, dtype=np.uint8).astype(np.float64) - 128) / 128
+    else:
+        # 3, 5〜7バイトのサンプルは左詰めで広げてあるので、広げた後のビット数で割る
+        data = np.frombuffer(raw, dtype=f'<i{size}').astype(np.float64) / (1 << (size * 8 - 1))
+    return data.reshape(-1, info.channels)
+
+
+def iter_levels(src: BinaryIO, info: WavInfo, window: int,
+                block_size: int = COPY_CHUNK_SIZE) -> Iterator[LevelBlock]:
+    """
+    dataチャンクを約 block_size バイトのブロックごとに読み、window サンプルの窓ごとの
+    RMS とピーク (全チャンネル, dBFS) を求める。メモリに置くのは常に1ブロック分だけ。
+    最後の窓が window に満たない場合は、ある分だけで計算する。
+    """
+    import numpy as np
+
+    window = max(1, window)
+    block_windows = max(1, block_size // (window * info.block_align))
+    block_bytes = block_windows * window * info.block_align
+    if _seekable(src):
+        src.seek(info.data_offset)
+    remaining = None if info.data_size is None else info.total_samples * info.block_align
+    position = 0
+    while remaining is None or remaining > 0:
+        raw = src.read(block_bytes if remaining is None else min(block_bytes, remaining))
+        raw = raw[:len(raw) - len(raw) % info.block_align]
+        if not raw:
+            break
+        if remaining is not None:
+            remaining -= len(raw)
+        data = samples_to_array(raw, info)
+        samples = len(data)
+
+        # 窓の数に合わせて末尾を 0 で埋め、(窓, サンプル, チャンネル) に並べ替えてまとめて計算する
+        count = -(-samples // window)
+        if count * window != samples:
+            data = np.concatenate((data, np.zeros((count * window - samples, info.channels))))
+        data = data.reshape(count, window * info.channels)
+        lengths = np.full(count, window * info.channels, dtype=np.float64)
+        lengths[-1] = (samples - (count - 1) * window) * info.channels
+        energy = np.einsum('ij,ij->i', data, data)
+        peak = np.abs(data).max(axis=1)
+        yield LevelBlock(position, samples, window, _to_db(np, np.sqrt(energy / lengths)), _to_db(np, peak),
+                         float(energy.sum()))
+        position += samples
+
+
+def detect_regions(blocks: Iterable[LevelBlock], threshold_db: float, min_silence: int, min_sound: int,
+                   pad: int, total_samples: Optional[int], level: str = 'rms') -> Iterator[tuple[int, int]]:
+    """
+    窓ごとの音量が threshold_db 以上の区間を、音のある区間 (開始サンプル, 終了サンプル) として順に返す。
+
+    min_silence サンプル未満の無音を挟む区間は1つにまとめ、min_sound サンプル未満の区間は捨てる。
+    残った区間の前後に pad サンプルの余白を付け (ファイルの範囲内に収め)、重なった区間はまとめる。
+    total_samples が None (長さが分からない) の場合は、末尾の余白をファイルの範囲内に収めない。
+    level は判定に使う音量 ('rms' または 'peak')。
+    """
+    import numpy as np
+
+    current = None  # まとめている途中の区間 [開始, 終了]
+    pending = None  # 余白を付けたが、次の区間と重なるかもしれない区間
+
+    def finish():
+        # 短すぎる区間は捨て、余白を付ける。前の区間と重ならなければ、前の区間を確定して返す
+        nonlocal pending
+        if current is None or current[1] - current[0] < min_sound:
+            return None
+        end = current[1] + pad
+        region = (max(0, current[0] - pad), end if total_samples is None else min(total_samples, end))
+        if pending and region[0] <= pending[1]:
+            pending = (pending[0], region[1])
+            return None
+        done, pending = pending, region
+        return done
+
+    for block in blocks:
+        values = block.rms_db if level == 'rms' else block.peak_db
+        active = np.concatenate(([False], values >= threshold_db, [False]))
+        # 音のある窓が続く範囲 (窓番号) を、変化点だけから求める
+        edges = np.flatnonzero(active[1:] != active[:-1])
+        block_end = block.start + block.samples
+        for first, last in zip(edges[0::2].tolist(), edges[1::2].tolist()):
+            start = block.start + first * block.window
+            end = min(block.start + last * block.window, block_end)
+            if current is not None and start - current[1] < min_silence:
+                current[1] = end
+                continue
+            done = finish()
+            if done:
+                yield done
+            current = [start, end]
+
+    done = finish()
+    if done:
+        yield done
+    if pending:
+        yield pending
+
+
+def analyze(input: PathOrFile, threshold_db: float = -45.0, window_ms: int = 10, min_silence_ms: int = 300,
+            min_sound_ms: int = 100, pad_ms: int = 50, level: str = 'rms',
+            block_size: int = COPY_CHUNK_SIZE) -> Analysis:
+    """
+    WAVファイルをブロックごとに読み、音のある区間とファイル全体のピーク・RMS (dBFS) を求める。
+    先頭の区間の開始までが先頭の無音、最後の区間の終了からが末尾の無音になる。
+    メモリ使用量はファイルの長さによらず、約 block_size バイトのブロック1つ分。
+    """
+    if level not in ('rms', 'peak'):
+        raise ValueError(f"エラー: 不正な音量の種類 '{level}' が指定されました。'rms' または 'peak' を使用してください。")
+    import numpy as np
+
+    with open_stream(input, 'rb') as src:
+        info = read_wav_header(src)
+        window = max(1, to_samples(window_ms, 'ms', info.rate))
+        energy = 0.0  # 全体の二乗和 (RMS用)
+        peak_db = float(_to_db(np, 0.0))
+        total = 0  # 実際に読んだサンプル数
+
+        def blocks():
+            nonlocal energy, peak_db, total
+            for block in iter_levels(src, info, window, block_size):
+                energy += block.energy
+                peak_db = max(peak_db, float(block.peak_db.max()))
+                total += block.samples
+                yield block
+
+        regions = list(detect_regions(blocks(), threshold_db,
+                                      to_samples(min_silence_ms, 'ms', info.rate),
+                                      to_samples(min_sound_ms, 'ms', info.rate),
+                                      to_samples(pad_ms, 'ms', info.rate), info.total_samples, level))
+    if info.data_size is None:
+        # 長さが分からないストリームは、読み終わってから長さを決めて末尾の余白を収める
+        info = info._replace(data_size=total * info.block_align)
+        if regions:
+            regions[-1] = (regions[-1][0], min(regions[-1][1], total))
+    rms_db = float(_to_db(np, (energy / (total * info.channels)) ** 0.5 if total else 0.0))
+    return Analysis(info, regions, peak_db, rms_db)
+
+
+# ==============================================================================
+# バッチ処理: 多数のファイルをプロセスプールで処理する
+# ==============================================================================
+
+# バッチ処理の1件分の結果 (error が None なら成功)
+BatchResult = collections.namedtuple('BatchResult', ['args', 'result', 'error'])
+
+
+def _run_one(func: Callable, args: tuple, kwargs: dict) -> BatchResult:
+    try:
+        return BatchResult(args, func(*args, **kwargs), None)
+    except Exception as e:
+        return BatchResult(args, None, e)
+
+
+def run_batch(func: Callable, arg_list: Iterable[tuple], jobs: Optional[int] = None, **kwargs) -> list[BatchResult]:
+    """
+    func (cut, delay, concat など) を arg_list の各引数で実行し、結果を arg_list の順に返す。
+    jobs が 1 の場合はこのプロセスで順に、それ以外はプロセスプール (None ならCPU数) で並列に実行する。
+    1件の失敗で全体を止めず、例外は BatchResult.error に入れて返す。
+
+    例: run_batch(wavtools.delay, [('a.wav', 'a2.wav', 500), ('b.wav', 'b2.wav', 500)], unit='ms')
+    """
+    arg_list = [tuple(args) for args in arg_list]
+    if jobs == 1 or len(arg_list) <= 1:
+        return [_run_one(func, args, kwargs) for args in arg_list]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(_run_one, func, args, kwargs) for args in arg_list]
+        return [future.result() for future in futures]
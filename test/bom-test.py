@@ -0,0 +1,384 @@
+# bin/bom.py のテスト
+#   PYTHONPATH に lib を登録してから実行する:  python bom-test.py
+
+import contextlib
+import importlib.util
+import io
+import os
+import sys
+import testrunner
+
+# bin は PYTHONPATH にないので、パスを指定して読み込む
+_spec = importlib.util.spec_from_file_location(
+    'bom', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bin', 'bom.py'))
+bom = importlib.util.module_from_spec(_spec)
+sys.modules['bom'] = bom
+_spec.loader.exec_module(bom)
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def run_main(args):
+    """bom.main を実行し、表示した行を返す"""
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        bom.main(args)
+    return out.getvalue().splitlines()
+
+
+@contextlib.contextmanager
+def count_checks():
+    """bom.check_file を呼んだパスを記録する"""
+    checked = []
+    check_file = bom.check_file
+
+    def counting(filepath):
+        checked.append(filepath)
+        return check_file(filepath)
+
+    bom.check_file = counting
+    try:
+        yield checked
+    finally:
+        bom.check_file = check_file
+
+
+def expected_offset(data):
+    try:
+        data.decode('utf-8')
+        return None
+    except UnicodeDecodeError as e:
+        return e.start
+
+
+# 不正な UTF-8 の位置: 複数バイトの文字がチャンクの境目で分かれても、読む単位によらず同じ位置を返す
+def test_invalid_utf8_offsets(work):
+    text = 'aあ€𝄞b'.encode()
+    samples = [
+        text,
+        text + b'\xff',                  # 最後に不正なバイト
+        text + 'あ'.encode()[:2],         # 途中で終わった文字
+        text + b'\xe3\x81' + b'a' + text,  # 続きのバイトが足りない文字
+        text + b'\xf0\x9d\x84' + b'\xe3',  # 4バイト文字の後半が別の文字の先頭
+        b'\xed\xa0\x80' + text,          # サロゲート
+        b'\xc0\xaf',                     # 冗長な表現
+    ]
+    chunk_size = bom.CHUNK_SIZE
+    try:
+        for data in samples:
+            for size in range(1, len(data) + 2):
+                bom.CHUNK_SIZE = size
+                assert bom.find_invalid_utf8(io.BytesIO(data)) == expected_offset(data), (data, size)
+    finally:
+        bom.CHUNK_SIZE = chunk_size
+
+    path = os.path.join(work, 'a.txt')
+    write(path, bom.UTF8_BOM + text * 1000 + b'\x80')
+    assert bom.check_file(path) == bom.CheckResult(None, True, 3 + len(text) * 1000)
+
+
+@contextlib.contextmanager
+def patch(module, **attrs):
+    """module の属性を一時的に置き換える (None なら削除する)"""
+    saved = {name: getattr(module, name, None) for name in attrs}
+    try:
+        for name, value in attrs.items():
+            if value is None:
+                if hasattr(module, name):
+                    delattr(module, name)
+            else:
+                setattr(module, name, value)
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                if hasattr(module, name):
+                    delattr(module, name)
+            else:
+                setattr(module, name, value)
+
+
+def read_at(fd, count, offset):
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, count)
+
+
+# BOMの除去/付加: カーネル内のコピーが使えない, 途中で 0 を返す場合も、次の方法で最後までコピーする
+def test_copy_fallback(work):
+    path = os.path.join(work, 'a.txt')
+    data = 'あいうえお\n'.encode() * 5000
+    calls = []
+
+    def unsupported(name):
+        def copy(*args):
+            calls.append(name)
+            raise OSError(18, "Invalid cross-device link")
+        return copy
+
+    def partial(name, limit):
+        # limit バイトまでコピーし、その後は 0 を返す
+        copied = [0]
+
+        def copy(*args):
+            calls.append(name)
+            if name == 'sendfile':
+                dst_fd, src_fd, offset, count = args
+            else:
+                src_fd, dst_fd, count, offset = args
+            chunk = read_at(src_fd, min(count, 1000, limit - copied[0]), offset)
+            copied[0] += len(chunk)
+            return os.write(dst_fd, chunk)
+        return copy
+
+    cases = [
+        # (copy_file_range, sendfile, 使われるはずの方法)
+        (unsupported('copy_file_range'), partial('sendfile', len(data)), ['copy_file_range', 'sendfile']),
+        (partial('copy_file_range', 7000), partial('sendfile', 3000), ['copy_file_range', 'sendfile']),
+        (partial('copy_file_range', 7000), unsupported('sendfile'), ['copy_file_range', 'sendfile']),
+        (None, None, []),
+    ]
+    for copy_file_range, sendfile, used in cases:
+        calls.clear()
+        write(path, data)
+        with patch(os, copy_file_range=copy_file_range, sendfile=sendfile):
+            bom.rewrite_file(path, bom.UTF8_BOM, 0)
+        assert read(path) == bom.UTF8_BOM + data
+        assert sorted(set(calls)) == used, calls
+        calls.clear()
+        with patch(os, copy_file_range=copy_file_range, sendfile=sendfile):
+            bom.rewrite_file(path, b'', len(bom.UTF8_BOM))
+        assert read(path) == data
+
+    # 実際の os の関数でも同じ結果になる
+    bom.rewrite_file(path, bom.UTF8_BOM, 0)
+    assert read(path) == bom.UTF8_BOM + data
+    assert sorted(os.listdir(work)) == ['a.txt']
+
+
+# BOMの除去/付加: 書き込みの途中で失敗した場合やコピーが足りない場合は、元のファイルをそのまま残す
+def test_rewrite_failure(work):
+    path = os.path.join(work, 'a.txt')
+    data = bom.UTF8_BOM + b'abc\n' * 10000
+    write(path, data)
+    copy_file_body = bom.copy_file_body
+
+    def broken(src, dst_fd, offset):
+        os.write(dst_fd, b'abc')
+        raise OSError(28, "No space left on device")
+
+    def short(src, dst_fd, offset):
+        # 読んでいる間にファイルが切り詰められた場合など
+        src.seek(offset)
+        os.write(dst_fd, src.read(100))
+
+    for copy in (broken, short):
+        bom.copy_file_body = copy
+        try:
+            try:
+                bom.rewrite_file(path, b'', len(bom.UTF8_BOM))
+                assert False, "失敗しない"
+            except OSError:
+                pass
+            status = bom.check_and_process_file(path, 'remove', 10, quiet=True)
+        finally:
+            bom.copy_file_body = copy_file_body
+        assert status == 'failed'
+        assert read(path) == data
+        assert sorted(os.listdir(work)) == ['a.txt']
+
+
+# BOMの除去/付加: シンボリックリンクはリンクのまま、リンク先のファイルを書き換える
+def test_rewrite_symlink(work):
+    target = os.path.join(work, 'target.txt')
+    link = os.path.join(work, 'link.txt')
+    write(target, b'abc')
+    os.chmod(target, 0o640)
+    try:
+        os.symlink(target, link)
+    except (OSError, NotImplementedError):
+        # シンボリックリンクを作れない環境 (Windows の一般ユーザーなど)
+        return
+    assert bom.check_and_process_file(link, 'add', 10, quiet=True) == 'added'
+    assert os.path.islink(link)
+    assert read(target) == bom.UTF8_BOM + b'abc'
+    assert os.stat(target).st_mode & 0o777 == 0o640
+
+
+# ファイルの展開: 引数の順に、引数ごとにソートして並べ、同じファイルは最初の1回だけにする
+def test_expand_files(work):
+    d = os.path.join(work, 'd')
+    for name in ['b.txt', 'a.txt', os.path.join('sub', 'c.txt'), 'e.bin', os.path.join('sub', 'deep', 'f.txt')]:
+        write(os.path.join(d, name), b'x')
+    x = os.path.join(work, 'x.md')
+    write(x, b'x')
+    files = bom.expand_files([os.path.join(d, '**', '*.txt'), x, d, x, os.path.join(work, 'none', '*')])
+    assert files == [
+        os.path.join(d, 'a.txt'),
+        os.path.join(d, 'b.txt'),
+        os.path.join(d, 'sub', 'c.txt'),
+        os.path.join(d, 'sub', 'deep', 'f.txt'),
+        x,
+        os.path.join(d, 'e.bin'),
+    ]
+
+
+def parse_summary(lines):
+    """集計の行を {項目: 数} にする"""
+    summary = {}
+    for line in lines:
+        name, _, value = line.rpartition(':')
+        summary[name.strip()] = int(value)
+    return summary
+
+
+# 集計: 読み込みエラーと書き込みエラーを含め、各項目の合計がファイル数になる (並列でも同じ)
+def test_summary_totals(work):
+    files = {
+        'bom.txt': bom.UTF8_BOM + b'abc',
+        'bom_fail.txt': bom.UTF8_BOM + b'def',
+        'plain.txt': b'abc',
+        'latin1.txt': b'caf\xe9',
+        'unreadable.txt': b'abc',
+        'empty.txt': b'',
+    }
+    for name, data in files.items():
+        write(os.path.join(work, name), data)
+    check_file = bom.check_file
+    rewrite_file = bom.rewrite_file
+
+    def failing_check(filepath):
+        if filepath.endswith('unreadable.txt'):
+            return bom.CheckResult(f"エラー: ファイルの読み込みに失敗しました - {filepath}", False, None)
+        return check_file(filepath)
+
+    def failing_rewrite(filepath, head, offset):
+        if filepath.endswith('bom_fail.txt'):
+            raise IOError("Permission denied")
+        rewrite_file(filepath, head, offset)
+
+    bom.check_file = failing_check
+    bom.rewrite_file = failing_rewrite
+    try:
+        summary = parse_summary(run_main(['-d', '-s', os.path.join(work, '*.txt')]))
+    finally:
+        bom.check_file = check_file
+        bom.rewrite_file = rewrite_file
+    assert summary == {
+        'ファイル数': 6, 'UTF-8, BOM付き': 0, 'UTF-8, BOMなし': 3, 'UTF-8ではない': 1,
+        '読み込みエラー': 1, '書き込みエラー': 1, 'BOMを除去': 1, 'BOMを付加': 0,
+    }
+    totals = ['UTF-8, BOM付き', 'UTF-8, BOMなし', 'UTF-8ではない', '読み込みエラー', '書き込みエラー']
+    assert sum(summary[name] for name in totals) == summary['ファイル数']
+
+    # 並列にチェックしても、結果と表示の順は同じ
+    pattern = os.path.join(work, '*')
+    assert run_main(['-j', '3', pattern]) == run_main([pattern])
+    summary = parse_summary(run_main(['-a', '-s', '-j', '2', pattern]))
+    assert summary['UTF-8, BOM付き'] == 5 and summary['BOMを付加'] == 4
+    assert sum(summary[name] for name in totals) == summary['ファイル数'] == 6
+
+
+# キャッシュ: 変更のないファイルは読み直さず、同じ結果を表示する
+def test_cache_hit(work):
+    db = os.path.join(work, 'cache', 'bom.sqlite3')
+    a = os.path.join(work, 'a.txt')
+    b = os.path.join(work, 'b.txt')
+    write(a, bom.UTF8_BOM + 'あいう'.encode())
+    write(b, b'abc\xff')
+    with count_checks() as checked:
+        first = run_main(['--cache-path', db, a, b])
+    assert checked == [a, b]
+    with count_checks() as checked:
+        second = run_main(['--cache-path', db, a, b])
+    assert checked == []
+    assert first == second
+    assert second[1].endswith('**UTF-8ではありません** (位置 3)')
+
+
+# キャッシュ: 同じサイズで書き換えたファイルは、更新時刻か inode が変われば読み直す
+def test_cache_rewritten(work):
+    db = os.path.join(work, 'bom.sqlite3')
+    path = os.path.join(work, 'a.txt')
+    write(path, b'abc')
+    cache = bom.ResultCache(db, 100)
+    cache.store(path, bom.check_file(path))
+    assert cache.lookup(path) == bom.CheckResult(None, False, None)
+
+    # 同じ場所を書き換え (更新時刻だけが変わる)
+    st = os.stat(path)
+    with open(path, 'r+b') as f:
+        f.write(b'\xff')
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+    assert os.path.getsize(path) == st.st_size
+    assert cache.lookup(path) is None
+    cache.store(path, bom.check_file(path))
+    assert cache.lookup(path) == bom.CheckResult(None, False, 0)
+
+    # 別のファイルで置き換え (更新時刻を同じにしても inode が変わる)
+    st = os.stat(path)
+    temp = path + '.new'
+    write(temp, b'xyz')
+    os.utime(temp, ns=(st.st_atime_ns, st.st_mtime_ns))
+    os.replace(temp, path)
+    assert cache.lookup(path) is None
+    cache.close()
+
+
+# キャッシュ: 閉じるときに、上限を超えた分を最後に使われたのが古いものから削除する
+def test_cache_eviction(work):
+    db = os.path.join(work, 'bom.sqlite3')
+    paths = [os.path.join(work, f'{k}.txt') for k in range(5)]
+    for path in paths:
+        write(path, b'abc')
+
+    cache = bom.ResultCache(db, 100)
+    for k, path in enumerate(paths):
+        cache.now = 1000 + k
+        cache.store(path, bom.check_file(path))
+    cache.close()
+
+    # 一番古い 0.txt を使うと、次に古い 1.txt, 2.txt が削除される
+    cache = bom.ResultCache(db, 3)
+    cache.now = 2000
+    assert cache.lookup(paths[0]) is not None
+    cache.close()
+    cache = bom.ResultCache(db, 100)
+    assert [cache.lookup(path) is not None for path in paths] == [True, False, False, True, True]
+    cache.close()
+
+
+# キャッシュ: -c はファイルを取らず、SQLite でないキャッシュファイルはエラーにする
+def test_cache_options(work):
+    log = os.path.join(work, 'empty.log')
+    text = os.path.join(work, 'a.txt')
+    write(log, b'')
+    write(text, b'abc')
+    db = os.path.join(work, 'cache', 'bom.sqlite3')
+    default_cache_path = bom.default_cache_path
+    bom.default_cache_path = lambda: db
+    try:
+        lines = run_main(['-c', log, text])
+    finally:
+        bom.default_cache_path = default_cache_path
+    assert len(lines) == 2 and read(log) == b''
+    assert os.path.exists(db)
+
+    try:
+        run_main(['--cache-path', text, log])
+        assert False, "終了しない"
+    except SystemExit as e:
+        assert e.code == 1
+    assert read(text) == b'abc'
+
+
+if __name__ == '__main__':
+    testrunner.run_tests(globals())
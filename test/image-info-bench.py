@@ -0,0 +1,127 @@
+# image-info.py (imagetools.py) のベンチマーク
+#   PYTHONPATH に lib を登録してから実行する:  python image-info-bench.py [-n ファイル数] [-d フォルダ] [-j スレッド数]
+#   写真を模した画像 (EXIF付きの JPEG が中心) を作り、ヘッダーの解析と Pillow の Image.open() を比べる。
+#   scan_images() をスレッド並列にした場合も測る (ネットワーク上のフォルダを -d に指定すると差が大きい)。
+#   画像を作るのと比べるのに Pillow が必要。
+
+import argparse
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import imagetools
+from PIL import Image
+
+# 作る画像の割合 (形式, モード, 保存のオプション, 割合)
+TEMPLATES = [
+    ('JPEG', 'RGB', {'quality': 90}, 70),
+    ('PNG', 'RGBA', {}, 10),
+    ('WEBP', 'RGB', {}, 8),
+    ('GIF', 'P', {}, 4),
+    ('TIFF', 'RGB', {}, 4),
+    ('BMP', 'RGB', {}, 4),
+]
+
+
+def make_templates(folder):
+    """写真を模した画像を形式ごとに1つ作る (JPEG は大きな EXIF 付き)"""
+    exif = Image.Exif()
+    exif[0x010F] = 'Camera'
+    exif[0x9286] = 'x' * 30000  # メーカーノートのような大きなデータ
+    paths = []
+    for k, (image_format, mode, options, weight) in enumerate(TEMPLATES):
+        noise = [Image.effect_noise((1024, 768), 64 + c) for c in range(3)]
+        img = Image.merge('RGB', noise).convert(mode)
+        path = os.path.join(folder, f"template{k}.{image_format.lower()}")
+        if image_format == 'JPEG':
+            options = dict(options, exif=exif.tobytes())
+        img.save(path, format=image_format, **options)
+        paths.append((path, weight))
+    return paths
+
+
+def make_corpus(folder, count):
+    """テンプレートをコピー (できればハードリンク) して count 個のファイルを作る"""
+    templates = make_templates(folder)
+    total_weight = sum(weight for _, weight in templates)
+    index = 0
+    for template, weight in templates:
+        ext = os.path.splitext(template)[1]
+        for _ in range(count * weight // total_weight):
+            path = os.path.join(folder, f"{index // 1000:03d}", f"photo{index:06d}{ext}")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                os.link(template, path)
+            except OSError:
+                shutil.copyfile(template, path)
+            index += 1
+        os.remove(template)
+    return index
+
+
+def drop_caches():
+    # ページキャッシュを捨てられる場合だけ捨てる (root の Linux)
+    try:
+        subprocess.run(['sync'], check=False)
+        with open('/proc/sys/vm/drop_caches', 'w') as f:
+            f.write('3\n')
+        return True
+    except OSError:
+        return False
+
+
+def measure(label, paths, func):
+    t0 = time.perf_counter()
+    results = [func(path) for path in paths]
+    elapsed = time.perf_counter() - t0
+    print(f"{label:24} {elapsed:8.3f}秒 {len(paths) / elapsed:10.0f} ファイル/秒 {elapsed / len(paths) * 1e6:8.1f} µs/ファイル")
+    return results
+
+
+def pillow_info(path):
+    with Image.open(path) as img:
+        return (img.format, img.mode, img.width, img.height)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="image-info.py のベンチマーク")
+    parser.add_argument('-n', '--count', type=int, default=100000, help='作るファイルの数')
+    parser.add_argument('-d', '--dir', help='作らずに、このフォルダの画像で測る')
+    parser.add_argument('-j', '--jobs', type=int, default=8, help='scan_images() のスレッド数')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work:
+        if args.dir:
+            paths = sorted(p for p in glob.glob(os.path.join(args.dir, '**', '*'), recursive=True) if os.path.isfile(p))
+        else:
+            make_corpus(work, args.count)
+            paths = sorted(glob.glob(os.path.join(work, '*', '*')))
+        print(f"ファイル: {len(paths)}")
+
+        # Pillow の import にかかる時間 (元の image-info.py は起動するたびに払っていた)
+        code = "import time; t = time.perf_counter(); import PIL.Image; print(time.perf_counter() - t)"
+        seconds = float(subprocess.run([sys.executable, '-c', code], capture_output=True, text=True).stdout)
+        print(f"{'import PIL.Image':24} {seconds:8.3f}秒")
+
+        for cold in (False, True):
+            label = ' (キャッシュなし)' if cold else ''
+            if cold and not drop_caches():
+                break
+            sniffed = measure('ヘッダーの解析' + label, paths,
+                              lambda p: tuple(imagetools.get_image_info(p)))
+            if cold:
+                drop_caches()
+            expected = measure('Pillow Image.open' + label, paths, pillow_info)
+            if cold:
+                drop_caches()
+            t0 = time.perf_counter()
+            scanned = dict(imagetools.scan_images(imagetools.iter_files(paths), args.jobs))
+            elapsed = time.perf_counter() - t0
+            print(f"{f'scan_images -j {args.jobs}' + label:24} {elapsed:8.3f}秒 {len(paths) / elapsed:10.0f} ファイル/秒 "
+                  f"{elapsed / len(paths) * 1e6:8.1f} µs/ファイル")
+            assert [tuple(scanned[path]) for path in paths] == sniffed
+        same = sum(a == b for a, b in zip(sniffed, expected))
+        print(f"Pillow と同じ結果: {same}/{len(paths)}")
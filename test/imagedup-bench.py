@@ -0,0 +1,103 @@
+# imagedup.py のベンチマーク
+#   PYTHONPATH に lib を登録してから実行する:  python imagedup-bench.py [-n ハッシュの数] [-i 画像の数] [-j プロセス数]
+#   1. 似た画像のグループ分け: 多重インデックスハッシュと、NumPy で全ペアのハミング距離を計算する方法を比べる
+#   2. ハッシュの計算: 1プロセスと複数プロセスを比べる
+#   Pillow と NumPy が必要。
+
+import argparse
+import collections
+import os
+import random
+import tempfile
+import time
+import numpy as np
+from PIL import Image, ImageFilter
+import imagedup
+
+
+def random_hashes(count, seed=1):
+    # 元になるハッシュと、数ビットだけ変えたハッシュ (重複) を混ぜる
+    rng = random.Random(seed)
+    hashes = []
+    for k in range(count):
+        if hashes and rng.random() < 0.1:
+            value = int(rng.choice(hashes)[1], 16)
+            for _ in range(rng.randrange(6)):
+                value ^= 1 << rng.randrange(64)
+        else:
+            value = rng.getrandbits(64)
+        hashes.append((f"img{k:07d}.jpg", f"{value:016x}"))
+    return hashes
+
+
+def pairwise_groups(hashes, max_distance):
+    """全ペアのハミング距離を NumPy で計算してつなぎ、2つ以上のファイルを持つグループの数を返す (比較用。O(n^2))"""
+    values = np.array([int(value, 16) for _, value in sorted(hashes)], dtype=np.uint64)
+    parent = list(range(len(values)))
+
+    def find(k):
+        while parent[k] != k:
+            parent[k] = parent[parent[k]]
+            k = parent[k]
+        return k
+    for k in range(len(values)):
+        xor = values[k + 1:] ^ values[k]
+        distance = np.bitwise_count(xor)
+        for other in np.nonzero(distance <= max_distance)[0] + k + 1:
+            a, b = find(k), find(int(other))
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+    sizes = collections.Counter(find(k) for k in range(len(values)))
+    return sum(1 for size in sizes.values() if size > 1)
+
+
+def make_images(folder, count):
+    # 写真を模した画像 (ぼかしたノイズ) をいくつか作り、ハードリンクで count 個にする
+    templates = []
+    for k in range(8):
+        bands = [Image.effect_noise((1600, 1200), 60 + k + c).filter(ImageFilter.GaussianBlur(20)) for c in range(3)]
+        path = os.path.join(folder, f"template{k}.jpg")
+        Image.merge('RGB', bands).save(path, quality=90)
+        templates.append(path)
+    paths = []
+    for k in range(count):
+        path = os.path.join(folder, f"photo{k:06d}.jpg")
+        try:
+            os.link(templates[k % len(templates)], path)
+        except OSError:
+            with open(templates[k % len(templates)], 'rb') as src, open(path, 'wb') as dst:
+                dst.write(src.read())
+        paths.append(path)
+    return paths
+
+
+def measure(label, count, func):
+    t0 = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - t0
+    print(f"{label:28} {elapsed:8.3f}秒 {count / elapsed:10.0f} 件/秒")
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="imagedup.py のベンチマーク")
+    parser.add_argument('-n', '--count', type=int, default=20000, help='グループ分けするハッシュの数')
+    parser.add_argument('-i', '--images', type=int, default=1000, help='ハッシュを計算する画像の数')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='ハッシュを計算するプロセス数')
+    parser.add_argument('-d', '--distance', type=int, default=8, help='同じグループにする距離')
+    args = parser.parse_args()
+
+    hashes = random_hashes(args.count)
+    groups = measure(f'多重インデックス ({args.count})', args.count,
+                     lambda: imagedup.group_duplicates(hashes, args.distance))
+    print(f"  グループ: {len(groups)}, ファイル: {sum(len(group) for group in groups)}")
+    count = measure(f'NumPy 全ペア ({args.count})', args.count, lambda: pairwise_groups(hashes, args.distance))
+    assert count == len(groups)
+
+    with tempfile.TemporaryDirectory() as work:
+        paths = make_images(work, args.images)
+        for method in imagedup.METHODS:
+            serial = measure(f'{method} -j 1', len(paths), lambda: dict(imagedup.scan_hashes(paths, method, 1)))
+            parallel = measure(f'{method} -j {args.jobs}', len(paths),
+                               lambda: dict(imagedup.scan_hashes(paths, method, args.jobs)))
+            assert serial == parallel
@@ -0,0 +1,137 @@
+# imagedup.py のテスト
+#   PYTHONPATH に lib を登録してから実行する:  python imagedup-test.py
+#   Pillow と NumPy があれば、縮小・再圧縮した画像のハッシュが近いことも確かめる
+
+import itertools
+import os
+import random
+import imagedup
+import imagetools
+import mediacache
+import testrunner
+
+
+def random_hashes(count, seed=1):
+    # 元になるハッシュと、数ビットだけ変えたハッシュを混ぜる
+    rng = random.Random(seed)
+    hashes = []
+    for k in range(count):
+        if hashes and rng.random() < 0.3:
+            value = int(rng.choice(hashes)[1], 16)
+            for _ in range(rng.randrange(8)):
+                value ^= 1 << rng.randrange(64)
+        else:
+            value = rng.getrandbits(64)
+        hashes.append((f"img{k:05d}.jpg", f"{value:016x}"))
+    return hashes
+
+
+# 多重インデックスハッシュで探した組は、全ペアを比べた結果と同じ
+def test_similar_pairs(work):
+    try:
+        import numpy
+    except ImportError:
+        print("    (NumPy がないので省略)")
+        return
+    values = [int(value, 16) for _, value in random_hashes(600)]
+    for max_distance in (0, 3, 8, 13):
+        expected = [[i, j] for i, j in itertools.combinations(range(len(values)), 2)
+                    if imagedup.hamming(values[i], values[j]) <= max_distance]
+        assert imagedup.similar_pairs(values, max_distance).tolist() == expected, max_distance
+    assert imagedup.similar_pairs([], 8).shape == (0, 2)
+
+
+# グループは距離 max_distance 以下でつながったファイルの集まりで、1つだけのファイルは含めない
+def test_groups(work):
+    try:
+        import numpy
+    except ImportError:
+        print("    (NumPy がないので省略)")
+        return
+    hashes = random_hashes(1500)
+    max_distance = 5
+    groups = imagedup.group_duplicates(reversed(hashes), max_distance)
+
+    # 全ペアを比べてつないだ結果と比べる
+    parent = {path: path for path, _ in hashes}
+
+    def find(path):
+        while parent[path] != path:
+            path = parent[path]
+        return path
+    for (a, x), (b, y) in itertools.combinations(hashes, 2):
+        if imagedup.hamming(int(x, 16), int(y, 16)) <= max_distance:
+            parent[max(find(a), find(b))] = min(find(a), find(b))
+    expected = {}
+    for path, _ in hashes:
+        expected.setdefault(find(path), []).append(path)
+    expected = sorted(paths for paths in expected.values() if len(paths) > 1)
+    assert [[path for path, _, _ in group] for group in groups] == expected
+
+    for group in groups:
+        first = int(group[0][1], 16)
+        assert group[0][2] == 0
+        assert all(distance == imagedup.hamming(first, int(value, 16)) for _, value, distance in group)
+    assert imagedup.group_duplicates([('a', '0' * 16), ('b', '0' * 16), ('c', 'f' * 16)], 0) == \
+        [[('a', '0' * 16, 0), ('b', '0' * 16, 0)]]
+
+
+# 縮小・再圧縮した画像のハッシュは近く、別の画像のハッシュは遠い
+def test_similar_images(work):
+    try:
+        import numpy
+        from PIL import Image, ImageFilter
+    except ImportError:
+        print("    (Pillow または NumPy がないので省略)")
+        return
+    paths = []
+    for k in range(4):
+        bands = [Image.effect_noise((640, 480), 60 + k * 3 + c).filter(ImageFilter.GaussianBlur(20)) for c in range(3)]
+        img = Image.merge('RGB', [band.point(lambda v: (v - 128) * 4 + 128) for band in bands])
+        copies = [(img, 'jpg', {'quality': 95}), (img.resize((320, 240)), 'jpg', {'quality': 50}),
+                  (img, 'png', {}), (img.resize((160, 120)), 'webp', {})]
+        for n, (copy, ext, options) in enumerate(copies):
+            path = os.path.join(work, f"{k}_{n}.{ext}")
+            copy.save(path, **options)
+            paths.append(path)
+    text = os.path.join(work, 'a.txt')
+    with open(text, 'w') as f:
+        f.write('not an image')
+
+    for method, max_distance in (('dhash', 10), ('phash', 10)):
+        results = dict(imagedup.scan_hashes(paths + [text], method, jobs=2))
+        assert isinstance(results.pop(text), imagetools.UnknownFormatError)
+        groups = imagedup.group_duplicates([(path, h.hash) for path, h in results.items()], max_distance)
+        assert [[os.path.basename(path)[0] for path, _, _ in group] for group in groups] == \
+            [[str(k)] * 4 for k in range(4)], (method, groups)
+        assert dict(imagedup.scan_hashes(paths, method, jobs=1)) == results
+
+
+# ハッシュはキャッシュに保存され、2回目は計算しない
+def test_cache(work):
+    hashes = dict(random_hashes(20))
+    paths = []
+    for name in hashes:
+        path = os.path.join(work, name)
+        with open(path, 'w') as f:
+            f.write(name)
+        paths.append(path)
+
+    computed = []
+
+    def scan(paths):
+        for path in paths:
+            computed.append(path)
+            yield path, imagedup.ImageHash(hashes[os.path.basename(path)])
+
+    db = os.path.join(work, 'media.sqlite3')
+    for _ in range(2):
+        with mediacache.MediaCache(db) as cache:
+            results = list(mediacache.scan_with_cache(paths, cache, 'dhash', scan, imagedup.ImageHash,
+                                                      imagetools.UnknownFormatError, ordered=True))
+        assert results == [(path, imagedup.ImageHash(hashes[os.path.basename(path)])) for path in paths]
+    assert computed == paths
+
+
+if __name__ == '__main__':
+    testrunner.run_tests(globals())
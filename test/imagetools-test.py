@@ -0,0 +1,175 @@
+# imagetools.py のテスト
+#   PYTHONPATH に lib を登録してから実行する:  python imagetools-test.py
+#   Pillow があれば、Pillow で作った画像で Image.open() と同じ結果になることも確かめる
+
+import io
+import os
+import struct
+import zlib
+import imagetools
+import testrunner
+
+
+def sniff(data):
+    return imagetools.sniff_image(io.BytesIO(data))
+
+
+def png(width, height, bit_depth, color_type):
+    ihdr = struct.pack('>IIBBBBB', width, height, bit_depth, color_type, 0, 0, 0)
+    chunk = struct.pack('>I', 13) + b'IHDR' + ihdr
+    return b'\x89PNG\r\n\x1a\n' + chunk + struct.pack('>I', zlib.crc32(chunk[4:]))
+
+
+def jpeg(width, height, components, segments=b'', precision=8):
+    sof = struct.pack('>HBHHB', 8 + 3 * components, precision, height, width, components)
+    sof += b'\x01\x11\x00' * components
+    return b'\xff\xd8' + segments + b'\xff\xc0' + sof + b'\xff\xda\x00\x02'
+
+
+def segment(marker, data):
+    return bytes((0xFF, marker)) + struct.pack('>H', len(data) + 2) + data
+
+
+def tiff(width, height, photometric, bits, extra=None, endian='<'):
+    tags = [(256, 4, [width]), (257, 3, [height]), (258, 3, bits), (262, 3, [photometric]),
+            (277, 3, [len(bits)])]
+    if extra is not None:
+        tags.append((338, 3, extra))
+    header = (b'II*\x00' if endian == '<' else b'MM\x00*') + struct.pack(endian + 'I', 8)
+    ifd = struct.pack(endian + 'H', len(tags))
+    overflow = b''
+    base = 8 + 2 + 12 * len(tags) + 4
+    for tag, type_, values in tags:
+        code = 'I' if type_ == 4 else 'H'
+        data = struct.pack(f'{endian}{len(values)}{code}', *values)
+        if len(data) > 4:
+            value = struct.pack(endian + 'I', base + len(overflow))
+            overflow += data
+        else:
+            value = data.ljust(4, b'\x00')
+        ifd += struct.pack(endian + 'HHI', tag, type_, len(values)) + value
+    return header + ifd + b'\x00' * 4 + overflow
+
+
+# ヘッダーだけから分かる形式
+def test_headers(work):
+    assert sniff(png(640, 480, 8, 2)) == ('PNG', 'RGB', 640, 480)
+    assert sniff(png(1, 2, 1, 0)) == ('PNG', '1', 1, 2)
+    assert sniff(png(3, 4, 16, 6)) == ('PNG', 'RGBA', 3, 4)
+    assert sniff(jpeg(4000, 3000, 3)) == ('JPEG', 'RGB', 4000, 3000)
+    assert sniff(jpeg(10, 20, 1)) == ('JPEG', 'L', 10, 20)
+    assert sniff(jpeg(10, 20, 4)) == ('JPEG', 'CMYK', 10, 20)
+    assert sniff(b'GIF89a' + struct.pack('<HHBBB', 320, 240, 0x80, 0, 0) + b'\x10\x20\x30' * 2
+                 + b'!\xf9\x04\x00\x00\x00\x00\x00' + b',' + b'\x00' * 9) == ('GIF', 'P', 320, 240)
+    bmp = b'BM' + b'\x00' * 12 + struct.pack('<IiiHHIIiiII', 40, 100, -50, 1, 24, 0, 0, 0, 0, 0, 0)
+    assert sniff(bmp) == ('BMP', 'RGB', 100, 50)
+    vp8l = b'RIFF\x00\x00\x00\x00WEBPVP8L\x00\x00\x00\x00\x2f' + struct.pack('<I', 99 | 49 << 14 | 1 << 28)
+    assert sniff(vp8l + b'\x00' * 8) == ('WEBP', 'RGBA', 100, 50)
+    vp8x = b'RIFF\x00\x00\x00\x00WEBPVP8X\x0a\x00\x00\x00\x02\x00\x00\x00'
+    assert sniff(vp8x + (1919).to_bytes(3, 'little') + (1079).to_bytes(3, 'little')) == ('WEBP', 'RGB', 1920, 1080)
+    assert sniff(tiff(30, 20, 2, [8, 8, 8])) == ('TIFF', 'RGB', 30, 20)
+    assert sniff(tiff(30, 20, 2, [8, 8, 8, 8], [2], endian='>')) == ('TIFF', 'RGBA', 30, 20)
+    assert sniff(tiff(30, 20, 2, [8, 8, 8, 8], [0])) == ('TIFF', 'RGB', 30, 20)
+    assert sniff(tiff(30, 20, 1, [8])) == ('TIFF', 'L', 30, 20)
+
+
+# 大きな EXIF は読まずに読み飛ばし、複数の画像を持つ MPF は MPO になる
+def test_jpeg_segments(work):
+    exif = segment(0xE1, b'Exif\x00\x00' + b'\x00' * 60000)
+    data = jpeg(1200, 800, 3, exif + b'\xff\xff' + segment(0xDB, b'\x00' * 65))
+    assert sniff(data) == ('JPEG', 'RGB', 1200, 800)
+
+    def mpf(count):
+        ifd = struct.pack('<H', 1) + struct.pack('<HHII', 0xB001, 4, 1, count) + b'\x00' * 4
+        return segment(0xE2, b'MPF\x00' + b'II*\x00' + struct.pack('<I', 8) + ifd)
+    assert sniff(jpeg(8, 8, 3, mpf(2))) == ('MPO', 'RGB', 8, 8)
+    assert sniff(jpeg(8, 8, 3, mpf(1))) == ('JPEG', 'RGB', 8, 8)
+
+
+# Pillow と同じ結果にならないかもしれない場合や、壊れたヘッダーは None (Pillow に任せる)
+def test_fallback(work):
+    assert sniff(png(5, 5, 16, 0)) is None
+    assert sniff(jpeg(5, 5, 3, precision=12)) is None
+    assert sniff(b'\xff\xd8\xff\xda\x00\x02') is None
+    assert sniff(b'GIF89a' + struct.pack('<HHBBB', 8, 8, 0x80, 0, 0) + b'\x00\x00\x00\x01\x01\x01') is None
+    assert sniff(tiff(30, 20, 6, [8, 8, 8])) is None
+    assert sniff(b'P6\n1 1\n255\n\x00\x00\x00') is None
+    assert sniff(b'') is None
+    for data in (png(640, 480, 8, 2), jpeg(40, 30, 3), tiff(30, 20, 2, [8, 8, 8])):
+        for size in range(len(data)):
+            assert sniff(data[:size]) in (None, sniff(data))
+
+
+# ヘッダーから分からないファイルは、Pillow がなくても画像でなければ UnknownFormatError
+def test_get_image_info(work):
+    path = os.path.join(work, 'a.png')
+    with open(path, 'wb') as f:
+        f.write(png(7, 9, 8, 6))
+    assert imagetools.get_image_info(path) == ('PNG', 'RGBA', 7, 9)
+    text = os.path.join(work, 'a.txt')
+    with open(text, 'w') as f:
+        f.write('not an image')
+    try:
+        imagetools.get_image_info(text, use_pillow=False)
+        assert False
+    except imagetools.UnknownFormatError:
+        pass
+
+
+# フォルダと '**' を再帰的に展開し、並列に調べても結果は同じ (keep-order なら入力の順)
+def test_scan(work):
+    expected = []
+    for k in range(60):
+        path = os.path.join(work, f"d{k % 3}", 'sub' * (k % 2), f"{k:03d}.png")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(png(k + 1, 2, 8, 2) if k % 7 else b'not an image')
+        expected.append(path)
+    paths = list(imagetools.iter_files([work, os.path.join(work, '**', '*.png')]))
+    assert sorted(paths) == sorted(expected)
+    assert paths == sorted(paths, key=lambda p: (os.path.dirname(p), p))
+
+    def scan(paths, **kwargs):
+        # 例外は型だけを比べる
+        return [(path, type(info) if isinstance(info, Exception) else info)
+                for path, info in imagetools.scan_images(iter(paths), **kwargs)]
+    serial = scan(paths, jobs=1)
+    assert [path for path, _ in serial] == paths
+    assert scan(paths, jobs=4, ordered=True) == serial
+    assert sorted(scan(paths, jobs=4), key=lambda r: paths.index(r[0])) == serial
+    assert sum(info is imagetools.UnknownFormatError for _, info in serial) == 9
+
+
+# Pillow で作った画像で、Image.open() と同じ結果になる
+def test_same_as_pillow(work):
+    try:
+        from PIL import Image
+    except ImportError:
+        print("    (Pillow がないので省略)")
+        return
+    formats = [('PNG', {}), ('PNG', {'transparency': 0}), ('JPEG', {}), ('JPEG', {'progressive': True}),
+               ('GIF', {}), ('BMP', {}), ('WEBP', {}), ('WEBP', {'lossless': True}),
+               ('TIFF', {}), ('TIFF', {'compression': 'tiff_lzw'}), ('PPM', {})]
+    checked = sniffed = 0
+    for mode in ('1', 'L', 'P', 'RGB', 'RGBA', 'LA', 'CMYK', 'I;16', 'RGBX', 'PA'):
+        img = Image.new(mode, (37, 23))
+        if mode == 'P':
+            img.putpalette(bytes(range(256)) * 2 + bytes(256))
+        for image_format, options in formats:
+            buffer = io.BytesIO()
+            try:
+                img.save(buffer, format=image_format, **options)
+            except (OSError, ValueError, KeyError):
+                continue
+            with Image.open(io.BytesIO(buffer.getvalue())) as opened:
+                expected = (opened.format, opened.mode, opened.width, opened.height)
+            info = sniff(buffer.getvalue())
+            checked += 1
+            if info is not None:
+                sniffed += 1
+                assert info == expected, (mode, image_format, options, info, expected)
+    assert sniffed > checked // 2, (sniffed, checked)
+
+
+if __name__ == '__main__':
+    testrunner.run_tests(globals())
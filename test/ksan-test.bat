@@ -17,3 +17,63 @@ echo ksan.py (1 + 2) * 3 + 4 / 5
 echo ------------------------------
 echo ksan.py math.cos(math.pi)
 %cmd%  math.cos(math.pi)
+
+echo ------------------------------
+echo ksan.py cos(pi) + sqrt(2)
+%cmd% cos(pi) + sqrt(2)
+
+echo ------------------------------
+echo ksan.py __import__('os')   -- ERROR
+%cmd% __import__('os')
+
+echo ------------------------------
+echo stdin: r = 2 / pi * r ** 2 / _ * 2
+(echo r = 2& echo pi * r ** 2& echo _ * 2) | %cmd%
+
+echo ------------------------------
+echo ksan.py sin(x) * x x=0:1:0.25
+%cmd% sin(x) * x x=0:1:0.25
+
+echo ------------------------------
+echo ksan.py x * y x=1:3 y=0:1:0.5 --csv
+%cmd% x * y x=1:3 y=0:1:0.5 --csv
+
+echo ------------------------------
+echo stdin: 1 / 4 / 9 -- ksan.py sqrt(x) x=-
+(echo 1& echo 4& echo 9) | %cmd% sqrt(x) x=-
+
+echo ------------------------------
+echo ksan.py pow(9, 9 ** 9)   -- ERROR
+%cmd% pow(9, 9 ** 9)
+
+echo ------------------------------
+echo ksan.py factorial(10 ** 7)   -- ERROR
+%cmd% factorial(10 ** 7)
+
+echo ------------------------------
+echo stdin: _power = pow / 9 ** 9 ** 9   -- ERROR, ERROR
+(echo _power = pow& echo 9 ** 9 ** 9) | %cmd%
+
+echo ------------------------------
+echo ksan.py x ** 2 x=0:3
+%cmd% x ** 2 x=0:3
+
+echo ------------------------------
+echo ksan.py 1 ^<^< x x=0:3
+%cmd% 1 ^<^< x x=0:3
+
+echo ------------------------------
+echo ksan.py exec(chr(105)) or x x=0:0   -- ERROR
+%cmd% exec(chr(105)) or x x=0:0
+
+echo ------------------------------
+echo ksan.py math.prod([2 ** 999999] * 3000)   -- ERROR
+%cmd% math.prod([2 ** 999999] * 3000)
+
+echo ------------------------------
+echo ksan.py sum([1] * 10 ** 9)   -- ERROR
+%cmd% sum([1] * 10 ** 9)
+
+echo ------------------------------
+echo ksan.py prod([2, 3, 4]) + sum([1, 2.5])
+%cmd% prod([2, 3, 4]) + sum([1, 2.5])
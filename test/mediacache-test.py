@@ -0,0 +1,141 @@
+# mediacache.py のテスト
+#   PYTHONPATH に lib を登録してから実行する:  python mediacache-test.py
+
+import os
+import time
+import mediacache
+import testrunner
+
+
+class NotMedia(Exception):
+    pass
+
+
+def make_files(work, count):
+    paths = []
+    for k in range(count):
+        path = os.path.join(work, f"{k:04d}.dat")
+        with open(path, 'wb') as f:
+            f.write(b'x' * k)
+        paths.append(path)
+    return paths
+
+
+def probe(path):
+    # ファイルの長さを幅とする「画像」。長さが3の倍数のファイルは画像ではない
+    size = os.path.getsize(path)
+    if size % 3 == 0:
+        return NotMedia(path)
+    return ('PNG', 'RGB', size, 1)
+
+
+class Scanner:
+    """scan_with_cache に渡す scan。調べたパスを記録し、ordered でなければ逆順に返す"""
+
+    def __init__(self, ordered):
+        self.ordered = ordered
+        self.scanned = []
+
+    def __call__(self, paths):
+        batch = []
+        for path in paths:
+            self.scanned.append(path)
+            batch.append((path, probe(path)))
+            if len(batch) == 7:
+                yield from (batch if self.ordered else reversed(batch))
+                batch = []
+        yield from (batch if self.ordered else reversed(batch))
+
+
+def run(cache, paths, ordered):
+    scanner = Scanner(ordered)
+    results = list(mediacache.scan_with_cache(iter(paths), cache, 'image', scanner,
+                                              lambda *values: values, NotMedia, ordered))
+    return [(path, type(info) if isinstance(info, Exception) else info) for path, info in results], scanner.scanned
+
+
+# 2回目は変更のないファイルを調べず、同じ結果を返す。認識できなかったことも保存する
+def test_second_run(work):
+    paths = make_files(work, 1200)
+    db = os.path.join(work, 'cache', 'media.sqlite3')
+    expected = [(path, NotMedia if isinstance(probe(path), NotMedia) else probe(path)) for path in paths]
+    for ordered in (True, False):
+        with mediacache.MediaCache(db) as cache:
+            results, scanned = run(cache, paths, ordered)
+        assert sorted(results) == expected
+        if ordered:
+            assert results == expected
+            assert scanned == paths
+        else:
+            assert scanned == []
+
+
+# 保存した後に変更されたファイルだけを調べ直す (順番は入力の順のまま)
+def test_changed(work):
+    paths = make_files(work, 50)
+    db = os.path.join(work, 'media.sqlite3')
+    with mediacache.MediaCache(db) as cache:
+        run(cache, paths, True)
+    with open(paths[10], 'ab') as f:
+        f.write(b'y')
+    st = os.stat(paths[20])
+    os.utime(paths[20], ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+    with mediacache.MediaCache(db) as cache:
+        results, scanned = run(cache, paths, True)
+    assert scanned == [paths[10], paths[20]]
+    assert [path for path, _ in results] == paths
+    assert results[10] == (paths[10], ('PNG', 'RGB', 11, 1))
+
+
+# 動画の列も保存でき、画像と同じパスでも別に保存する
+def test_kinds(work):
+    path = make_files(work, 2)[1]
+    db = os.path.join(work, 'media.sqlite3')
+    with mediacache.MediaCache(db) as cache:
+        cache.store(path, 'video', (1920, 1080, 29.97, 300, 10.01))
+        cache.store(path, 'image', None)
+    with mediacache.MediaCache(db) as cache:
+        assert cache.lookup_many([path], 'video')[0] == {path: (1920, 1080, 29.97, 300, 10.01)}
+        assert cache.lookup_many([path], 'image')[0] == {path: None}
+        found, stats = cache.lookup_many([path + '.missing'], 'image')
+        assert found == {} and stats == {path + '.missing': None}
+
+
+# 閉じるときに、上限を超えた分と長く使われていない結果を削除する
+def test_prune(work):
+    paths = make_files(work, 30)
+    db = os.path.join(work, 'media.sqlite3')
+    with mediacache.MediaCache(db) as cache:
+        for path in paths[:20]:
+            cache.store(path, 'image', ('PNG', 'RGB', 1, 1))
+    time.sleep(0.01)
+    with mediacache.MediaCache(db, max_entries=15) as cache:
+        assert len(cache.lookup_many(paths[15:20], 'image')[0]) == 5
+    with mediacache.MediaCache(db) as cache:
+        found = cache.lookup_many(paths, 'image')[0]
+    assert len(found) == 15 and all(path in found for path in paths[15:20])
+
+    cache = mediacache.MediaCache(db, max_age_days=1)
+    cache.now += 2 * 86400
+    cache.lookup_many(paths[15:18], 'image')
+    cache.close()
+    with mediacache.MediaCache(db) as cache:
+        assert sorted(cache.lookup_many(paths, 'image')[0]) == paths[15:18]
+
+
+# SQLite のデータベースではないファイルは CacheError にし、中身を変えない
+def test_not_database(work):
+    path = os.path.join(work, 'photo.jpg')
+    with open(path, 'wb') as f:
+        f.write(b'\xff\xd8\xff\xe0' + b'x' * 200)
+    try:
+        mediacache.MediaCache(path)
+        assert False, "CacheError にならない"
+    except mediacache.CacheError as e:
+        assert path in str(e)
+    with open(path, 'rb') as f:
+        assert f.read() == b'\xff\xd8\xff\xe0' + b'x' * 200
+
+
+if __name__ == '__main__':
+    testrunner.run_tests(globals())
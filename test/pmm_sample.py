@@ -0,0 +1,89 @@
+# pmm_sample.py
+#
+# ppm_parse.py のテスト・ベンチマーク用に、合成PMMファイルと探索フォルダを作る
+
+import os
+import random
+
+# PMMファイルが参照するファイルの拡張子
+EXTENSIONS = ('pmd', 'x', 'bmp', 'wav', 'avi')
+
+# ファイル名に使う文字 (Shift_JISのフルパスになるよう日本語も混ぜる)
+NAME_PARTS = ('model', 'stage', 'motion', 'ミク', '背景', 'アクセサリ', 'effect', '音声')
+
+
+# ランダムなバイナリデータを作る
+#   '.' を含むと意図しない参照が生まれるので 0 に置き換える
+def random_filler(rng, size):
+    return rng.randbytes(size).replace(b'.', b'\x00')
+
+
+# 参照するファイル名の一覧を作る
+def make_names(count, seed=0, extensions=EXTENSIONS):
+    rng = random.Random(seed)
+    names = []
+    for k in range(count):
+        ext = extensions[k % len(extensions)]
+        names.append(f"{rng.choice(NAME_PARTS)}{k:04d}.{ext}")
+    return names
+
+
+# 元のフルパス (PMMファイルに埋め込まれている、作成者の環境でのパス)
+def original_path(name, depth=2, drive='C:'):
+    folders = '\\'.join(f"フォルダ{d}" for d in range(depth))
+    return f"{drive}\\MMD\\{folders}\\{name}"
+
+
+# 合成PMMファイルを作る
+#   path: 出力ファイルのパス
+#   size: おおよそのファイルサイズ (バイト)
+#   names: 参照するファイル名のリスト (順に繰り返し使う)
+#   density: 1MBあたりの参照の数
+#   depth: 元のパスのフォルダの深さ (大きくすると書き換え後のパスが短くなりパディングが入る)
+#   戻り値: 埋め込んだ [(オフセット, フルパス)] のリスト
+def make_pmm(path, size, names, density=100, depth=2, seed=0):
+    rng = random.Random(seed)
+    count = max(1, int(size * density / (1024 * 1024)))
+    gap = max(16, size // count)
+
+    refs = []
+    chunks = [b'Polygon Movie maker 0001\x00']
+    offset = len(chunks[0])
+    for k in range(count):
+        filler = random_filler(rng, rng.randint(gap // 2, gap * 3 // 2))
+        full_path = original_path(names[k % len(names)], depth)
+        data = full_path.encode('shift_jis') + b'\x00'
+        chunks.append(filler)
+        offset += len(filler)
+        refs.append((offset, full_path))
+        chunks.append(data)
+        offset += len(data)
+    chunks.append(random_filler(rng, 64))
+
+    with open(path, 'wb') as f:
+        f.writelines(chunks)
+    return refs
+
+
+# 探索フォルダを作り、names のファイルを入れる
+#   root: 探索フォルダのパス
+#   names: 作成するファイル名のリスト
+#   missing: 作成しない (見つからない) ファイルの割合
+#   subdirs: ファイルを振り分けるサブフォルダの数
+#   decoys: 関係ないファイルの数 (探索コストを増やす)
+#   戻り値: 作成したファイル名のリスト
+def make_asset_folder(root, names, missing=0.0, subdirs=4, decoys=0, seed=0):
+    rng = random.Random(seed)
+    created = []
+    for k, name in enumerate(names):
+        if rng.random() < missing:
+            continue
+        folder = os.path.join(root, f"sub{k % subdirs}", f"deep{k % 3}")
+        os.makedirs(folder, exist_ok=True)
+        open(os.path.join(folder, name), 'wb').close()
+        created.append(name)
+    for k in range(decoys):
+        folder = os.path.join(root, f"decoy{k % subdirs}")
+        os.makedirs(folder, exist_ok=True)
+        open(os.path.join(folder, f"decoy{k:06d}.txt"), 'wb').close()
+    return created
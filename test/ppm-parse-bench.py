@@ -0,0 +1,53 @@
+# ppm_parse.py のベンチマーク
+#   PYTHONPATH に lib を登録してから実行する:  python ppm-parse-bench.py [-s MB] [-d 参照数/MB]
+
+import argparse
+import os
+import tempfile
+import time
+import ppm_parse
+import pmm_sample
+
+
+def measure(label, size, refs, func):
+    t0 = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - t0
+    mb_per_sec = size / (1024 * 1024) / elapsed if elapsed > 0 else float('inf')
+    us_per_ref = elapsed / refs * 1e6 if refs else 0.0
+    print(f"{label:24} {elapsed:8.3f}秒 {mb_per_sec:9.1f} MB/s {us_per_ref:10.1f} µs/参照")
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="ppm_parse.py のベンチマーク")
+    parser.add_argument('-s', '--size', type=float, default=16, help='PMMファイルのサイズ (MB)')
+    parser.add_argument('-d', '--density', type=int, default=200, help='1MBあたりの参照の数')
+    parser.add_argument('-n', '--names', type=int, default=200, help='参照するファイルの種類')
+    parser.add_argument('--decoys', type=int, default=2000, help='探索フォルダに置く関係ないファイルの数')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work:
+        size = int(args.size * 1024 * 1024)
+        names = pmm_sample.make_names(args.names)
+        s1 = os.path.join(work, 's1')
+        s2 = os.path.join(work, 's2')
+        pmm_sample.make_asset_folder(s1, names, missing=0.3, decoys=args.decoys, seed=1)
+        pmm_sample.make_asset_folder(s2, names, decoys=args.decoys, seed=2)
+        src = os.path.join(work, 'bench.pmm')
+        refs = len(pmm_sample.make_pmm(src, size, names, density=args.density, depth=8))
+        size = os.path.getsize(src)
+        print(f"PMMファイル: {size / (1024 * 1024):.1f} MB, 参照: {refs}, "
+              f"探索フォルダのファイル: {2 * (args.names + args.decoys)}")
+
+        measure('iter_pmm_references', size, refs,
+                lambda: sum(1 for _ in ppm_parse.iter_pmm_references(src)))
+        measure('pmm_parse (出力なし)', size, refs,
+                lambda: ppm_parse.pmm_parse(src, None, s1, s2, logs=[]))
+        index = measure('build_asset_index', size, refs,
+                        lambda: ppm_parse.build_asset_index(s1, s2))
+        measure('pmm_parse (索引)', size, refs,
+                lambda: ppm_parse.pmm_parse(src, os.path.join(work, 'o1'), None, None,
+                                            asset_index=index, logs=[]))
+        measure('pmm_parse (フォルダ探索)', size, refs,
+                lambda: ppm_parse.pmm_parse(src, os.path.join(work, 'o2'), s1, s2, logs=[]))
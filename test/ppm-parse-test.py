@@ -0,0 +1,182 @@
+# ppm_parse.py の書き換え結果を固定するテスト
+#   PYTHONPATH に lib を登録してから実行する:  python ppm-parse-test.py
+
+import contextlib
+import io
+import os
+import ppm_parse
+import pmm_sample
+import testrunner
+
+# 既存の書き換え動作 (パディング、長いパスでの上書きなど) を変えないことを確認する
+HEADER = b'Polygon Movie maker 0001\x00'
+TRAILER = b'\x00\x01\x02TRAILER'
+
+
+def sjis(s):
+    return s.encode('shift_jis')
+
+
+# 探索フォルダにファイルを作り、pmm_parse() が書き換えるフルパスを返す
+def touch(folder, name):
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, name)
+    open(path, 'wb').close()
+    return os.path.realpath(path)
+
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def parse(work, data, *search_folders, **kwargs):
+    src = write(os.path.join(work, 'in.pmm'), data)
+    out = os.path.join(work, 'out')
+    folders = list(search_folders) + [None] * (2 - len(search_folders))
+    code, paths = ppm_parse.pmm_parse(src, out, folders[0], folders[1], logs=[], **kwargs)
+    out_file = os.path.join(out, 'in.pmm')
+    return code, paths, (read(out_file) if os.path.exists(out_file) else None)
+
+
+# 新しいパスが短い場合は、元のパスの長さまで NUL で埋める
+def test_shorter_path_is_padded(work):
+    old = 'C:\\' + 'とても長いフォルダ名\\' * 12 + 'model.pmd'
+    new = touch(os.path.join(work, 's1'), 'model.pmd')
+    diff = len(sjis(old)) - len(sjis(new))
+    assert diff > 0
+    code, paths, out = parse(work, HEADER + sjis(old) + TRAILER, os.path.join(work, 's1'))
+    assert code == 0
+    assert paths == old
+    assert out == HEADER + sjis(new) + b'\x00' * diff + TRAILER
+
+
+# 新しいパスが長い場合は、後続のバイトを上書きする (ファイルの長さは変わらない)
+def test_longer_path_overwrites_following_bytes(work):
+    old = 'C:\\a.pmd'
+    new = touch(os.path.join(work, 's1', 'とても長いフォルダ名' * 3), 'a.pmd')
+    diff = len(sjis(new)) - len(sjis(old))
+    assert diff > 0
+    body = b'\x00' * diff + TRAILER
+    code, _, out = parse(work, HEADER + sjis(old) + body, os.path.join(work, 's1'))
+    assert code == 0
+    assert out == HEADER + sjis(new) + TRAILER
+    assert len(out) == len(HEADER + sjis(old) + body)
+
+
+# .x は後ろに NUL があるときだけ参照とみなす
+def test_x_reference(work):
+    new = touch(os.path.join(work, 's1'), 'stage.x')
+    data = HEADER + sjis('C:\\long\\long\\long\\long\\long\\long\\long\\long\\dir\\stage.x') + b'\x00' + TRAILER
+    code, paths, out = parse(work, data, os.path.join(work, 's1'))
+    assert code == 0
+    assert paths.endswith('stage.x')
+    assert out.startswith(HEADER + sjis(new) + b'\x00')
+    assert len(out) == len(data)
+
+    data = HEADER + sjis('C:\\dir\\stage.xyz') + b'\x00' + TRAILER
+    code, paths, out = parse(work, data, os.path.join(work, 's1'))
+    assert (code, paths, out) == (0, '', data)
+
+
+# ':' のないパスは参照とみなさない
+def test_relative_path_is_ignored(work):
+    data = HEADER + b'model\\motion.pmd\x00' + TRAILER
+    code, paths, out = parse(work, data, os.path.join(work, 's1'))
+    assert (code, paths, out) == (0, '', data)
+
+
+# ファイル名は大文字小文字を区別せず探し、探索フォルダ1を優先する
+def test_lookup_is_case_insensitive_and_ordered(work):
+    new = touch(os.path.join(work, 's1', 'a'), 'motion.bmp')
+    touch(os.path.join(work, 's2'), 'motion.bmp')
+    old = 'C:\\' + 'x' * 200 + '\\MOTION.BMP'
+    code, _, out = parse(work, HEADER + sjis(old) + TRAILER,
+                         os.path.join(work, 's2', 'none'), os.path.join(work, 's1'))
+    assert code == 0 and out.startswith(HEADER + sjis(new) + b'\x00')
+    code, _, out2 = parse(work, HEADER + sjis(old) + TRAILER,
+                          os.path.join(work, 's1'), os.path.join(work, 's2'))
+    assert out2 == out
+
+
+# 見つからない .wav/.avi はそのまま、.pmd/.x/.bmp は失敗する
+def test_missing_assets(work):
+    data = HEADER + sjis('C:\\dir\\voice.wav') + b'\x00' + sjis('D:\\dir\\movie.avi') + TRAILER
+    code, paths, out = parse(work, data, os.path.join(work, 's1'))
+    assert code == 0 and out == data
+    assert paths == 'C:\\dir\\voice.wav,D:\\dir\\movie.avi'
+
+    work = os.path.join(work, 'fail')
+    os.makedirs(work)
+    data = HEADER + sjis('C:\\dir\\model.pmd') + TRAILER
+    code, paths, out = parse(work, data, os.path.join(work, 's1'))
+    assert (code, paths, out) == (-1, '', None)
+
+
+# 索引を使っても、探索フォルダを直接探しても同じ結果になる
+def test_asset_index_matches_search(work):
+    names = pmm_sample.make_names(40, seed=1)
+    pmm_sample.make_asset_folder(os.path.join(work, 's1'), names[:20], seed=1)
+    pmm_sample.make_asset_folder(os.path.join(work, 's2'), names, missing=0.0, seed=2)
+    src = os.path.join(work, 'corpus.pmm')
+    pmm_sample.make_pmm(src, 256 * 1024, names, density=400, depth=6, seed=1)
+    s1, s2 = os.path.join(work, 's1'), os.path.join(work, 's2')
+
+    code1, paths1 = ppm_parse.pmm_parse(src, os.path.join(work, 'o1'), s1, s2, logs=[])
+    index = ppm_parse.build_asset_index(s1, s2)
+    code2, paths2 = ppm_parse.pmm_parse(src, os.path.join(work, 'o2'), None, None,
+                                        asset_index=index, logs=[])
+    assert code1 == code2 == 0 and paths1 == paths2
+    assert read(os.path.join(work, 'o1', 'corpus.pmm')) == read(os.path.join(work, 'o2', 'corpus.pmm'))
+
+
+# 参照一覧は埋め込んだパスと一致し、pmm_parse() のパスリストと同じ順になる
+def test_inventory(work):
+    names = pmm_sample.make_names(10, seed=3) + ['a,b.wav']
+    src = os.path.join(work, 'corpus.pmm')
+    embedded = pmm_sample.make_pmm(src, 64 * 1024, names, density=300, seed=3)
+    refs = list(ppm_parse.iter_pmm_references(src))
+    assert [(r.offset, r.path) for r in refs] == embedded
+    assert ','.join(r.path for r in refs) == ppm_parse.pmm_parse(src, None, None, None, logs=[])[1]
+    data = read(src)
+    for r in refs:
+        assert data[r.offset:r.offset + r.length] == sjis(r.path)
+        assert r.path.endswith('\\' + r.file_name) and r.file_name.endswith('.' + r.extension)
+
+
+# 参照一覧は -j の並列数によらず、入力順に同じ内容を表示する
+def test_inventory_jobs(work):
+    for k in range(4):
+        names = pmm_sample.make_names(5, seed=k)
+        pmm_sample.make_pmm(os.path.join(work, f"p{k}.pmm"), 16 * 1024, names, density=100, seed=k)
+    outputs = []
+    for jobs in (1, 2):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            ppm_parse.print_inventory([work], None, None, jobs=jobs)
+        # 最後の行は処理時間を含むので比べない
+        outputs.append(out.getvalue().splitlines()[:-1])
+    assert outputs[0] == outputs[1]
+    assert [line.split('\t')[0] for line in outputs[0][:-1]] == \
+        sorted(line.split('\t')[0] for line in outputs[0][:-1])
+
+
+# 出力先が入力と同じファイルでも正しく書き換え、作業ファイルを残さない
+def test_output_over_input(work):
+    new = touch(os.path.join(work, 's1'), 'model.pmd')
+    old = 'C:\\' + 'y' * 200 + '\\model.pmd'
+    src = write(os.path.join(work, 'same.pmm'), HEADER + sjis(old) + TRAILER)
+    code, _ = ppm_parse.pmm_parse(src, work, os.path.join(work, 's1'), None, logs=[])
+    assert code == 0
+    assert read(src).startswith(HEADER + sjis(new) + b'\x00')
+    assert not [f for f in os.listdir(work) if f.startswith('working')]
+
+
+if __name__ == '__main__':
+    testrunner.run_tests(globals())
@@ -0,0 +1,21 @@
+# test/*-test.py のテストを実行する
+#   test_ で始まる関数に新しい作業フォルダを渡して順に実行し、OK/NG と集計を表示する
+
+import sys
+import tempfile
+
+
+def run_tests(namespace):
+    """namespace (テストのモジュールの globals()) のテストを実行し、失敗があれば終了コード1で終わる"""
+    tests = [(name, func) for name, func in namespace.items() if name.startswith('test_') and callable(func)]
+    failed = 0
+    for name, func in tests:
+        with tempfile.TemporaryDirectory() as work:
+            try:
+                func(work)
+                print(f"OK  {name}")
+            except Exception as e:
+                failed += 1
+                print(f"NG  {name}: {e!r}")
+    print(f"{len(tests) - failed}/{len(tests)} passed")
+    sys.exit(1 if failed else 0)
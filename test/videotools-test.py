@@ -0,0 +1,297 @@
+# videotools.py のテスト
+#   PYTHONPATH に lib を登録してから実行する:  python videotools-test.py
+
+import os
+import struct
+import time
+import videotools
+import testrunner
+
+
+def box(kind, data=b''):
+    return struct.pack('>I', 8 + len(data)) + kind + data
+
+
+def full_box(kind, version, data):
+    return box(kind, bytes([version, 0, 0, 0]) + data)
+
+
+def mp4(width, height, timescale, duration, frames, version=0, handler=b'vide', mdat_size=1000, moov_last=False):
+    if version == 1:
+        mdhd = full_box(b'mdhd', 1, struct.pack('>QQIQ', 0, 0, timescale, duration) + b'\x00' * 4)
+    else:
+        mdhd = full_box(b'mdhd', 0, struct.pack('>IIII', 0, 0, timescale, duration) + b'\x00' * 4)
+    hdlr = full_box(b'hdlr', 0, b'\x00' * 4 + handler + b'\x00' * 12 + b'\x00')
+    entry = box(b'avc1', b'\x00' * 6 + b'\x00\x01' + b'\x00' * 16 + struct.pack('>HH', width, height) + b'\x00' * 50)
+    stsd = full_box(b'stsd', 0, struct.pack('>I', 1) + entry)
+    stsz = full_box(b'stsz', 0, struct.pack('>II', 0, frames) + b'\x00\x00\x10\x00' * frames)
+    stbl = box(b'stbl', stsd + box(b'stts', b'\x00' * 16) + stsz)
+    sound = box(b'trak', box(b'mdia', full_box(b'hdlr', 0, b'\x00' * 4 + b'soun' + b'\x00' * 13)))
+    video = box(b'trak', box(b'tkhd', b'\x00' * 84) + box(b'mdia', mdhd + hdlr + box(b'minf', stbl)))
+    moov = box(b'moov', full_box(b'mvhd', 0, b'\x00' * 96) + sound + video)
+    ftyp = box(b'ftyp', b'isom\x00\x00\x02\x00isomavc1')
+    mdat = struct.pack('>I', 8 + mdat_size) + b'mdat'
+    return [ftyp, mdat, mdat_size, moov] if moov_last else [ftyp, moov, mdat, mdat_size]
+
+
+def write_parts(path, parts):
+    # 数値は mdat などの中身の長さ。書かずに飛ばす (スパースファイル)
+    with open(path, 'wb') as f:
+        for part in parts:
+            if isinstance(part, int):
+                f.seek(part, os.SEEK_CUR)
+            else:
+                f.write(part)
+        f.truncate()
+
+
+def ebml_size(size):
+    if size is None:
+        return b'\x01\xff\xff\xff\xff\xff\xff\xff'
+    return (0x10000000 | size).to_bytes(4, 'big')
+
+
+def element(element_id, data, size=-1):
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, 'big') + \
+        ebml_size(len(data) if size == -1 else size) + data
+
+
+def uint(element_id, value):
+    return element(element_id, value.to_bytes(4, 'big'))
+
+
+def matroska(width, height, duration_ms, frame_ns, frames=None, seek_head=False, unknown_size=False):
+    info = element(videotools.MKV_INFO, uint(videotools.MKV_TIMESTAMP_SCALE, 1000000) +
+                   element(videotools.MKV_DURATION, struct.pack('>d', duration_ms)))
+    video = element(videotools.MKV_VIDEO, uint(videotools.MKV_PIXEL_WIDTH, width) +
+                    uint(videotools.MKV_PIXEL_HEIGHT, height))
+    audio = element(videotools.MKV_TRACK_ENTRY, uint(videotools.MKV_TRACK_UID, 1) + uint(videotools.MKV_TRACK_TYPE, 2))
+    entry = uint(videotools.MKV_TRACK_UID, 2) + uint(videotools.MKV_TRACK_TYPE, 1) + video
+    if frame_ns:
+        entry += uint(videotools.MKV_DEFAULT_DURATION, frame_ns)
+    tracks = element(videotools.MKV_TRACKS, audio + element(videotools.MKV_TRACK_ENTRY, entry))
+    tags = b''
+    if frames is not None:
+        # mkvmerge が書く統計タグ
+        simple = element(videotools.MKV_SIMPLE_TAG, element(videotools.MKV_TAG_NAME, b'NUMBER_OF_FRAMES') +
+                         element(videotools.MKV_TAG_STRING, str(frames).encode()))
+        targets = element(videotools.MKV_TARGETS, uint(videotools.MKV_TAG_TRACK_UID, 2))
+        tags = element(videotools.MKV_TAGS, element(videotools.MKV_TAG, targets + simple))
+    cluster = element(videotools.MKV_CLUSTER, b'\x00' * 5000)
+    if seek_head:
+        # Tracks と Tags を Cluster の後ろに置き、SeekHead から位置を引く
+        def seek(element_id, position):
+            return element(videotools.MKV_SEEK, element(videotools.MKV_SEEK_ID, element_id.to_bytes(4, 'big')) +
+                           uint(videotools.MKV_SEEK_POSITION, position))
+        head_size = len(element(videotools.MKV_SEEK_HEAD, seek(0, 0) * 2))
+        tracks_position = head_size + len(info) + len(cluster)
+        head = element(videotools.MKV_SEEK_HEAD, seek(videotools.MKV_TRACKS, tracks_position) +
+                       seek(videotools.MKV_TAGS, tracks_position + len(tracks)))
+        body = head + info + cluster + tracks + tags
+    else:
+        body = info + tracks + tags + cluster
+    header = element(0x1A45DFA3, element(0x4282, b'webm'))
+    return header + element(videotools.MKV_SEGMENT, body, None if unknown_size else -1)
+
+
+def chunk(chunk_id, data):
+    return chunk_id + struct.pack('<I', len(data)) + data + b'\x00' * (len(data) & 1)
+
+
+def riff_list(list_type, data):
+    return chunk(b'LIST', list_type + data)
+
+
+def avi(width, height, scale, rate, length, total_frames=None):
+    avih = chunk(b'avih', struct.pack('<10I', 0, 0, 0, 0, length, 0, 2, 0, width, height) + b'\x00' * 16)
+    strh = chunk(b'strh', struct.pack('<4s4sIHHIIIII', b'vids', b'H264', 0, 0, 0, 0, scale, rate, 0, length) +
+                 b'\x00' * 20)
+    strf = chunk(b'strf', struct.pack('<Iii', 40, width, -height) + b'\x00' * 28)
+    auds = riff_list(b'strl', chunk(b'strh', struct.pack('<4s4s', b'auds', b'\x00' * 4) + b'\x00' * 48) +
+                     chunk(b'strf', b'\x00' * 17))
+    hdrl = avih + auds + riff_list(b'strl', strh + strf)
+    if total_frames is not None:
+        hdrl += riff_list(b'odml', chunk(b'dmlh', struct.pack('<I', total_frames) + b'\x00' * 244))
+    body = b'AVI ' + riff_list(b'hdrl', hdrl) + riff_list(b'movi', b'00dc' + b'\x00' * 1000)
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+
+class CountingFile:
+    # 読んだバイト数を数える
+    def __init__(self, f):
+        self.f = f
+        self.count = 0
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.count += len(data)
+        return data
+
+    def seek(self, pos, whence=os.SEEK_SET):
+        return self.f.seek(pos, whence)
+
+    def tell(self):
+        return self.f.tell()
+
+
+def ts(packet_size, count=4):
+    prefix = b'\x00' * (packet_size - 188)
+    return (prefix + b'\x47' + b'\x1f\xff\x10' + b'\xff' * 184) * count
+
+
+# コンテナのシグネチャは動画
+def test_video(work):
+    heads = [
+        box(b'ftyp', b'isom\x00\x00\x02\x00isomiso2avc1mp41') + box(b'free'),
+        box(b'ftyp', b'qt  \x00\x00\x02\x00qt  '),
+        box(b'ftyp', b'3gp5\x00\x00\x00\x00'),
+        box(b'mdat', b'\x00' * 16),
+        box(b'wide') + box(b'mdat'),
+        b'RIFF\x00\x10\x00\x00AVI LIST',
+        b'\x1a\x45\xdf\xa3\x9f\x42\x86\x81\x01webm',
+        b'FLV\x01\x05\x00\x00\x00\x09',
+        b'\x00\x00\x01\xba\x44\x00\x04\x00',
+        b'\x30\x26\xb2\x75\x8e\x66\xcf\x11\xa6\xd9\x00\xaa\x00\x62\xce\x6c',
+        ts(188)[:videotools.SNIFF_SIZE],
+        ts(192)[:videotools.SNIFF_SIZE],
+    ]
+    for head in heads:
+        assert videotools.classify(head) == videotools.VIDEO, head[:16]
+
+
+# 画像のシグネチャ (HEIF, AVIF を含む) は画像
+def test_image(work):
+    heads = [
+        b'\x89PNG\r\n\x1a\n\x00\x00\x00\x0dIHDR',
+        b'\xff\xd8\xff\xe0\x00\x10JFIF\x00',
+        b'GIF89a\x01\x00\x01\x00',
+        b'RIFF\x00\x10\x00\x00WEBPVP8 ',
+        b'II*\x00\x08\x00\x00\x00',
+        box(b'ftyp', b'heic\x00\x00\x00\x00mif1heic'),
+        box(b'ftyp', b'avif\x00\x00\x00\x00avifmif1'),
+    ]
+    for head in heads:
+        assert videotools.classify(head) == videotools.IMAGE, head[:16]
+
+
+# シグネチャで決められないものは None (Pillow や OpenCV に任せる)
+def test_unknown(work):
+    heads = [
+        b'',
+        b'hello, world\n' * 40,
+        b'RIFF\x00\x10\x00\x00WAVEfmt ',
+        b'ID3\x04\x00\x00\x00\x00\x00\x00',
+        b'G' + b'x' * 200,                 # 0x47 で始まるだけのテキスト
+        ts(188, count=2),                  # 2パケットでは MPEG-TS とみなさない
+        b'P6\n1 1\n255\n\x00\x00\x00',
+    ]
+    for head in heads:
+        assert videotools.classify(head) is None, head[:16]
+
+
+# ファイルは先頭だけを読む
+def test_sniff_kind(work):
+    path = os.path.join(work, 'movie.mp4')
+    with open(path, 'wb') as f:
+        f.write(box(b'ftyp', b'mp42\x00\x00\x00\x00mp42isom') + box(b'mdat', b'\x00' * 100000))
+    assert videotools.sniff_kind(path) == videotools.VIDEO
+    empty = os.path.join(work, 'empty')
+    open(empty, 'wb').close()
+    assert videotools.sniff_kind(empty) is None
+
+
+# MP4 は moov だけを読む。moov がファイルの最後にあっても先頭の数 KB だけを読む
+def test_mp4(work):
+    path = os.path.join(work, 'movie.mp4')
+    cases = [
+        (mp4(1920, 1080, 30000, 30000 * 10, 300), (1920, 1080, 30.0, 300, 10.0)),
+        (mp4(640, 360, 90000, 90000 * 2, 60, version=1), (640, 360, 30.0, 60, 2.0)),
+        (mp4(1280, 720, 600, 15015, 599, mdat_size=300 * 1024 * 1024, moov_last=True),
+         (1280, 720, 599 / (15015 / 600), 599, 15015 / 600)),
+    ]
+    for parts, expected in cases:
+        write_parts(path, parts)
+        assert videotools.read_video_info(path) == expected, videotools.read_video_info(path)
+        with open(path, 'rb') as f:
+            counter = CountingFile(f)
+            videotools.read_mp4(counter, os.path.getsize(path))
+        assert counter.count < 8192, counter.count
+
+    # 映像のトラックがない、フレーム数がない (フラグメント化された MP4) ものは None
+    for parts in (mp4(640, 360, 1000, 1000, 10, handler=b'soun'), mp4(640, 360, 1000, 0, 0)):
+        write_parts(path, parts)
+        assert videotools.read_video_info(path) is None
+
+
+# Matroska/WebM は Info, Tracks, Tags を読み、Cluster は読まない
+def test_matroska(work):
+    path = os.path.join(work, 'movie.mkv')
+    cases = [
+        (matroska(1920, 1080, 10000.0, 33366667, frames=299), (1920, 1080, 1e9 / 33366667, 299, 10.0)),
+        (matroska(1280, 720, 4000.0, 40000000), (1280, 720, 25.0, 100, 4.0)),
+        (matroska(640, 480, 2000.0, 0, frames=48, seek_head=True), (640, 480, 24.0, 48, 2.0)),
+        (matroska(640, 480, 2000.0, 40000000, unknown_size=True), (640, 480, 25.0, 50, 2.0)),
+    ]
+    for data, expected in cases:
+        with open(path, 'wb') as f:
+            f.write(data)
+        assert videotools.read_video_info(path) == expected, videotools.read_video_info(path)
+
+    # フレーム数も DefaultDuration もなければ分からない
+    with open(path, 'wb') as f:
+        f.write(matroska(640, 480, 2000.0, 0))
+    assert videotools.read_video_info(path) is None
+
+
+# AVI は hdrl を読む。OpenDML の dmlh があればファイル全体のフレーム数を使う
+def test_avi(work):
+    path = os.path.join(work, 'movie.avi')
+    cases = [
+        (avi(720, 480, 1001, 30000, 300), (720, 480, 30000 / 1001, 300, 300 * 1001 / 30000)),
+        (avi(1920, 1080, 1, 25, 1000, total_frames=250000), (1920, 1080, 25.0, 250000, 10000.0)),
+    ]
+    for data, expected in cases:
+        with open(path, 'wb') as f:
+            f.write(data)
+        assert videotools.read_video_info(path) == expected, videotools.read_video_info(path)
+
+
+# 読めない形式や壊れたファイルは None (OpenCV に任せる)
+def test_read_fallback(work):
+    path = os.path.join(work, 'movie')
+    for data in (b'FLV\x01\x05' + b'\x00' * 100, b'', mp4(640, 360, 1000, 1000, 10)[0] + b'\x00\x00\x01',
+                 matroska(640, 480, 2000.0, 40000000)[:60], avi(720, 480, 1001, 30000, 300)[:100]):
+        with open(path, 'wb') as f:
+            f.write(data)
+        assert videotools.read_video_info(path) is None, data[:16]
+
+
+def probe(path):
+    # scan_videos のテスト用。名前で止まる, 異常終了する, 例外を出すファイルをまねる
+    name = os.path.basename(path)
+    if name.startswith('hang'):
+        time.sleep(60)
+    if name.startswith('crash'):
+        os._exit(1)
+    if name.startswith('bad'):
+        raise ValueError(name)
+    return name.upper()
+
+
+# 複数のプロセスで調べ、止まったファイルは時間切れ、異常終了したファイルはエラーにして続ける
+def test_scan_videos(work):
+    names = [f"{kind}{k}" for k in range(6) for kind in ('ok', 'hang', 'ok', 'crash', 'bad')]
+    for ordered in (True, False):
+        t0 = time.monotonic()
+        results = list(videotools.scan_videos(names, probe, jobs=4, timeout=1, ordered=ordered))
+        assert time.monotonic() - t0 < 30
+        assert sorted(path for path, _ in results) == sorted(names)
+        if ordered:
+            assert [path for path, _ in results] == names
+        for path, result in results:
+            expected = {'ok': str, 'hang': TimeoutError, 'crash': RuntimeError, 'bad': ValueError}
+            assert isinstance(result, expected[path.rstrip('0123456789')]), (path, result)
+
+
+if __name__ == '__main__':
+    testrunner.run_tests(globals())
@@ -0,0 +1,306 @@
+# wavtools.py のテスト
+#   PYTHONPATH に lib を登録してから実行する:  python wavtools-test.py
+#   解析のテストには numpy が必要
+#   環境変数 WAVTOOLS_TEST_LARGE=1 のときは、4GBを超えるファイルを実際に書き出すテストも行う
+
+import io
+import os
+import struct
+import numpy as np
+import wavtools
+import testrunner
+
+RATE = 48000
+
+
+# サンプル (-1.0〜1.0、(サンプル数, チャンネル数)) を PCM/浮動小数点のWAVファイルに書き出す
+def write_wav(path, data, bits=16, float_data=False, big_endian=False):
+    channels = data.shape[1]
+    size = bits // 8
+    if float_data:
+        raw = data.astype(f'>f{size}' if big_endian else f'<f{size}').tobytes()
+    elif bits == 8:
+        raw = (data * 127 + 128).astype(np.uint8).tobytes()
+    else:
+        # 24ビットは32ビットの上位3バイトを使う
+        full = 4 if bits == 24 else size
+        ints = (data * (2 ** (bits - 1) - 1)).astype(np.int64) << ((full - size) * 8)
+        raw = ints.astype(f'<i{full}').view(np.uint8).reshape(-1, full)[:, full - size:].tobytes()
+        if big_endian:
+            raw = np.frombuffer(raw, np.uint8).reshape(-1, size)[:, ::-1].tobytes()
+    endian = '>' if big_endian else '<'
+    tag = wavtools.WAVE_FORMAT_IEEE_FLOAT if float_data else wavtools.WAVE_FORMAT_PCM
+    fmt = struct.pack(endian + 'HHIIHH', tag, channels, RATE, RATE * channels * size, channels * size, bits)
+    body = b'WAVE' + b'fmt ' + struct.pack(endian + 'I', len(fmt)) + fmt + b'data' + struct.pack(endian + 'I', len(raw)) + raw
+    with open(path, 'wb') as f:
+        f.write((b'RIFX' if big_endian else b'RIFF') + struct.pack(endian + 'I', len(body)) + body)
+    return path
+
+
+def tone(seconds, amplitude):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return amplitude * np.sin(2 * np.pi * 440 * t)
+
+
+# 無音 1秒, 音 0.5秒, 無音 0.2秒, 音 0.5秒, 無音 1秒, 小さい音 0.5秒, 無音 2秒
+def speech_like():
+    mono = np.concatenate([tone(1, 0), tone(0.5, 0.5), tone(0.2, 0), tone(0.5, 0.3),
+                           tone(1, 0), tone(0.5, 0.1), tone(2, 0)])
+    return np.stack([mono, mono * 0.5], axis=1)
+
+
+# 短い無音は区間をつながず、前後に余白を付ける
+EXPECTED = [(48000 - 2400, 105600 + 2400), (153600 - 2400, 177600 + 2400)]
+
+
+def test_regions(work):
+    src = write_wav(os.path.join(work, 'a.wav'), speech_like())
+    analysis = wavtools.analyze(src)
+    assert analysis.regions == EXPECTED, analysis.regions
+    assert abs(analysis.peak_db - 20 * np.log10(0.5)) < 0.01
+
+
+# ブロックの大きさによらず同じ結果になる (窓がブロックの境界をまたいでも変わらない)
+def test_block_size_does_not_change_result(work):
+    src = write_wav(os.path.join(work, 'a.wav'), speech_like())
+    base = wavtools.analyze(src)
+    for block_size in (1, 1000, 77777, 1 << 20):
+        analysis = wavtools.analyze(src, block_size=block_size)
+        assert analysis.regions == base.regions, block_size
+        assert abs(analysis.rms_db - base.rms_db) < 1e-9 and analysis.peak_db == base.peak_db
+
+
+# 形式 (8/16/24ビット、浮動小数点、RIFX) によらず同じ区間になる
+def test_formats(work):
+    data = speech_like()
+    cases = [dict(bits=8), dict(bits=16), dict(bits=24), dict(bits=24, big_endian=True),
+             dict(bits=32, float_data=True), dict(bits=64, float_data=True, big_endian=True)]
+    for k, kwargs in enumerate(cases):
+        src = write_wav(os.path.join(work, f'{k}.wav'), data, **kwargs)
+        assert wavtools.analyze(src).regions == EXPECTED, kwargs
+
+
+# 判定の条件 (しきい値、最小の無音、最小の音、ピーク) を変える
+def test_options(work):
+    src = write_wav(os.path.join(work, 'a.wav'), speech_like())
+    assert wavtools.analyze(src, threshold_db=-15).regions == [(48000 - 2400, 72000 + 2400)]
+    assert wavtools.analyze(src, min_silence_ms=150, pad_ms=0).regions == [(48000, 72000), (81600, 105600),
+                                                                          (153600, 177600)]
+    assert wavtools.analyze(src, min_silence_ms=2000, pad_ms=0).regions == [(48000, 177600)]
+    assert wavtools.analyze(src, min_sound_ms=600, min_silence_ms=150, pad_ms=0).regions == []
+    assert wavtools.analyze(src, threshold_db=0).regions == []
+    assert wavtools.analyze(src, level='peak', threshold_db=-6.5, pad_ms=0).regions == [(48000, 72000)]
+
+
+# 解析した区間をそのまま切り出せる
+def test_trim(work):
+    data = speech_like()
+    src = write_wav(os.path.join(work, 'a.wav'), data)
+    regions = wavtools.analyze(src).regions
+    out = os.path.join(work, 'trim.wav')
+    wavtools.cut(src, out, regions[0][0], regions[-1][1], unit='sample')
+    with open(out, 'rb') as f:
+        info = wavtools.read_wav_header(f)
+        f.seek(info.data_offset)
+        trimmed = wavtools.samples_to_array(f.read(info.data_size), info)
+    with open(src, 'rb') as f:
+        info = wavtools.read_wav_header(f)
+        f.seek(info.data_offset)
+        original = wavtools.samples_to_array(f.read(info.data_size), info)
+    assert np.array_equal(trimmed, original[regions[0][0]:regions[-1][1]])
+
+
+# パイプのようにシークできないストリーム
+class Pipe(io.RawIOBase):
+    def __init__(self, data=b''):
+        self.data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self.data.readinto(buffer)
+
+    def write(self, data):
+        return self.data.write(data)
+
+
+# 長さが分からないヘッダー (サイズが 0xFFFFFFFF) のストリーム
+def unknown_length(data):
+    i = data.index(b'data')
+    return data[:4] + b'\xff' * 4 + data[8:i + 4] + b'\xff' * 4 + data[i + 8:]
+
+
+# RF64 に書き直せるよう、WAVE の直後に JUNKチャンクで場所を空けたヘッダーにする
+def reserved(data):
+    riff_size = struct.unpack('<I', data[4:8])[0] + 36
+    return data[:4] + struct.pack('<I', riff_size) + data[8:12] + b'JUNK' + struct.pack('<I', 28) + b'\x00' * 28 + data[12:]
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def stream(data):
+    return io.BufferedReader(Pipe(data))
+
+
+# 標準入力・標準出力と同じく、シークできないストリームを先頭から順に処理する
+def test_stream(work):
+    src = write_wav(os.path.join(work, 'a.wav'), speech_like(), bits=24, big_endian=True)
+    data = read(src)
+    ref = os.path.join(work, 'ref.wav')
+
+    # 長さが分かる入力から、シークできる出力へ
+    wavtools.cut(src, ref, 500, 4000)
+    out = io.BytesIO()
+    wavtools.cut(stream(data), out, 500, 4000)
+    assert out.getvalue() == read(ref)
+
+    # 長さが分からない入力から、シークできる出力へ (最後にヘッダーを書き直す)
+    wavtools.cut(src, ref, 500)
+    out = io.BytesIO()
+    result = wavtools.cut(stream(unknown_length(data)), out, 500)
+    assert out.getvalue() == reserved(read(ref))
+    assert result.end_sample == 273600
+
+    # 長さが分からない入力から、シークできない出力へ (ヘッダーは 0xFFFFFFFF のまま)
+    pipe = Pipe()
+    dst = io.BufferedWriter(pipe)
+    wavtools.cut(stream(unknown_length(data)), dst, 500)
+    dst.flush()
+    assert pipe.data.getvalue() == unknown_length(read(ref))
+
+    # 無音の挿入と解析も、ファイルと同じ結果になる
+    wavtools.delay(src, ref, 300)
+    out = io.BytesIO()
+    wavtools.delay(stream(unknown_length(data)), out, 300)
+    assert out.getvalue() == reserved(read(ref))
+    assert wavtools.analyze(stream(unknown_length(data))).regions == EXPECTED
+
+    # 入力が開始位置より前で終わる
+    try:
+        wavtools.cut(stream(unknown_length(data)), io.BytesIO(), 10000)
+        assert False
+    except ValueError:
+        pass
+
+    # 長さが分からない入力は連結できない (TypeError ではなく ValueError)
+    try:
+        wavtools.concat([src, stream(unknown_length(data))], io.BytesIO())
+        assert False
+    except ValueError as e:
+        assert '長さが分からない' in str(e)
+
+
+# 4GBを超える (sparse な) ファイルを作る。末尾の tail サンプルだけ tail_data を書く
+def write_large(path, info, samples, tail_data):
+    header = wavtools.make_wav_header(info, samples)
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.truncate(len(header) + samples * info.block_align)
+        f.seek(len(header) + samples * info.block_align - len(tail_data))
+        f.write(tail_data)
+    return header
+
+
+def small_info(work):
+    src = write_wav(os.path.join(work, 'small.wav'), speech_like()[:4800])
+    with open(src, 'rb') as f:
+        return wavtools.read_wav_header(f)
+
+
+LARGE_SAMPLES = (1 << 30) + 12345  # 16ビットステレオで4GBを超える
+
+
+# 4GBに収まらないときだけ RF64 のヘッダーになり、ds64チャンクのサイズで読める
+def test_rf64_header(work):
+    info = small_info(work)
+    small = wavtools.make_wav_header(info, 4800)
+    assert small[:4] == b'RIFF' and b'ds64' not in small
+
+    large = wavtools.make_wav_header(info, LARGE_SAMPLES)
+    assert large[:4] == b'RF64' and large[12:16] == b'ds64'
+    riff_size, data_size, samples = struct.unpack('<QQQ', large[20:44])
+    assert data_size == LARGE_SAMPLES * 4 and samples == LARGE_SAMPLES
+    assert riff_size == len(large) - 8 + data_size
+
+    # RIFF の上限ちょうどで切り替わる
+    limit = (0xFFFFFFFF - (len(small) - 8)) // 4
+    assert wavtools.make_wav_header(info, limit)[:4] == b'RIFF'
+    assert wavtools.make_wav_header(info, limit + 1)[:4] == b'RF64'
+
+    # 場所を空けたヘッダーは、長さを変えずに RIFF/RF64 のどちらにも書き直せる
+    lengths = {len(wavtools.make_wav_header(info, n, reserve=True)) for n in (None, 0, 4800, LARGE_SAMPLES)}
+    assert lengths == {len(large)}
+
+    # シークできないストリームでも ds64チャンクのサイズを使う
+    parsed = wavtools.read_wav_header(stream(large + b'\x00' * 64))
+    assert parsed.data_size == LARGE_SAMPLES * 4 and parsed.data_offset == len(large)
+
+
+# 4GBを超える RF64 ファイルの末尾を切り出す (sparse なので実際には数バイトしか書かない)
+def test_rf64_cut(work):
+    info = small_info(work)
+    tail = bytes(range(256)) * 64
+    src = os.path.join(work, 'large.wav')
+    header = write_large(src, info, LARGE_SAMPLES, tail)
+    with open(src, 'rb') as f:
+        parsed = wavtools.read_wav_header(f)
+    assert parsed.data_offset == len(header) and parsed.total_samples == LARGE_SAMPLES
+
+    out = os.path.join(work, 'tail.wav')
+    result = wavtools.cut(src, out, LARGE_SAMPLES - len(tail) // 4, unit='sample')
+    assert result.end_sample == LARGE_SAMPLES
+    assert read(out) == wavtools.make_wav_header(info, len(tail) // 4) + tail
+
+
+# 先頭のバイト列に続けてファイルを読む、シークできないストリーム
+class Chain(io.RawIOBase):
+    def __init__(self, head, f):
+        self.head = io.BytesIO(head)
+        self.f = f
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self.head.readinto(buffer) or self.f.readinto(buffer)
+
+
+# 4GBを超える出力を書き出す (実際に4GB書き出すので、WAVTOOLS_TEST_LARGE=1 のときだけ)
+def test_rf64_write(work):
+    if os.environ.get('WAVTOOLS_TEST_LARGE') != '1':
+        return
+    info = small_info(work)
+    tail = bytes(range(256)) * 64
+    src = os.path.join(work, 'large.wav')
+    samples = (0xFFFFFFFF - 100) // 4
+    header = write_large(src, info, samples, tail)
+    assert header[:4] == b'RIFF'
+
+    # RIFF に収まる入力に無音を足すと RF64 になる
+    out = os.path.join(work, 'out.wav')
+    for unknown in (False, True):
+        with open(src, 'rb') as f:
+            if unknown:
+                # 長さが分からないストリームから書き出すと、最後に RF64 に書き直す
+                f.seek(len(header))
+                f = io.BufferedReader(Chain(unknown_length(header), f))
+            wavtools.delay(f, out, 1000)
+        with open(out, 'rb') as f:
+            assert f.read(4) == b'RF64'
+            f.seek(0)
+            parsed = wavtools.read_wav_header(f)
+            assert parsed.total_samples == samples + 48000
+            f.seek(parsed.data_offset + parsed.data_size - len(tail))
+            assert f.read() == tail
+        os.remove(out)
+
+
+if __name__ == '__main__':
+    testrunner.run_tests(globals())